@@ -1,11 +1,20 @@
 import argparse
 import asyncio
 import logging
+import time
 
 from dblp_crawler.keyword.arg import add_argument as add_argument_kw, parse_args as parse_args_kw
 from citation_crawler.arg import add_argument_pid, add_argument_aid, parse_args_pid_author
-from citation_crawler.crawlers import SemanticScholarCrawler
-from citation_crawler.summarizers import NetworkxSummarizer, Neo4jSummarizer
+from citation_crawler.crawlers import SemanticScholarCrawler, SemanticScholarDumpCrawler, OpenAlexCrawler, CompositeCrawler, Backend
+from citation_crawler.crawlers.composite import accept_semanticscholar, accept_dump, accept_openalex
+from citation_crawler.crawlers.common import shutdown_executor, flush_cache
+from citation_crawler.summarizers import NetworkxSummarizer, Neo4jSummarizer, SQLiteSummarizer, CitationMetricsSummarizer
+from citation_crawler.distributed import SQLiteWorkQueue, DistributedWorker
+from citation_crawler import metrics, profiling
+from citation_crawler.filter import YearKeywordFilter
+from citation_crawler.refresh import Refresher
+from citation_crawler.search import PathSearch
+from citation_crawler.init import stream_papers_in_neo4j
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger('citation_crawler')
@@ -17,6 +26,29 @@ parser.add_argument("-l", "--limit", type=int, help="Limitation of BFS depth.",
 add_argument_kw(parser)
 add_argument_pid(parser)
 add_argument_aid(parser)
+parser.add_argument("--metrics-port", type=int, default=None, help="Serve Prometheus-style metrics on this port.")
+parser.add_argument("--metrics-dump", type=str, default=None, help="Periodically dump metrics to this JSON file.")
+parser.add_argument("--metrics-interval", type=float, default=60, help="Interval of metrics dump, in seconds.")
+parser.add_argument("--queue", type=str, default=None,
+                    help="Path to a SQLite work queue shared by distributed workers, enables distributed mode.")
+parser.add_argument("--shard", type=int, default=0, help="Shard of this worker in distributed mode.")
+parser.add_argument("--shards", type=int, default=1, help="Total number of shards in distributed mode.")
+parser.add_argument("--steal", action="store_true", help="Take papers of other shards when this shard is empty.")
+parser.add_argument("--dump", type=str, default=None,
+                    help="Crawl offline from the index of Semantic Scholar dataset dumps in this directory, "
+                         "built by `python -m citation_crawler.crawlers.dump`.")
+parser.add_argument("--backend", action="append", choices=["ss", "dump", "openalex"], default=[],
+                    help="Crawl from several backends in order of preference (ss: Semantic Scholar API, dump: index specified by --dump, "
+                         "openalex: OpenAlex API), each call goes to the fastest healthy backend and fails over to the others.")
+parser.add_argument("--path", type=str, nargs=2, metavar=("SOURCE", "TARGET"), default=None,
+                    help="Search citation paths from SOURCE to TARGET (SOURCE cites ... cites TARGET) instead of BFS, "
+                         "-l limits the path length (default 6).")
+parser.add_argument("--citation-metrics", action="store_true",
+                    help="Compute citation counts and PageRank of the crawled papers, exported with the nodes or written to Neo4j. "
+                         "Install citation-crawler[metrics] for faster PageRank with SciPy.")
+parser.add_argument("--profile", type=str, default=None, help="Write a profiling report of each BFS level to this directory.")
+parser.add_argument("--profile-level", type=int, action="append", default=[],
+                    help="Capture cProfile stats of the specified BFS level, use with --profile.")
 
 
 def func_parser(parser):
@@ -32,10 +64,16 @@ def func_parser(parser):
     return year, keywords, pid_list, aid_list, limit
 
 
-async def filter_papers_at_crawler(papers, year, keywords):
-    async for paper in papers:
-        if (paper.year() is None or paper.year() >= year) and keywords.match(paper.title()):
-            yield paper
+def exporting_metrics(parser):
+    args = parser.parse_args()
+    logger.info(f"Specified metrics port and dump: {args.metrics_port} {args.metrics_dump}")
+    if args.profile:
+        logger.info(f"Specified profiling report dir: {args.profile}, cProfile levels: {args.profile_level}")
+        profiling.enable(args.profile, args.profile_level)
+    return metrics.exporting(args.metrics_port, args.metrics_dump, args.metrics_interval)
+
+
+filter_seconds = metrics.counter("crawler_filter_seconds_total", "Time spent filtering papers not filtered at decode time in Crawler.filter_papers.")
 
 
 async def bfs_to_end(graph, limit: int = 0):
@@ -44,6 +82,23 @@ async def bfs_to_end(graph, limit: int = 0):
         limit -= 1
 
 
+async def crawl_to_end(parser, crawler, limit: int = 0):
+    args = parser.parse_args()
+    async with exporting_metrics(parser):
+        if args.path:
+            logger.info(f"Specified path search: {args.path[0]} -> {args.path[1]}")
+            await PathSearch(crawler, *args.path, max_depth=limit if limit >= 0 else 6).run()
+        elif args.queue:
+            logger.info(f"Specified work queue: {args.queue}, shard {args.shard}/{args.shards}")
+            queue = SQLiteWorkQueue(args.queue, args.shards)
+            await DistributedWorker(crawler, queue, args.shard, steal=args.steal).run(limit)
+            queue.close()
+        else:
+            await bfs_to_end(crawler, limit)
+        await flush_cache()
+    shutdown_executor()
+
+
 subparsers = parser.add_subparsers(help='sub-command help')
 
 
@@ -51,14 +106,77 @@ subparsers = parser.add_subparsers(help='sub-command help')
 
 class DefaultSemanticScholarCrawler(SemanticScholarCrawler):
     def __init__(self, year, keywords, *args, **kwargs) -> None:
-        super().__init__(*args, **kwargs)
+        super().__init__(*args, prefilter=YearKeywordFilter(year, keywords), **kwargs)
         self.year = year
         self.keywords = keywords
 
     async def filter_papers(self, papers):
         """在收集信息时过滤`Paper`，不会对被此方法过滤掉的`Paper`进行信息收集"""
-        async for paper in filter_papers_at_crawler(papers, self.year, self.keywords):
-            yield paper
+        async for paper in papers:
+            matched = paper.prefiltered()  # 解码时已经用同样的条件过滤过了
+            if matched is None:
+                start = time.perf_counter()
+                matched = self.prefilter.match_paper(paper)
+                filter_seconds.inc(time.perf_counter() - start)
+            if matched:
+                yield paper
+
+
+class DefaultSemanticScholarDumpCrawler(DefaultSemanticScholarCrawler, SemanticScholarDumpCrawler):
+    pass
+
+
+class DefaultCompositeCrawler(CompositeCrawler):
+    def __init__(self, year, keywords, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.prefilter = YearKeywordFilter(year, keywords)
+
+    async def filter_papers(self, papers):
+        """在收集信息时过滤`Paper`，不会对被此方法过滤掉的`Paper`进行信息收集"""
+        async for paper in papers:
+            matched = paper.prefiltered()  # 各数据源解码时已经用同样的条件过滤过了
+            if matched is None:
+                start = time.perf_counter()
+                matched = self.prefilter.match_paper(paper)
+                filter_seconds.inc(time.perf_counter() - start)
+            if matched:
+                yield paper
+
+
+def new_backend(parser, name, year, keywords, aid_list, summarizer):
+    args = parser.parse_args()
+    if name == "dump":
+        if not args.dump:
+            parser.error("--backend dump requires --dump")
+        crawler = DefaultSemanticScholarDumpCrawler(year, keywords, aid_list, summarizer, [], dump=args.dump)
+        return Backend(name, crawler, accept_dump)
+    if name == "openalex":
+        return Backend(name, OpenAlexCrawler(summarizer, [], prefilter=YearKeywordFilter(year, keywords)), accept_openalex)
+    return Backend(name, DefaultSemanticScholarCrawler(year, keywords, aid_list, summarizer, []), accept_semanticscholar)
+
+
+def new_crawler(parser, year, keywords, aid_list, pid_list, summarizer):
+    args = parser.parse_args()
+    if args.backend:
+        logger.info(f"Specified backends: {args.backend}")
+        aid_lists = [aid_list] + [[]] * (len(args.backend) - 1)  # 只由第一个数据源获取作者的论文
+        return DefaultCompositeCrawler(
+            year, keywords,
+            [new_backend(parser, name, year, keywords, aids, summarizer) for name, aids in zip(args.backend, aid_lists)],
+            paperId_list=pid_list, summarizer=summarizer
+        )
+    if args.dump:
+        logger.info(f"Specified dump index: {args.dump}")
+        return DefaultSemanticScholarDumpCrawler(
+            year, keywords,
+            aid_list,
+            paperId_list=pid_list, summarizer=summarizer, dump=args.dump
+        )
+    return DefaultSemanticScholarCrawler(
+        year, keywords,
+        aid_list,
+        paperId_list=pid_list, summarizer=summarizer
+    )
 
 
 # --------- for NetworkxGraph ---------
@@ -81,12 +199,18 @@ async def func_parser_nx_async(parser):
     dest = args.dest
     logger.info(f"Specified dest: {dest}")
     summarizer = DefaultNetworkxSummarizer()
-    crawler = DefaultSemanticScholarCrawler(
-        year, keywords,
-        aid_list,
-        paperId_list=pid_list, summarizer=summarizer
-    )
-    await bfs_to_end(crawler, limit)
+    if args.citation_metrics:
+        summarizer = CitationMetricsSummarizer(summarizer)
+    if args.queue:  # 分布式模式下各worker先写入共享的SQLite，最后由shard 0合并输出
+        results = SQLiteSummarizer(args.queue)
+        crawler = new_crawler(parser, year, keywords, aid_list, pid_list, results)
+        await crawl_to_end(parser, crawler, limit)
+        if args.shard != 0:
+            return
+        await results.merge(summarizer)
+    else:
+        crawler = new_crawler(parser, year, keywords, aid_list, pid_list, summarizer)
+        await crawl_to_end(parser, crawler, limit)
     await summarizer.save(dest)
 
 
@@ -114,6 +238,12 @@ parser_n4j.add_argument("--password", type=str, default=None, help=f'Auth passwo
 parser_n4j.add_argument("--uri", type=str, required=True, help=f'URI to neo4j database.')
 parser_n4j.add_argument("--no-skip-exists", action="store_true",
                         help=f'Do not skip exists references. Use it when you want to rewrite all papers.')
+parser_n4j.add_argument("--prewarm", action="store_true",
+                        help=f'Read all written references and author links from the database at startup, so writing them again is skipped without queries.')
+parser_n4j.add_argument("--refresh", action="store_true",
+                        help=f'Incrementally refresh papers in the database: only fetch expired citation lists and write new citations.')
+parser_n4j.add_argument("--refresh-depth", type=int, default=1,
+                        help=f'BFS depth to expand new papers found by --refresh.')
 
 
 async def func_parser_n4j_async(parser):
@@ -124,12 +254,26 @@ async def func_parser_n4j_async(parser):
     async with AsyncGraphDatabase.driver(args.uri, auth=(args.username, args.password)) as driver:
         async with driver.session() as session:
             summarizer = DefaultNeo4jSummarizer(session, not args.no_skip_exists)
-            crawler = DefaultSemanticScholarCrawler(
-                year, keywords,
-                aid_list,
-                paperId_list=pid_list, summarizer=summarizer
-            )
-            await bfs_to_end(crawler, limit)
+            if args.prewarm:
+                await summarizer.prewarm()
+            if args.citation_metrics:
+                summarizer = CitationMetricsSummarizer(summarizer)
+            crawler = new_crawler(parser, year, keywords, aid_list, pid_list, summarizer)
+            if args.refresh:
+                await refresh_to_end(parser, crawler, pid_list + [stream_papers_in_neo4j(args.uri, (args.username, args.password))])
+            else:
+                await crawl_to_end(parser, crawler, limit)
+            if args.citation_metrics:
+                await summarizer.write_metrics()
+
+
+async def refresh_to_end(parser, crawler, paperId_list):
+    args = parser.parse_args()
+    logger.info(f"Specified refresh depth: {args.refresh_depth}")
+    async with exporting_metrics(parser):
+        await Refresher(crawler, paperId_list, args.refresh_depth).run()
+        await flush_cache()
+    shutdown_executor()
 
 
 def func_parser_n4j(parser):
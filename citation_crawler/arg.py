@@ -26,7 +26,7 @@ def parse_args_pid_author(parser: argparse.ArgumentParser, pid_dest: str = 'pid'
     for pid_s in args.__getattribute__(pid_dest):
         try:
             pid = eval(pid_s)
-            if isinstance(pid, str):
+            if isinstance(pid, str) or hasattr(pid, '__aiter__'):  # 异步生成器在爬取时边读边用
                 pid_list.append(pid)
             else:
                 pid_list.extend(pid)
@@ -36,7 +36,7 @@ def parse_args_pid_author(parser: argparse.ArgumentParser, pid_dest: str = 'pid'
     for aid_s in args.__getattribute__(aid_dest):
         try:
             aid = eval(aid_s)
-            if isinstance(aid, str):
+            if isinstance(aid, str) or hasattr(aid, '__aiter__'):
                 aid_list.append(aid)
             else:
                 aid_list.extend(aid)
@@ -0,0 +1,3 @@
+from .graph import SyntheticGraph
+from .server import MockSemanticScholar
+from .runner import run_benchmark
@@ -0,0 +1,41 @@
+import argparse
+import json
+import logging
+import os
+
+from .runner import run_benchmark
+
+parser = argparse.ArgumentParser(description="Crawl a local mock Semantic Scholar server and report performance.")
+parser.add_argument("--size", type=int, default=2000, help="Number of papers in the synthetic graph.")
+parser.add_argument("--degree", type=int, default=10, help="Mean number of references per paper.")
+parser.add_argument("--distribution", type=str, choices=["powerlaw", "uniform"], default="powerlaw",
+                    help="Degree distribution of the synthetic graph.")
+parser.add_argument("--latency", type=float, default=0.01, help="Mean latency of each mock request, in seconds.")
+parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of mock requests answered with 429.")
+parser.add_argument("--seed", type=int, default=0, help="Random seed of the synthetic graph and the mock server.")
+parser.add_argument("--seeds", type=int, default=4, help="Number of most cited papers to start crawling.")
+parser.add_argument("-y", "--year", type=int, default=2000, help="Only crawl the paper after the specified year.")
+parser.add_argument("-k", "--keyword", action="append", default=[], help="Specify keyword rules.")
+parser.add_argument("-l", "--limit", type=int, default=2, help="Limitation of BFS depth.")
+parser.add_argument("--summarizer", action="append", choices=["networkx", "neo4j"], default=[],
+                    help="Summarizers to benchmark, default all.")
+parser.add_argument("--scenario", action="append", choices=["cold", "warm"], default=[],
+                    help="Cache scenarios to benchmark, default cold then warm.")
+parser.add_argument("--backend", action="append", choices=["ss", "openalex"], default=[],
+                    help="Backends in order of preference, more than one crawls through a CompositeCrawler, default ss.")
+parser.add_argument("--workers", type=int, default=1,
+                    help="Number of distributed worker processes sharing a SQLite work queue.")
+parser.add_argument("--cache", type=str, default=os.path.join("save", "bench"), help="Cache directory for the crawler.")
+parser.add_argument("--profile", type=str, default=None, help="Write per-level profiling reports to this directory.")
+parser.add_argument("--output", type=str, default=None, help="Path to write JSON results, default stdout.")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    args = parser.parse_args()
+    report = run_benchmark(args)
+    if args.output:
+        with open(args.output, 'w', encoding="utf8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,130 @@
+import gzip
+import hashlib
+import json
+import os
+import random
+from typing import Dict, List
+
+'''Synthetic citation graph served by the mock Semantic Scholar server'''
+
+words = [
+    "video", "edge", "computing", "neural", "network", "streaming", "adaptive", "learning",
+    "distributed", "caching", "resolution", "super", "graph", "attention", "mobile", "energy",
+    "efficient", "scheduling", "federated", "compression", "analytics", "inference", "robust",
+    "transformer", "wireless", "system", "optimization", "detection", "semantic", "scalable",
+]
+
+
+def make_id(kind: str, i: int) -> str:
+    return hashlib.sha1(f"{kind}{i}".encode("utf8")).hexdigest()
+
+
+class SyntheticGraph:
+    def __init__(self, size: int = 1000, degree: int = 10, distribution: str = "powerlaw",
+                 authors_per_paper: int = 3, seed: int = 0) -> None:
+        rand = random.Random(seed)
+        self.papers: List[Dict] = []
+        self.index: Dict[str, int] = {}
+        self.doi_index: Dict[str, int] = {}
+        self.references: List[List[int]] = [[] for _ in range(size)]
+        self.citations: List[List[int]] = [[] for _ in range(size)]
+        self.authors: List[Dict] = []
+        self.author_papers: Dict[str, List[int]] = {}
+
+        for i in range(max(1, size // authors_per_paper)):
+            authorId = str(1000000 + i)
+            self.authors.append({
+                "authorId": authorId,
+                "name": f"Author {i}",
+                "externalIds": {"DBLP": [f"Author {i}"]},
+                "affiliations": [],
+                "homepage": None,
+            })
+            self.author_papers[authorId] = []
+
+        for i in range(size):
+            paperId = make_id("paper", i)
+            year = 2000 + rand.randrange(24)
+            paper = {
+                "paperId": paperId,
+                "title": " ".join(rand.choice(words) for _ in range(rand.randrange(4, 10))) + f" {i}",
+                "abstract": " ".join(rand.choice(words) for _ in range(32)),
+                "year": year,
+                "publicationDate": f"{year}-{rand.randrange(1, 13):02d}-{rand.randrange(1, 29):02d}",
+                "externalIds": {"DOI": f"10.0000/synthetic.{i}", "DBLP": f"journals/synthetic/{i}"},
+                "publicationTypes": ["JournalArticle"],
+                "journal": {"name": "Synthetic Journal"},
+                "authors": [],
+            }
+            for author in rand.sample(self.authors, min(len(self.authors), rand.randrange(1, authors_per_paper + 2))):
+                paper["authors"].append(author)
+                self.author_papers[author["authorId"]].append(i)
+            self.index[paperId] = i
+            self.doi_index[paper["externalIds"]["DOI"].lower()] = i
+            self.papers.append(paper)
+
+        # 新论文引用旧论文；powerlaw模式下按被引次数优先连接
+        targets: List[int] = []
+        for i in range(1, size):
+            if distribution == "powerlaw":
+                out_degree = min(i, int(rand.paretovariate(2.0) * degree / 2))
+            else:
+                out_degree = min(i, rand.randrange(degree * 2 + 1))
+            refs = set()
+            while len(refs) < out_degree:
+                if distribution == "powerlaw" and targets and rand.random() < 0.8:
+                    refs.add(rand.choice(targets))
+                else:
+                    refs.add(rand.randrange(i))
+            for j in refs:
+                self.references[i].append(j)
+                self.citations[j].append(i)
+                targets.append(j)
+
+    def __len__(self) -> int:
+        return len(self.papers)
+
+    def get(self, paperId: str) -> Dict:
+        paperId = paperId.lower()
+        if paperId.startswith("doi:") and paperId[4:] in self.doi_index:
+            return self.papers[self.doi_index[paperId[4:]]]
+        if paperId in self.index:
+            return self.papers[self.index[paperId]]
+        return None
+
+    def most_cited(self, n: int) -> List[str]:
+        order = sorted(range(len(self.papers)), key=lambda i: len(self.citations[i]), reverse=True)
+        return [self.papers[i]["paperId"] for i in order[:n]]
+
+    def write_dump(self, path: str, files: int = 2) -> None:
+        """写成Semantic Scholar数据集格式的papers、citations和authors JSONL.gz文件，用于测试crawlers.dump"""
+        def write(dataset, records):
+            os.makedirs(os.path.join(path, dataset), exist_ok=True)
+            outs = [gzip.open(os.path.join(path, dataset, f"{dataset}-part{i}.jsonl.gz"), 'wt', encoding="utf8") for i in range(files)]
+            for i, record in enumerate(records):
+                outs[i % files].write(json.dumps(record) + "\n")
+            for out in outs:
+                out.close()
+
+        write("papers", ({
+            "corpusid": i + 1,
+            "externalids": {**paper["externalIds"], "CorpusId": str(i + 1)},
+            "url": f"https://www.semanticscholar.org/paper/{paper['paperId']}",
+            "title": paper["title"],
+            "authors": [{"authorId": a["authorId"], "name": a["name"]} for a in paper["authors"]],
+            "year": paper["year"],
+            "publicationdate": paper["publicationDate"],
+            "publicationtypes": paper["publicationTypes"],
+            "journal": paper["journal"],
+        } for i, paper in enumerate(self.papers)))
+        write("citations", ({
+            "citingcorpusid": i + 1,
+            "citedcorpusid": j + 1,
+            "isinfluential": False,
+        } for i, refs in enumerate(self.references) for j in refs))
+        write("authors", ({
+            "authorid": author["authorId"],
+            "externalids": author["externalIds"],
+            "name": author["name"],
+            "homepage": author["homepage"],
+        } for author in self.authors))
@@ -0,0 +1,30 @@
+from collections import Counter
+
+'''In-memory stand-in for neo4j.AsyncSession, counts queries instead of running them'''
+
+
+class FakeResult:
+    async def values(self):
+        return []
+
+
+class FakeTransaction:
+    def __init__(self, stats: Counter) -> None:
+        self.stats = stats
+
+    async def run(self, query: str, *args, **kwargs) -> FakeResult:
+        self.stats["queries"] += 1
+        return FakeResult()
+
+
+class FakeAsyncSession:
+    def __init__(self) -> None:
+        self.stats = Counter()
+
+    async def execute_write(self, func, *args, **kwargs):
+        self.stats["writes"] += 1
+        return await func(FakeTransaction(self.stats), *args, **kwargs)
+
+    async def execute_read(self, func, *args, **kwargs):
+        self.stats["reads"] += 1
+        return await func(FakeTransaction(self.stats), *args, **kwargs)
@@ -0,0 +1,273 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import queue as queue_module
+import resource
+import shutil
+import socket
+import time
+import urllib.request
+from typing import Dict, List, Optional
+
+from .server import serve
+
+logger = logging.getLogger('bench')
+
+
+def get_free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def get_stats(api_root: str) -> Dict:
+    with urllib.request.urlopen(f"{api_root}/_stats") as response:
+        return json.loads(response.read())
+
+
+def wait_server(api_root: str, timeout: float = 120) -> None:
+    deadline = time.time() + timeout
+    while True:
+        try:
+            get_stats(api_root)
+            return
+        except Exception:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.2)
+
+
+async def crawl(summarizer_name: str, seeds: List[str], year: int, rules: List[str], limit: int, backends: List[str],
+                queue_path: Optional[str] = None, shard: int = 0, shards: int = 1) -> Dict:
+    from dblp_crawler.keyword import Keywords
+    from citation_crawler import metrics
+    from citation_crawler.crawlers import SemanticScholarCrawler, OpenAlexCrawler, CompositeCrawler, Backend
+    from citation_crawler.crawlers.composite import accept_semanticscholar, accept_openalex
+    from citation_crawler.filter import YearKeywordFilter
+    from citation_crawler.summarizers import NetworkxSummarizer, Neo4jSummarizer, SQLiteSummarizer
+    from citation_crawler.distributed import SQLiteWorkQueue, DistributedWorker
+    from .neo4j import FakeAsyncSession
+
+    keywords = Keywords()
+    for rule in rules:
+        keywords.add_rule(*[c for c in rule.split(" ") if len(c) > 0])
+    written = {"papers": 0, "references": 0}
+
+    class BenchCrawler(SemanticScholarCrawler):
+        async def filter_papers(self, papers):
+            async for paper in papers:
+                matched = paper.prefiltered()
+                if matched is None:
+                    matched = self.prefilter.match_paper(paper)
+                if matched:
+                    yield paper
+
+    class BenchCompositeCrawler(CompositeCrawler):
+        async def filter_papers(self, papers):
+            async for paper in papers:
+                matched = paper.prefiltered()
+                if matched is None:
+                    matched = prefilter.match_paper(paper)
+                if matched:
+                    yield paper
+
+    class BenchNetworkxSummarizer(NetworkxSummarizer):
+        async def filter_papers(self, papers):
+            async for paper in papers:
+                yield paper
+
+        async def write_paper(self, paper) -> None:
+            written["papers"] += 1
+            await super().write_paper(paper)
+
+        async def write_references(self, references) -> None:
+            written["references"] += len(references)
+            await super().write_references(references)
+
+    class BenchNeo4jSummarizer(Neo4jSummarizer):
+        async def filter_papers(self, papers):
+            async for paper in papers:
+                yield paper
+
+        async def write_paper(self, paper) -> None:
+            written["papers"] += 1
+            await super().write_paper(paper)
+
+        async def write_references(self, references) -> None:
+            written["references"] += len(references)
+            await super().write_references(references)
+
+    class BenchSQLiteSummarizer(SQLiteSummarizer):
+        async def filter_papers(self, papers):
+            async for paper in papers:
+                yield paper
+
+        async def write_paper(self, paper) -> None:
+            written["papers"] += 1
+            await super().write_paper(paper)
+
+        async def write_references(self, references) -> None:
+            written["references"] += len(references)
+            await super().write_references(references)
+
+    session = None
+    if summarizer_name == "neo4j":
+        session = FakeAsyncSession()
+        summarizer = BenchNeo4jSummarizer(session)
+    elif queue_path is not None:
+        summarizer = BenchSQLiteSummarizer(queue_path)
+    else:
+        summarizer = BenchNetworkxSummarizer()
+    prefilter = YearKeywordFilter(year, keywords)
+    if backends == ["ss"]:
+        crawler = BenchCrawler([], paperId_list=seeds, summarizer=summarizer, prefilter=prefilter)
+    else:
+        crawler = BenchCompositeCrawler([
+            Backend("ss", BenchCrawler([], summarizer, [], prefilter=prefilter), accept_semanticscholar)
+            if backend == "ss" else
+            Backend("openalex", OpenAlexCrawler(summarizer, [], prefilter=prefilter), accept_openalex)
+            for backend in backends
+        ], paperId_list=seeds, summarizer=summarizer)
+
+    levels = []
+    start = time.perf_counter()
+    if queue_path is not None:
+        worker = DistributedWorker(crawler, SQLiteWorkQueue(queue_path, shards), shard, poll=0.1)
+        await worker.run(limit)
+        if summarizer_name != "neo4j" and shard == 0:
+            class MergedNetworkxSummarizer(NetworkxSummarizer):
+                async def filter_papers(self, papers):
+                    async for paper in papers:
+                        yield paper
+            merged = MergedNetworkxSummarizer()
+            await summarizer.merge(merged)
+            written["merged_nodes"] = merged.graph.number_of_nodes()
+            written["merged_edges"] = merged.graph.number_of_edges()
+        papers_known = worker.total
+    else:
+        while True:
+            level_start = time.perf_counter()
+            news = await crawler.bfs_once()
+            levels.append({"level": len(levels), "seconds": time.perf_counter() - level_start, "news": news})
+            if news <= 0 or limit == 0:
+                break
+            limit -= 1
+        papers_known = len(crawler.papers)
+    result = {
+        "seconds": time.perf_counter() - start,
+        "levels": levels,
+        "papers_known": papers_known,
+        "papers_written": written["papers"],
+        "references_written": written["references"],
+        **{k: v for k, v in written.items() if k.startswith("merged_")},
+    }
+    if session is not None:
+        result["neo4j"] = dict(session.stats)
+    result["metrics"] = metrics.registry.to_dict()
+    return result
+
+
+def run_scenario(api_root: str, cache_root: str, profile: Optional[str], queue, *args) -> None:
+    logging.basicConfig(level=logging.WARNING)
+    if profile:
+        from citation_crawler import profiling
+        profiling.enable(profile)
+    from citation_crawler.crawlers import common, ss, openalex
+    common.cache_root = cache_root
+    ss.api_root = api_root
+    openalex.api_root = f"{api_root}/openalex"
+    result = asyncio.get_event_loop().run_until_complete(crawl(*args))
+    asyncio.get_event_loop().run_until_complete(common.flush_cache())
+    common.shutdown_executor()
+    result["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put(result)
+
+
+def run_processes(ctx, args_list: List[tuple]) -> List[Dict]:
+    queue = ctx.Queue()
+    processes = [ctx.Process(target=run_scenario, args=(*args[:3], queue, *args[3:])) for args in args_list]
+    for process in processes:
+        process.start()
+    results = []
+    while len(results) < len(processes):
+        try:
+            results.append(queue.get(timeout=1))
+        except queue_module.Empty:
+            for process in processes:
+                if not process.is_alive() and process.exitcode != 0:
+                    raise RuntimeError(f"Benchmark process exited with code {process.exitcode}")
+    for process in processes:
+        process.join()
+    return results
+
+
+def merge_results(results: List[Dict]) -> Dict:
+    """多个worker的结果合并成一个"""
+    if len(results) == 1:
+        return results[0]
+    return {
+        "seconds": max(r["seconds"] for r in results),
+        "levels": [],
+        "papers_known": sum(r["papers_known"] for r in results),
+        "papers_written": sum(r["papers_written"] for r in results),
+        "references_written": sum(r["references_written"] for r in results),
+        "peak_rss_kb": max(r["peak_rss_kb"] for r in results),
+        "workers": results,
+    }
+
+
+def run_benchmark(args) -> Dict:
+    from .graph import SyntheticGraph
+    ctx = multiprocessing.get_context("spawn")
+    port = get_free_port()
+    api_root = f"http://127.0.0.1:{port}"
+    graph_kwargs = dict(size=args.size, degree=args.degree, distribution=args.distribution)
+    graph = SyntheticGraph(seed=args.seed, **graph_kwargs)
+    seeds = graph.most_cited(args.seeds)
+    backends = args.backend or ["ss"]
+    if "ss" not in backends:  # OpenAlex只接受W...和DOI
+        seeds = ["DOI:" + graph.get(paperId)["externalIds"]["DOI"] for paperId in seeds]
+    server = ctx.Process(target=serve, args=("127.0.0.1", port, graph_kwargs, args.latency, args.rate_429, args.seed),
+                         daemon=True)
+    server.start()
+    results = []
+    try:
+        wait_server(api_root)
+        for summarizer_name in args.summarizer or ["networkx", "neo4j"]:
+            cache_root = os.path.join(args.cache, summarizer_name)
+            for scenario in args.scenario or ["cold", "warm"]:
+                if scenario == "cold":
+                    shutil.rmtree(cache_root, ignore_errors=True)
+                logger.info(f"Running {summarizer_name} {scenario} with {args.workers} workers")
+                profile = os.path.join(args.profile, f"{summarizer_name}-{scenario}") if args.profile else None
+                crawl_args = (summarizer_name, seeds, args.year, args.keyword, args.limit, backends)
+                before = get_stats(api_root)
+                if args.workers > 1:
+                    queue_path = os.path.join(args.cache, f"{summarizer_name}-{scenario}.queue.sqlite3")
+                    for suffix in ["", "-wal", "-shm"]:
+                        if os.path.exists(queue_path + suffix):
+                            os.remove(queue_path + suffix)
+                    result = merge_results(run_processes(ctx, [
+                        (api_root, cache_root, profile, *crawl_args, queue_path, shard, args.workers)
+                        for shard in range(args.workers)]))
+                else:
+                    result = merge_results(run_processes(ctx, [(api_root, cache_root, profile, *crawl_args)]))
+                after = get_stats(api_root)
+                requests = {k: v - before.get(k, 0) for k, v in after.items() if v - before.get(k, 0) > 0}
+                seconds = result["seconds"]
+                results.append({
+                    "summarizer": summarizer_name,
+                    "scenario": scenario,
+                    "workers": args.workers,
+                    **result,
+                    "requests": requests,
+                    "papers_per_s": result["papers_written"] / seconds if seconds > 0 else None,
+                    "requests_per_s": requests.get("requests", 0) / seconds if seconds > 0 else None,
+                })
+    finally:
+        server.terminate()
+        server.join()
+    return {"config": vars(args), "seeds": seeds, "results": results}
+
@@ -0,0 +1,256 @@
+import asyncio
+import json
+import random
+from collections import Counter
+from typing import Dict, List, Optional
+
+from aiohttp import web
+
+from .graph import SyntheticGraph
+
+'''Mock Semantic Scholar Graph API serving a SyntheticGraph'''
+
+
+def select_fields(data: Dict, fields: Optional[str]) -> Dict:
+    if not fields:
+        return {"paperId": data["paperId"], "title": data["title"]}
+    d = {"paperId": data["paperId"]}
+    sub = {}
+    for field in fields.split(","):
+        if "." in field:
+            field, subfield = field.split(".", 1)
+            sub.setdefault(field, []).append(subfield)
+        elif field in data:
+            d[field] = data[field]
+    for field, subfields in sub.items():
+        if field == "authors":
+            d["authors"] = [{"authorId": a["authorId"], "name": a["name"],
+                             **{f: a[f] for f in subfields if f in a}} for a in data["authors"]]
+    if "authors" in d and "authors" not in sub:
+        d["authors"] = [{"authorId": a["authorId"], "name": a["name"]} for a in d["authors"]]
+    return d
+
+
+def page(request: web.Request, items: List) -> Dict:
+    offset = int(request.query.get("offset", 0))
+    limit = int(request.query.get("limit", 100))
+    data = {"offset": offset, "data": items[offset:offset + limit]}
+    if offset + limit < len(items):
+        data["next"] = offset + limit
+    return data
+
+
+class MockSemanticScholar:
+    def __init__(self, graph: SyntheticGraph, latency: float = 0.0, rate_429: float = 0.0, seed: int = 0) -> None:
+        self.graph = graph
+        self.latency = latency
+        self.rate_429 = rate_429
+        self.random = random.Random(seed)
+        self.stats: Counter = Counter()
+
+    async def throttle(self, endpoint: str) -> Optional[web.Response]:
+        self.stats["requests"] += 1
+        self.stats[endpoint] += 1
+        if self.latency > 0:
+            await asyncio.sleep(self.random.uniform(self.latency / 2, self.latency * 3 / 2))
+        if self.random.random() < self.rate_429:
+            self.stats["429"] += 1
+            return web.json_response({"message": "Too Many Requests"}, status=429)
+        return None
+
+    def not_found(self) -> web.Response:
+        self.stats["404"] += 1
+        return web.json_response({"error": "Paper not found"}, status=404)
+
+    async def paper(self, request: web.Request) -> web.Response:
+        response = await self.throttle("paper")
+        if response:
+            return response
+        data = self.graph.get(request.match_info["paperId"])
+        if data is None:
+            return self.not_found()
+        return web.json_response(select_fields(data, request.query.get("fields")))
+
+    async def references(self, request: web.Request) -> web.Response:
+        response = await self.throttle("references")
+        if response:
+            return response
+        data = self.graph.get(request.match_info["paperId"])
+        if data is None:
+            return self.not_found()
+        fields = request.query.get("fields")
+        items = [{"citedPaper": select_fields(self.graph.papers[i], fields)}
+                 for i in self.graph.references[self.graph.index[data["paperId"]]]]
+        return web.json_response(page(request, items))
+
+    async def citations(self, request: web.Request) -> web.Response:
+        response = await self.throttle("citations")
+        if response:
+            return response
+        data = self.graph.get(request.match_info["paperId"])
+        if data is None:
+            return self.not_found()
+        fields = request.query.get("fields")
+        items = [{"citingPaper": select_fields(self.graph.papers[i], fields)}
+                 for i in self.graph.citations[self.graph.index[data["paperId"]]]]
+        return web.json_response(page(request, items))
+
+    async def authors(self, request: web.Request) -> web.Response:
+        response = await self.throttle("authors")
+        if response:
+            return response
+        data = self.graph.get(request.match_info["paperId"])
+        if data is None:
+            return self.not_found()
+        return web.json_response(page(request, data["authors"]))
+
+    async def author_papers(self, request: web.Request) -> web.Response:
+        response = await self.throttle("author_papers")
+        if response:
+            return response
+        authorId = request.match_info["authorId"]
+        if authorId not in self.graph.author_papers:
+            return web.json_response({"error": "Author not found"}, status=404)
+        fields = request.query.get("fields")
+        items = [select_fields(self.graph.papers[i], fields) for i in self.graph.author_papers[authorId]]
+        return web.json_response(page(request, items))
+
+    async def author_batch(self, request: web.Request) -> web.Response:
+        response = await self.throttle("author_batch")
+        if response:
+            return response
+        body = await request.json()
+        authors = {a["authorId"]: a for a in self.graph.authors}
+        return web.json_response([authors.get(authorId) for authorId in body.get("ids", [])])
+
+    async def paper_batch(self, request: web.Request) -> web.Response:
+        response = await self.throttle("paper_batch")
+        if response:
+            return response
+        body = await request.json()
+        fields = request.query.get("fields")
+        results = []
+        for paperId in body.get("ids", []):
+            data = self.graph.get(paperId)
+            results.append(select_fields(data, fields) if data is not None else None)
+        return web.json_response(results)
+
+    async def get_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(dict(self.stats))
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.add_routes([
+            web.get("/_stats", self.get_stats),
+            web.get("/paper/{paperId}/references", self.references),
+            web.get("/paper/{paperId}/citations", self.citations),
+            web.get("/paper/{paperId}/authors", self.authors),
+            web.get("/paper/{paperId}", self.paper),
+            web.get("/author/{authorId}/papers", self.author_papers),
+            web.post("/author/batch", self.author_batch),
+            web.post("/paper/batch", self.paper_batch),
+        ])
+        return app
+
+
+def to_work(graph: SyntheticGraph, i: int) -> Dict:
+    """SyntheticGraph中的论文转成OpenAlex的work格式，work id为W{i+1}"""
+    data = graph.papers[i]
+    abstract: Dict[str, List[int]] = {}
+    for position, word in enumerate(data["abstract"].split(" ")):
+        abstract.setdefault(word, []).append(position)
+    return {
+        "id": f"https://openalex.org/W{i + 1}",
+        "doi": f"https://doi.org/{data['externalIds']['DOI']}",
+        "title": data["title"],
+        "publication_year": data["year"],
+        "publication_date": data["publicationDate"],
+        "authorships": [{"author": {"id": f"https://openalex.org/A{a['authorId']}", "display_name": a["name"]}} for a in data["authors"]],
+        "referenced_works": [f"https://openalex.org/W{j + 1}" for j in graph.references[i]],
+        "abstract_inverted_index": abstract,
+    }
+
+
+def select_work(work: Dict, select: Optional[str]) -> Dict:
+    if not select:
+        return work
+    return {k: work[k] for k in select.split(",") if k in work}
+
+
+class MockOpenAlex:
+    """与MockSemanticScholar共用SyntheticGraph、延迟、429和请求计数的OpenAlex风格works API"""
+
+    def __init__(self, mock: MockSemanticScholar) -> None:
+        self.mock = mock
+        self.graph = mock.graph
+
+    def index_of(self, workId: str) -> Optional[int]:
+        workId = workId.lower()
+        if workId.startswith("doi:"):
+            return self.graph.doi_index.get(workId[4:])
+        if workId.startswith("w") and workId[1:].isdigit() and 0 < int(workId[1:]) <= len(self.graph):
+            return int(workId[1:]) - 1
+        return None
+
+    async def work(self, request: web.Request) -> web.Response:
+        response = await self.mock.throttle("openalex_work")
+        if response:
+            return response
+        i = self.index_of(request.match_info["workId"])
+        if i is None:
+            return self.mock.not_found()
+        return web.json_response(select_work(to_work(self.graph, i), request.query.get("select")))
+
+    async def works(self, request: web.Request) -> web.Response:
+        """只支持ids.openalex:W1|W2和cites:W1两种filter，cursor是offset"""
+        response = await self.mock.throttle("openalex_works")
+        if response:
+            return response
+        kind, _, value = request.query.get("filter", "").partition(":")
+        if kind == "ids.openalex":
+            items = [i for i in map(self.index_of, value.split("|")) if i is not None]
+        elif kind == "cites":
+            i = self.index_of(value)
+            items = self.graph.citations[i] if i is not None else []
+        else:
+            return web.json_response({"error": "Unsupported filter"}, status=400)
+        per_page = int(request.query.get("per-page", 25))
+        cursor = request.query.get("cursor", "*")
+        offset = 0 if cursor == "*" else int(cursor)
+        results = [select_work(to_work(self.graph, i), request.query.get("select")) for i in items[offset:offset + per_page]]
+        next_cursor = str(offset + per_page) if offset + per_page < len(items) else None
+        return web.json_response({"meta": {"count": len(items), "next_cursor": next_cursor}, "results": results})
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.add_routes([
+            web.get("/works/{workId:.+}", self.work),
+            web.get("/works", self.works),
+        ])
+        return app
+
+
+def serve(host: str, port: int, graph_kwargs: Dict, latency: float, rate_429: float, seed: int) -> None:
+    """Semantic Scholar API在/下，OpenAlex API在/openalex下"""
+    graph = SyntheticGraph(seed=seed, **graph_kwargs)
+    mock = MockSemanticScholar(graph, latency, rate_429, seed)
+    app = mock.app()
+    app.add_subapp("/openalex", MockOpenAlex(mock).app())
+    web.run_app(app, host=host, port=port, print=None)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--size", type=int, default=1000)
+    parser.add_argument("--degree", type=int, default=10)
+    parser.add_argument("--distribution", type=str, choices=["powerlaw", "uniform"], default="powerlaw")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(json.dumps(vars(args)))
+    serve(args.host, args.port, dict(size=args.size, degree=args.degree, distribution=args.distribution),
+          args.latency, args.rate_429, args.seed)
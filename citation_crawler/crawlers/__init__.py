@@ -1 +1,4 @@
-from .ss import SemanticScholarCrawler
\ No newline at end of file
+from .ss import SemanticScholarCrawler
+from .dump import SemanticScholarDumpCrawler
+from .openalex import OpenAlexCrawler
+from .composite import CompositeCrawler, Backend
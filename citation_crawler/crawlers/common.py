@@ -1,6 +1,8 @@
-from typing import Optional, Dict, Callable
+from typing import Optional, Dict, Callable, Any, List, Tuple, AsyncIterator, Awaitable, Set
+import atexit
 import os
 import json
+import time
 from datetime import datetime, timedelta
 
 import aiohttp
@@ -8,6 +10,13 @@ import logging
 from aiofile import async_open
 import asyncio
 from asyncio import Semaphore
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from itertools import islice
+
+from citation_crawler import metrics, profiling
+from citation_crawler.priority import PrioritySemaphore
 
 logger = logging.getLogger("common")
 
@@ -43,61 +52,580 @@ def getenv_headers(key) -> Dict:
 
 
 http_concorent = getenv_int('HTTP_CONCORRENT')
-http_sem = Semaphore(http_concorent if http_concorent is not None else 8)
-file_sem = Semaphore(512)
+http_concorent = http_concorent if http_concorent is not None else 8
+http_sem = PrioritySemaphore(http_concorent)
+file_concorent = 512
+file_sem = Semaphore(file_concorent)
+profiling.watch_semaphore("http_sem", http_sem, http_concorent)
+
+# 各类请求在http_sem之外还有自己的上限，耗时长的引文列表不会占满所有空位
+endpoint_pools = {
+    "paper": ("paper", "paper-batch"),
+    "references": ("references",),
+    "citations": ("citations",),
+    "authors": ("authors", "author-batch"),
+    "author_papers": ("author-papers", "author"),
+    "openalex": ("openalex-work", "openalex-works", "openalex-citations"),
+}
+endpoint_pool_default = {
+    "references": max(1, http_concorent * 3 // 4),
+    "citations": max(1, http_concorent * 3 // 4),
+}
+endpoint_sems: Dict[str, PrioritySemaphore] = {}
+for pool, endpoints in endpoint_pools.items():
+    concorent = getenv_int(f'HTTP_CONCORRENT_{pool.upper()}')
+    concorent = concorent if concorent is not None else endpoint_pool_default.get(pool, http_concorent)
+    sem = PrioritySemaphore(concorent)
+    profiling.watch_semaphore(f"http_sem.{pool}", sem, concorent)
+    for endpoint in endpoints:
+        endpoint_sems[endpoint] = sem
+profiling.watch_semaphore("file_sem", file_sem, file_concorent)
 http_headers = getenv_headers('HTTP_HEADERS')
 http_sleep = getenv_float('HTTP_SLEEP') or 0
 last_request_time = datetime.now()
+cache_root = os.getenv('CITATION_CRAWLER_CACHE_ROOT') or "save"
+executor_kind = os.getenv('CITATION_CRAWLER_EXECUTOR')
+executor_workers = getenv_int('CITATION_CRAWLER_EXECUTOR_WORKERS')
+executor: Optional[Executor] = None
+
+
+cache_total = metrics.counter("download_cache_total", "Cache lookups by endpoint and result (hit/superset/upgrade/miss/stale/error).")
+http_requests_total = metrics.counter("download_http_requests_total", "HTTP requests by endpoint and status.")
+http_errors_total = metrics.counter("download_http_errors_total", "Failed downloads by endpoint.")
+http_bytes_total = metrics.counter("download_http_bytes_total", "Downloaded bytes by endpoint.")
+http_latency = metrics.histogram("download_http_latency_seconds", "HTTP request latency by endpoint.")
+http_wait = metrics.histogram("download_http_wait_seconds", "Time waiting for a HTTP slot by endpoint.")
+cache_read_latency = metrics.histogram("download_cache_read_seconds", "Time reading and validating cache by endpoint.")
+decode_latency = metrics.histogram("json_decode_seconds", "Time decoding downloaded JSON, including executor queueing.")
+cache_write_latency = metrics.histogram("download_cache_write_seconds", "Time writing cache by endpoint.")
+negative_total = metrics.counter("download_negative_total", "Failures recorded in the negative cache by endpoint and kind.")
+negative_skips_total = metrics.counter("download_negative_skips_total", "Requests skipped because of the negative cache by endpoint and kind.")
+
+
+def get_executor() -> Optional[Executor]:
+    """CPU密集的解码等工作放到线程池或进程池里，不阻塞event loop"""
+    global executor
+    if executor is None and executor_kind == "process":
+        executor = ProcessPoolExecutor(max_workers=executor_workers)
+    elif executor is None and executor_kind == "thread":
+        executor = ThreadPoolExecutor(max_workers=executor_workers)
+    return executor
+
+
+def shutdown_executor() -> None:
+    """进程池不会自动退出，爬取结束后需要调用"""
+    global executor
+    if executor is not None:
+        executor.shutdown()
+        executor = None
+
+
+async def run_in_executor(func: Callable, *args) -> Any:
+    if get_executor() is None:
+        return func(*args)
+    return await asyncio.get_event_loop().run_in_executor(executor, func, *args)
 
 
 def get_cache_datetime(path) -> datetime:
     return datetime.fromtimestamp(os.path.getmtime(path))
 
 
-async def download_item(url: str, path: str, cache_days: int, is_valid: Callable[[str], None]) -> Optional[Dict]:
-    save_path = os.path.join("save", path)
-    if os.path.isfile(save_path):
+class CacheWriter:
+    """
+    下载的响应先放进有界的内存队列，由后台任务成批写入磁盘，不占用http_sem
+    每个文件先写入同目录的临时文件再rename，崩溃时不会留下写了一半的缓存
+    还在队列里的条目直接从内存读取
+    """
+
+    def __init__(self, max_pending: int = 1024, batch: int = 64, fsync: bool = False) -> None:
+        self.max_pending = max_pending
+        self.batch = batch
+        self.fsync = fsync
+        self.pending: Dict[str, str] = {}
+        self.cond: Optional[asyncio.Condition] = None
+        self.worker: Optional[asyncio.Task] = None
+        atexit.register(self.flush_sync)
+
+    def get(self, save_path: str) -> Optional[str]:
+        return self.pending.get(save_path)
+
+    def _write(self, save_path: str, text: str) -> None:
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        tmp_path = f"{save_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(text)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, save_path)
+
+    def _write_batch(self, items: List[Tuple[str, str]]) -> List[float]:
+        seconds = []
+        for save_path, text in items:
+            start = time.perf_counter()
+            try:
+                self._write(save_path, text)
+            except Exception as e:
+                logger.error("write err: %s %s" % (save_path, e))
+            seconds.append(time.perf_counter() - start)
+        return seconds
+
+    async def _run(self) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            async with self.cond:
+                await self.cond.wait_for(lambda: len(self.pending) > 0)
+                items = list(islice(self.pending.items(), self.batch))
+            seconds = await loop.run_in_executor(None, self._write_batch, items)
+            async with self.cond:
+                for (save_path, text), secs in zip(items, seconds):
+                    cache_write_latency.observe(secs, endpoint=get_endpoint(os.path.relpath(save_path, cache_root)))
+                    if self.pending.get(save_path) is text:  # 写入期间没有被更新
+                        del self.pending[save_path]
+                self.cond.notify_all()
+
+    def _start(self) -> None:
+        if self.worker is None or self.worker.done():
+            self.cond = asyncio.Condition()
+            self.worker = asyncio.ensure_future(self._run())
+
+    async def put(self, save_path: str, text: str) -> None:
+        """队列满时等待后台任务写入"""
+        self._start()
+        async with self.cond:
+            await self.cond.wait_for(lambda: len(self.pending) < self.max_pending or save_path in self.pending)
+            self.pending.pop(save_path, None)
+            self.pending[save_path] = text
+            self.cond.notify_all()
+
+    async def flush(self) -> None:
+        """等待队列中所有条目写入磁盘，并停止后台任务"""
+        if self.worker is None:
+            return
+        async with self.cond:
+            await self.cond.wait_for(lambda: len(self.pending) <= 0)
+        self.worker.cancel()
+        self.worker = None
+
+    def flush_sync(self) -> None:
+        """退出时还没写入的条目同步写入"""
+        items = list(self.pending.items())
+        self.pending.clear()
+        if len(items) > 0:
+            logger.info("Flushing %d cache entries at exit" % len(items))
+            self._write_batch(items)
+
+
+cache_writer = CacheWriter(getenv_int('CITATION_CRAWLER_CACHE_WRITE_QUEUE') or 1024)
+
+
+class HTTPStatusError(Exception):
+    def __init__(self, status: int, text: str) -> None:
+        super().__init__("HTTP %d: %s" % (status, text[:200]))
+        self.status = status
+
+
+# 响应内容无效（JSON解码失败、缺少字段等）时decode和is_valid抛出的异常，只有这些会删除缓存或记为invalid
+invalid_errors = (ValueError, AssertionError)
+
+
+def getenv_negative_days(key, default: float) -> float:
+    days = getenv_float(key)
+    return days if days is not None else default
+
+
+class NegativeCache:
+    """
+    记录下载失败的条目，有效期内不再请求
+    not_found（404等）和mismatch（返回的paperId与请求的不同）是永久失败，有效期为permanent_days
+    timeout、server_error（5xx）和invalid（200但内容无效）是暂时失败，有效期为transient_days
+    每条记录以JSON保存在缓存文件旁边的.fail文件里，下次运行仍然有效
+    """
+    permanent_kinds = ("not_found", "mismatch")
+
+    def __init__(self, permanent_days: float = 30, transient_days: float = 1 / 24) -> None:
+        self.permanent_days = permanent_days
+        self.transient_days = transient_days
+        self.entries: Dict[str, Optional[Dict]] = {}  # None表示没有记录
+        self.skips: Dict[str, int] = {}
+
+    @staticmethod
+    def kind_of(e: Exception) -> Optional[str]:
+        """只有与条目本身有关的失败才记录，429、401/403和连接失败不记录"""
+        if isinstance(e, HTTPStatusError):
+            if e.status in (400, 404, 410):
+                return "not_found"
+            if e.status >= 500:
+                return "server_error"
+            return None
+        if isinstance(e, asyncio.TimeoutError):
+            return "timeout"
+        if isinstance(e, aiohttp.ClientError):
+            return None
+        return "invalid"
+
+    def _days(self, kind: str) -> float:
+        return self.permanent_days if kind in self.permanent_kinds else self.transient_days
+
+    def _load(self, save_path: str) -> Optional[Dict]:
+        if save_path not in self.entries:
+            entry = None
+            fail_path = save_path + ".fail"
+            text = cache_writer.get(fail_path)
+            try:
+                if text is None and os.path.isfile(fail_path):
+                    with open(fail_path, 'r') as f:
+                        text = f.read()
+                if text is not None:
+                    entry = json.loads(text)
+            except Exception as e:
+                logger.info("err fail: %s %s" % (fail_path, e))
+            self.entries[save_path] = entry
+        return self.entries[save_path]
+
+    def get(self, path: str) -> Optional[str]:
+        """path在有效期内失败过时返回失败类型"""
+        entry = self._load(os.path.join(cache_root, path))
+        if entry is None or self._days(entry['kind']) < 0:
+            return None
+        if time.time() > entry['time'] + self._days(entry['kind']) * 86400:
+            return None
+        return entry['kind']
+
+    def skip(self, path: str) -> bool:
+        kind = self.get(path)
+        if kind is None:
+            return False
+        self.skips[kind] = self.skips.get(kind, 0) + 1
+        negative_skips_total.inc(endpoint=get_endpoint(path), kind=kind)
+        logger.debug("skip fail: %s (%s)" % (path, kind))
+        return True
+
+    async def add(self, path: str, kind: str, status: Optional[int] = None) -> None:
+        save_path = os.path.join(cache_root, path)
+        entry = {"kind": kind, "status": status, "time": time.time()}
+        self.entries[save_path] = entry
+        negative_total.inc(endpoint=get_endpoint(path), kind=kind)
+        await cache_writer.put(save_path + ".fail", json.dumps(entry))
+
+    def remove(self, path: str) -> None:
+        save_path = os.path.join(cache_root, path)
+        if self._load(save_path) is not None:
+            self.entries[save_path] = None
+            cache_writer.pending.pop(save_path + ".fail", None)
+            try:
+                os.remove(save_path + ".fail")
+            except Exception:
+                pass
+
+    def report(self) -> None:
+        if len(self.skips) > 0:
+            logger.info("Skipped known failures: %s" % ", ".join("%s %d" % kv for kv in sorted(self.skips.items())))
+
+
+negative_cache = NegativeCache(
+    getenv_negative_days('CITATION_CRAWLER_MAX_CACHE_DAYS_NOT_FOUND', 30),
+    getenv_negative_days('CITATION_CRAWLER_MAX_CACHE_DAYS_FAILED', 1 / 24))
+
+
+download_errors: ContextVar[Optional[List[Exception]]] = ContextVar("download_errors", default=None)
+
+
+def record_download_error(error: Exception) -> None:
+    """
+    当前context的download_errors为list时，把没能下载的错误记在里面（条目确实不存在的不算）
+    调用方（例如CompositeCrawler）据此区分“数据源不可用”和“没有这篇论文”
+    """
+    errors = download_errors.get()
+    if errors is not None:
+        errors.append(error)
+
+
+async def flush_cache() -> None:
+    """爬取结束后调用，确保所有缓存都已写入磁盘"""
+    negative_cache.report()
+    await cache_writer.flush()
+
+
+def split_cache_path(path: str) -> Optional[Tuple[str, str, Set[str], str]]:
+    """semanticscholar/paper--title-year/xxx.json -> (semanticscholar, paper, {title, year}, xxx.json)"""
+    parts = path.replace("\\", "/").split("/")
+    if len(parts) < 3 or "--" not in parts[1]:
+        return None
+    endpoint, fields = parts[1].split("--", 1)
+    return parts[0], endpoint, set(fields.split("-")), "/".join(parts[2:])
+
+
+cache_dirs: Dict[str, List[str]] = {}
+
+
+def cache_alternatives(path: str) -> List[Tuple[str, Set[str]]]:
+    """同一endpoint、字段不同的缓存目录中与path对应的路径及其字段"""
+    split = split_cache_path(path)
+    if split is None:
+        return []
+    root, endpoint, _, rest = split
+    root_path = os.path.join(cache_root, root)
+    if root_path not in cache_dirs:  # 运行中新建的只会是当前字段的目录，列一次就够了
+        cache_dirs[root_path] = sorted(os.listdir(root_path)) if os.path.isdir(root_path) else []
+    current = path.replace("\\", "/").split("/")[1]
+    alternatives = []
+    for name in cache_dirs[root_path]:
+        if name != current and name.startswith(endpoint + "--"):
+            alternatives.append((os.path.join(root, name, rest), set(name.split("--", 1)[1].split("-"))))
+    return alternatives
+
+
+def _is_fresh(path: str, cache_days: int) -> bool:
+    save_path = os.path.join(cache_root, path)
+    if cache_writer.get(save_path) is not None:
+        return True
+    if not os.path.isfile(save_path):
+        return False
+    return cache_days < 0 or datetime.now() < get_cache_datetime(save_path) + timedelta(days=cache_days)
+
+
+def find_superset_cache(path: str, cache_days: int) -> Optional[str]:
+    """字段包含path所需全部字段的未过期缓存，例如删掉一个字段之后原来的缓存仍然可用"""
+    split = split_cache_path(path)
+    if split is None:
+        return None
+    for alternative, fields in cache_alternatives(path):
+        if split[2] <= fields and _is_fresh(alternative, cache_days):
+            return alternative
+    return None
+
+
+def find_subset_cache(path: str, cache_days: int) -> Optional[Tuple[str, Set[str]]]:
+    """缺少部分字段的未过期缓存中字段最多的一个，只需要补上缺少的字段"""
+    split = split_cache_path(path)
+    if split is None:
+        return None
+    best = None
+    for alternative, fields in cache_alternatives(path):
+        common = len(split[2] & fields)
+        if common > 0 and (best is None or common > best[0]) and _is_fresh(alternative, cache_days):
+            best = (common, alternative, fields)
+    return best[1:] if best is not None else None
+
+
+def is_cache_fresh(path: str, cache_days: int) -> bool:
+    """缓存（或字段更多的缓存）存在且未过期，此时download_item不会发出请求"""
+    return _is_fresh(path, cache_days) or find_superset_cache(path, cache_days) is not None
+
+
+def remove_cache(path: str) -> None:
+    """删除已被其他缓存取代或内容不能用的缓存，包括还在写入队列里的"""
+    save_path = os.path.join(cache_root, path)
+    cache_writer.pending.pop(save_path, None)
+    try:
+        os.remove(save_path)
+    except Exception as e:
+        logger.info(" rm cache: %s" % e)
+
+
+async def read_cache(path: str) -> Optional[str]:
+    """读取缓存（或字段更多的缓存）的文本，不管是否过期，没有缓存时返回None"""
+    save_path = os.path.join(cache_root, path)
+    text = cache_writer.get(save_path)
+    if text is not None:
+        return text
+    if not os.path.isfile(save_path):
+        alternative = find_superset_cache(path, -1)
+        if alternative is None:
+            return None
+        return await read_cache(alternative)
+    async with file_sem:
+        try:
+            async with async_open(save_path, 'r') as f:
+                return await f.read()
+        except Exception as e:
+            logger.info("err cache: %s %s" % (save_path, e))
+    return None
+
+
+@asynccontextmanager
+async def http_slot(endpoint: str) -> AsyncIterator[None]:
+    """先占用endpoint所属的空位再占用http_sem，等待时按request_priority排队"""
+    sem = endpoint_sems.get(endpoint)
+    if sem is None:
+        async with http_sem:
+            yield
+        return
+    async with sem:
+        async with http_sem:
+            yield
+
+
+def get_endpoint(path: str) -> str:
+    """semanticscholar/references--title-abstract/xxx.json -> references"""
+    parts = path.replace("\\", "/").split("/")
+    return (parts[1] if len(parts) > 2 else parts[0]).split("--")[0]
+
+
+async def download_item(url: str, path: str, cache_days: int, is_valid: Callable[[str], None],
+                        decode: Optional[Callable[[str], Any]] = None,
+                        upgrade: Optional[Callable[[str, int], Awaitable[Optional[str]]]] = None) -> Optional[Dict]:
+    """
+    返回下载或缓存的文本
+    指定decode时用decode代替is_valid（解码失败即无效），在executor里运行，返回解码后的数据
+    指定upgrade时，没有可用缓存的情况下先调用upgrade(path, cache_days)，返回文本时不再下载（例如ss.upgrade_cache）
+    """
+    save_path = os.path.join(cache_root, path)
+    endpoint = get_endpoint(path)
+    text = cache_writer.get(save_path)
+    if text is not None:  # 刚下载还没写入磁盘
+        try:
+            if decode is not None:
+                with decode_latency.time(endpoint=endpoint):
+                    data = await run_in_executor(decode, text)
+            else:
+                assert is_valid(text)
+            cache_total.inc(endpoint=endpoint, result="hit")
+            return data if decode is not None else text
+        except invalid_errors:
+            cache_total.inc(endpoint=endpoint, result="error")
+    if not os.path.isfile(save_path):
+        alternative = find_superset_cache(path, cache_days)
+        if alternative is not None:  # 字段更多的缓存
+            try:
+                text = await read_cache(alternative)
+                if decode is not None:
+                    with decode_latency.time(endpoint=endpoint):
+                        data = await run_in_executor(decode, text)
+                else:
+                    assert is_valid(text)
+                cache_total.inc(endpoint=endpoint, result="superset")
+                return data if decode is not None else text
+            except (OSError, TypeError, *invalid_errors):  # 读取失败时read_cache返回None
+                logger.info("err cache: %s" % alternative)
+        cache_total.inc(endpoint=endpoint, result="miss")
+    else:
         if cache_days < 0 or datetime.now() < get_cache_datetime(save_path) + timedelta(days=cache_days):
             async with file_sem:
+                start = time.perf_counter()
                 try:
                     async with async_open(save_path, 'r') as f:
                         logger.debug("use cache: %s -> %s" % (path, url))
                         text = await f.read()
-                    assert is_valid(text)
-                    return text
-                except:
-                    logger.info(" no cache: %s" % save_path)
-                    if os.path.exists(save_path):
+                except OSError as e:  # 读取失败，不删除
+                    cache_total.inc(endpoint=endpoint, result="error")
+                    logger.info("err cache: %s %s" % (save_path, e))
+                else:
+                    try:
+                        if decode is not None:
+                            with decode_latency.time(endpoint=endpoint):
+                                data = await run_in_executor(decode, text)
+                        else:
+                            assert is_valid(text)
+                        cache_total.inc(endpoint=endpoint, result="hit")
+                        cache_read_latency.observe(time.perf_counter() - start, endpoint=endpoint)
+                        return data if decode is not None else text
+                    except invalid_errors:  # 只删除内容无效的缓存，其他异常（例如过滤代码的bug）直接抛出
+                        cache_total.inc(endpoint=endpoint, result="error")
+                        cache_read_latency.observe(time.perf_counter() - start, endpoint=endpoint)
                         logger.info("err cache: %s" % save_path)
                         try:
                             os.remove(save_path)
                         except Exception as e:
                             logger.info(" rm cache: %s" % e)
         else:
+            cache_total.inc(endpoint=endpoint, result="stale")
             logger.info("old cache: %s" % save_path)
 
-    async with http_sem:
+    if upgrade is not None:
+        text = await upgrade(path, cache_days)
+        if text is not None:
+            try:
+                if decode is not None:
+                    with decode_latency.time(endpoint=endpoint):
+                        data = await run_in_executor(decode, text)
+                else:
+                    assert is_valid(text)
+                return data if decode is not None else text
+            except invalid_errors:
+                logger.info("err upgrade: %s" % save_path)
+    if negative_cache.skip(path):  # 最近失败过，不再请求
+        kind = negative_cache.get(path)
+        if kind not in ("not_found", "mismatch"):
+            record_download_error(RuntimeError("Recently failed (%s): %s" % (kind, url)))
+        return None
+    start = time.perf_counter()
+    text, error = None, None
+    async with http_slot(endpoint):
+        http_wait.observe(time.perf_counter() - start, endpoint=endpoint)
         try:
             async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(verify_ssl=False), headers=http_headers) as session:
-                if http_sleep is not None:
-                    global last_request_time
-                    last_request_timedelta = datetime.now() - last_request_time
-                    last_request_time += last_request_timedelta
-                    wait = http_sleep - last_request_timedelta.total_seconds()
-                    if wait > 0:
-                        await asyncio.sleep(wait)
-                async with session.get(url,
-                                       proxy=os.getenv("HTTP_PROXY"),
-                                       timeout=os.getenv("HTTP_TIMEOUT") or 30) as response:
-                    logger.info(" download: %s <- %s" % (path, url))
-                    text = await response.text()
+                text = await request_text(session, "GET", url, path, endpoint)
+                if decode is not None:
+                    with decode_latency.time(endpoint=endpoint):
+                        data = await run_in_executor(decode, text)
+                else:
                     assert is_valid(text)
-                    os.makedirs(os.path.dirname(save_path), exist_ok=True)
-                    async with async_open(save_path, 'w') as f:
-                        await f.write(text)
-                    if http_sleep is not None:
-                        await asyncio.sleep(http_sleep)
-                    return text
+                if http_sleep is not None:
+                    await asyncio.sleep(http_sleep)
+        except (aiohttp.ClientError, asyncio.TimeoutError, HTTPStatusError, *invalid_errors) as e:
+            text, error = None, e
+            http_errors_total.inc(endpoint=endpoint)
+            logger.error(" down err: %s" % e)
+    if text is None:
+        kind = NegativeCache.kind_of(error)
+        if kind is not None:
+            await negative_cache.add(path, kind, getattr(error, 'status', None))
+        if kind != "not_found":
+            record_download_error(error)
+        return None
+    negative_cache.remove(path)
+    await write_cache(path, text)  # 在http_slot之外，由cache_writer在后台写入
+    return data if decode is not None else text
+
+
+async def request_text(session: aiohttp.ClientSession, method: str, url: str, path: str, endpoint: str, **kwargs) -> str:
+    """在http_slot内调用，发出请求并返回文本"""
+    if http_sleep is not None:
+        global last_request_time
+        last_request_timedelta = datetime.now() - last_request_time
+        last_request_time += last_request_timedelta
+        wait = http_sleep - last_request_timedelta.total_seconds()
+        if wait > 0:
+            await asyncio.sleep(wait)
+    start = time.perf_counter()
+    async with session.request(method, url,
+                               proxy=os.getenv("HTTP_PROXY"),
+                               timeout=os.getenv("HTTP_TIMEOUT") or 30, **kwargs) as response:
+        logger.info(" download: %s <- %s" % (path, url))
+        text = await response.text()
+        http_latency.observe(time.perf_counter() - start, endpoint=endpoint)
+        profiling.record_request(url, time.perf_counter() - start)
+        http_requests_total.inc(endpoint=endpoint, status=response.status)
+        http_bytes_total.inc(len(text), endpoint=endpoint)
+        if response.status >= 400:
+            raise HTTPStatusError(response.status, text)
+        return text
+
+
+async def write_cache(path: str, text: str) -> None:
+    await cache_writer.put(os.path.join(cache_root, path), text)
+
+
+async def post_item(url: str, path: str, body: Any, decode: Callable[[str], Any]) -> Optional[Any]:
+    """
+    POST JSON格式的body，返回decode后的数据，失败时返回None
+    不缓存整个响应，path只用于日志和指标，由调用方按条目缓存
+    """
+    endpoint = get_endpoint(path)
+    start = time.perf_counter()
+    async with http_slot(endpoint):
+        http_wait.observe(time.perf_counter() - start, endpoint=endpoint)
+        try:
+            async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(verify_ssl=False), headers=http_headers) as session:
+                text = await request_text(session, "POST", url, path, endpoint, json=body)
+                with decode_latency.time(endpoint=endpoint):
+                    data = await run_in_executor(decode, text)
+                if http_sleep is not None:
+                    await asyncio.sleep(http_sleep)
+                return data
         except Exception as e:
+            http_errors_total.inc(endpoint=endpoint)
             logger.error(" down err: %s" % e)
     return None
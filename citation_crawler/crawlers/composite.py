@@ -0,0 +1,401 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterable, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from citation_crawler import Crawler, Author, Paper
+from citation_crawler import metrics
+from .common import download_errors
+from .openalex import is_work_id
+
+logger = logging.getLogger("composite")
+
+'''Crawl from several backends (e.g. Semantic Scholar API, dataset dumps and OpenAlex), routing each call to the fastest healthy one'''
+
+backend_calls_total = metrics.counter("composite_backend_calls_total", "Backend calls by backend, method and result (ok/miss/error/timeout/cancelled).")
+backend_latency = metrics.histogram("composite_backend_seconds", "Backend call latency by backend and method.")
+backend_hedges_total = metrics.counter("composite_hedges_total", "Hedged calls started on another backend, by backend and method.")
+backend_down = metrics.gauge("composite_backend_down", "1 while the backend is considered down, by backend.")
+merged_total = metrics.counter("composite_merged_total", "Records merged into a paper known from another backend, by backend.")
+
+
+class BackendError(Exception):
+    """数据源没能返回结果（条目确实不存在的不算）"""
+    pass
+
+
+def accept_any(paperId: str) -> bool:
+    return True
+
+
+def accept_semanticscholar(paperId: str) -> bool:
+    """ss.get_paper只返回paperId与请求相同的论文，所以不接受DOI:xxx，也不接受OpenAlex work id"""
+    return not is_work_id(paperId) and not paperId.lower().startswith("doi:")
+
+
+def accept_dump(paperId: str) -> bool:
+    """数据集接受除OpenAlex work id以外的所有paperId"""
+    return not is_work_id(paperId)
+
+
+def accept_openalex(paperId: str) -> bool:
+    return is_work_id(paperId) or paperId.lower().startswith("doi:")
+
+
+class Backend:
+    """
+    CompositeCrawler的一个数据源，包装一个Crawler并记录其延迟和健康状态
+    连续失败max_failures次后在cooldown秒内视为不可用，之后每次失败cooldown翻倍（最多32倍）
+    """
+
+    def __init__(self, name: str, crawler: Crawler, accepts: Callable[[str], bool] = accept_any,
+                 timeout: float = 60, max_failures: int = 3, cooldown: float = 30) -> None:
+        self.name = name
+        self.crawler = crawler
+        self.accepts = accepts
+        self.timeout = timeout
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.latency: Optional[float] = None  # 成功调用延迟的指数移动平均
+        self.failures = 0
+        self.down_until = 0.0
+
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+    def success(self, seconds: float) -> None:
+        self.latency = seconds if self.latency is None else 0.8 * self.latency + 0.2 * seconds
+        if self.failures >= self.max_failures:
+            logger.info("Backend %s is up again" % self.name)
+        self.failures = 0
+        self.down_until = 0.0
+        backend_down.set(0, backend=self.name)
+
+    def failure(self) -> None:
+        if not self.healthy():
+            return  # 不可用之前发出的调用，不再延长cooldown
+        self.failures += 1
+        if self.failures >= self.max_failures:
+            self.down_until = time.monotonic() + self.cooldown * 2 ** min(self.failures - self.max_failures, 5)
+            backend_down.set(1, backend=self.name)
+            logger.warning("Backend %s failed %d times, down for %.0fs" % (self.name, self.failures, self.down_until - time.monotonic()))
+
+    async def call(self, method: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """运行func，下载失败、超时或抛出异常时记为失败并抛出BackendError"""
+        errors: List[Exception] = []
+        token = download_errors.set(errors)  # 只影响这个task
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(func(), self.timeout)
+        except asyncio.CancelledError:
+            backend_calls_total.inc(backend=self.name, method=method, result="cancelled")
+            raise
+        except asyncio.TimeoutError:
+            backend_calls_total.inc(backend=self.name, method=method, result="timeout")
+            self.failure()
+            raise BackendError(f"{self.name} {method} timed out")
+        except Exception as e:
+            backend_calls_total.inc(backend=self.name, method=method, result="error")
+            self.failure()
+            raise BackendError(f"{self.name} {method} failed: {e}")
+        finally:
+            download_errors.reset(token)
+        if len(errors) > 0:
+            backend_calls_total.inc(backend=self.name, method=method, result="error")
+            self.failure()
+            raise BackendError(f"{self.name} {method} failed: {errors[0]}")
+        seconds = time.perf_counter() - start
+        backend_latency.observe(seconds, backend=self.name, method=method)
+        backend_calls_total.inc(backend=self.name, method=method, result="ok" if result is not None else "miss")
+        self.success(seconds)
+        return result
+
+
+class MergedPaper(Paper):
+    """
+    同一篇论文在各数据源的记录，按DOI和title_hash合并（title_hash只在两边都没有DOI或DOI相同时用于合并）
+    paperId固定为最先得到的记录的paperId，其他字段按数据源的顺序取第一个有值的
+    """
+
+    def __init__(self, paperId: str, order: List[str]) -> None:
+        super().__init__()
+        self._paperId = paperId
+        self.order = order
+        self.records: Dict[str, Paper] = {}
+
+    def add(self, backend: str, record: Paper) -> None:
+        if backend not in self.records:
+            self.records[backend] = record
+
+    def _records(self) -> Iterable[Paper]:
+        for backend in self.order:
+            if backend in self.records:
+                yield self.records[backend]
+
+    def _first(self, getter: Callable[[Paper], Any]) -> Any:
+        for record in self._records():
+            value = getter(record)
+            if value:
+                return value
+        return None
+
+    def primary(self) -> Paper:
+        return next(iter(self._records()))
+
+    def paperId(self) -> str:
+        return self._paperId
+
+    def dblp_id(self) -> Optional[str]:
+        return self._first(lambda record: record.dblp_id())
+
+    def title(self) -> Optional[str]:
+        return self._first(lambda record: record.title())
+
+    def title_hash(self) -> str:
+        return self.primary().title_hash()
+
+    def year(self) -> Optional[int]:
+        return self._first(lambda record: record.year())
+
+    def date(self) -> Optional[str]:
+        return self._first(lambda record: record.date())
+
+    def parsed_date(self) -> Optional[Tuple[int, int, int]]:
+        return self._first(lambda record: record.parsed_date() if record.date() else None)
+
+    def prefiltered(self) -> Optional[bool]:
+        for record in self._records():
+            if hasattr(record, 'prefiltered') and record.prefiltered() is not None:
+                return record.prefiltered()
+        return None
+
+    def doi(self) -> Optional[str]:
+        return self._first(lambda record: record.doi())
+
+    def abstract(self) -> Optional[str]:
+        return self._first(lambda record: record.abstract())
+
+    async def authors(self) -> Iterable[Author]:
+        async for author in self.primary().authors():
+            yield author
+
+    async def authors_kv(self) -> Iterable[Tuple[str, str]]:
+        async for kv in self.primary().authors_kv():
+            yield kv
+
+    async def get_references(self) -> Iterable[Paper]:
+        async for paper in self.primary().get_references():
+            yield paper
+
+    async def get_citations(self) -> Iterable[Paper]:
+        async for paper in self.primary().get_citations():
+            yield paper
+
+
+class CompositeCrawler(Crawler):
+    """
+    在多个Backend上实现Crawler，每次get_paper/get_references/get_citations按以下方式选择数据源：
+    接受该paperId且可用的Backend按延迟从低到高排序，没有延迟记录的最先尝试
+    当前Backend失败或没有这篇论文时立即换下一个；超过hedge_factor倍平均延迟仍没有结果时同时启动下一个，取最先成功的结果
+    同时启动的调用不超过所有调用的max_hedge_ratio，以免数据源都慢的时候请求数翻倍
+    各数据源的记录按DOI和title_hash合并成MergedPaper，作者匹配等交给排在最前的数据源的Crawler
+    合并用的索引只保留最近用到的max_merged个key，以免与Crawler.papers一样无限增长
+    """
+
+    def __init__(self, backends: List[Backend], *args, hedge_factor: float = 3.0, max_hedge_ratio: float = 0.1,
+                 min_hedge_delay: float = 0.05, default_hedge_delay: float = 1.0, max_merged: int = 1000000, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.backends = backends
+        self.order = [backend.name for backend in backends]
+        self.hedge_factor = hedge_factor
+        self.max_hedge_ratio = max_hedge_ratio
+        self.min_hedge_delay = min_hedge_delay
+        self.default_hedge_delay = default_hedge_delay
+        self.max_merged = max_merged
+        self.merged: OrderedDict = OrderedDict()  # (id/doi/title, value) -> MergedPaper，按最近使用排序
+        self.calls = 0
+        self.hedges = 0
+
+    def _candidates(self, accepts: Callable[[Backend], bool]) -> List[Backend]:
+        backends = [backend for backend in self.backends if accepts(backend)]
+        healthy = [backend for backend in backends if backend.healthy()]
+        if len(healthy) > 0:
+            backends = healthy  # 都不可用时仍然逐个尝试
+        return sorted(backends, key=lambda backend: backend.latency if backend.latency is not None else 0)
+
+    def _hedge_delay(self, backend: Backend) -> float:
+        if backend.latency is None:
+            return self.default_hedge_delay
+        return max(self.min_hedge_delay, backend.latency * self.hedge_factor)
+
+    async def _race(self, method: str, backends: List[Backend],
+                    func: Callable[[Backend], Awaitable[Any]]) -> Tuple[Optional[Backend], Any]:
+        """按顺序在backends上运行func，返回最先得到的非None结果及其Backend，都没有结果时返回(None, None)"""
+        queue = list(backends)
+        tasks: Dict[asyncio.Future, Backend] = {}
+        self.calls += 1
+
+        def launch() -> Backend:
+            backend = queue.pop(0)
+            tasks[asyncio.ensure_future(backend.call(method, lambda: func(backend)))] = backend
+            return backend
+
+        hedge = True
+        try:
+            while len(queue) > 0 or len(tasks) > 0:
+                if len(tasks) <= 0:
+                    last = launch()
+                timeout = self._hedge_delay(last) if hedge and len(queue) > 0 else None
+                done, _ = await asyncio.wait(list(tasks.keys()), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if len(done) <= 0:
+                    if self.hedges >= self.max_hedge_ratio * self.calls:
+                        hedge = False  # 超出预算，等当前的调用结束
+                        continue
+                    backend_hedges_total.inc(backend=queue[0].name, method=method)  # 太慢，同时试试下一个
+                    self.hedges += 1
+                    last = launch()
+                    continue
+                for task in done:
+                    backend = tasks.pop(task)
+                    try:
+                        result = task.result()
+                    except BackendError as e:
+                        logger.info("%s, failing over" % e)
+                        continue
+                    if result is not None:
+                        return backend, result
+        finally:
+            for task in tasks:
+                task.cancel()
+        return None, None
+
+    def _keys(self, record: Paper) -> List[Tuple[str, str]]:
+        keys = [("id", record.paperId().lower())]
+        if record.doi():
+            keys.append(("doi", record.doi().lower()))
+        if record.title():
+            keys.append(("title", record.title_hash()))
+        return keys
+
+    def _lookup(self, key: Tuple[str, str]) -> Optional[MergedPaper]:
+        paper = self.merged.get(key)
+        if paper is not None:
+            self.merged.move_to_end(key)
+        return paper
+
+    def _remember(self, key: Tuple[str, str], paper: MergedPaper) -> None:
+        if key in self.merged:
+            return
+        self.merged[key] = paper
+        if len(self.merged) > self.max_merged:
+            self.merged.popitem(last=False)
+
+    def _merge(self, backend: Backend, record: Paper) -> MergedPaper:
+        """把一个数据源的记录合并到已知的同一篇论文，没有时新建"""
+        keys = self._keys(record)
+        doi = record.doi().lower() if record.doi() else None
+        paper = None
+        for key in keys:
+            candidate = self._lookup(key)
+            if candidate is None:
+                continue
+            if key[0] == "title" and doi != (candidate.doi().lower() if candidate.doi() else None):
+                continue  # 只有一方有DOI或DOI不同时不按标题合并，例如都叫"Introduction"的两篇论文
+            paper = candidate
+            break
+        if paper is None:
+            paper = MergedPaper(record.paperId(), self.order)
+        elif backend.name not in paper.records:
+            merged_total.inc(backend=backend.name)
+        paper.add(backend.name, record)
+        for key in keys:
+            self._remember(key, paper)
+        return paper
+
+    async def _record(self, backend: Backend, paper: MergedPaper) -> Optional[Paper]:
+        """论文在backend中的记录，没有时按DOI查找"""
+        if backend.name in paper.records:
+            return paper.records[backend.name]
+        doi = paper.doi()
+        if doi is None or not backend.accepts(f"DOI:{doi}"):
+            return None
+        record = await backend.crawler.get_paper(f"DOI:{doi}")
+        if record is not None:
+            self._merge(backend, record)
+        return record
+
+    async def _neighbours(self, method: str, paper: Paper) -> AsyncIterable[Paper]:
+        if not isinstance(paper, MergedPaper):
+            return
+
+        async def func(backend: Backend) -> Optional[List[Paper]]:
+            record = await self._record(backend, paper)
+            if record is None:
+                return None
+            return [neighbour async for neighbour in getattr(backend.crawler, method)(record) if neighbour]
+
+        backend, records = await self._race(method, self._candidates(
+            lambda backend: backend.name in paper.records or (paper.doi() is not None and backend.accepts(f"DOI:{paper.doi()}"))), func)
+        if backend is None:
+            logger.warning("No backend can %s of %s" % (method, paper.paperId()))
+            return
+        for record in records:
+            yield self._merge(backend, record)
+
+    async def get_init_paperIds(self):
+        for backend in self.backends:
+            async for paperId in backend.crawler.get_init_paperIds():
+                yield paperId
+
+    async def get_paper(self, paperId):
+        paper = self._lookup(("id", paperId.lower()))
+        if paper is not None:
+            return paper
+        backend, record = await self._race("get_paper", self._candidates(lambda backend: backend.accepts(paperId)),
+                                           lambda backend: backend.crawler.get_paper(paperId))
+        if backend is None:
+            return None
+        return self._merge(backend, record)
+
+    async def get_references(self, paper):
+        async for reference in self._neighbours("get_references", paper):
+            yield reference
+
+    async def get_citations(self, paper):
+        async for citation in self._neighbours("get_citations", paper):
+            yield citation
+
+    async def init_paper(self, paperId):
+        paper, news = await super().init_paper(paperId)
+        if isinstance(paper, MergedPaper):  # 例如SSPaper预取作者
+            for record in paper.records.values():
+                if hasattr(record, 'prefetch_authors'):
+                    record.prefetch_authors()
+        return paper, news
+
+    async def filter_papers(self, papers):
+        async for paper in papers:
+            yield paper
+
+    async def match_authors(self, paper, authors):
+        """交给有这篇论文的记录、排在最前的数据源"""
+        if not isinstance(paper, MergedPaper):
+            return
+        for backend in self.backends:
+            if backend.name in paper.records:
+                async for matched in backend.crawler.match_authors(paper.records[backend.name], authors):
+                    yield matched
+                return
+
+    async def citations_expired(self, paperId):
+        for backend in self.backends:
+            if backend.accepts(paperId):
+                return await backend.crawler.citations_expired(paperId)
+        return True
+
+    async def get_cached_citations(self, paperId):
+        for backend in self.backends:
+            if backend.accepts(paperId):
+                return await backend.crawler.get_cached_citations(paperId)
+        return None
@@ -0,0 +1,466 @@
+import glob
+import gzip
+import hashlib
+import heapq
+import json
+import logging
+import mmap
+import os
+import shutil
+import tempfile
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from citation_crawler import Paper
+from .ss import SSAuthor, SSPaper, SemanticScholarCrawler, normalize_paper
+
+logger = logging.getLogger("semanticscholar_dump")
+
+'''
+Crawl from a local copy of Semantic Scholar bulk datasets (papers, citations and authors JSONL.gz files)
+The dumps are decompressed once into flat JSONL files, with sorted (uint64 key, uint64 value) tables for lookups through mmap
+'''
+
+tables = {
+    "papers": "corpusId -> offset in papers.jsonl",
+    "paperIds": "first 64 bits of paperId -> corpusId",
+    "dois": "64 bits hash of DOI -> corpusId",
+    "references": "citing corpusId -> cited corpusId",
+    "citations": "cited corpusId -> citing corpusId",
+    "authors": "authorId -> offset in authors.jsonl",
+    "author_papers": "authorId -> corpusId",
+}
+
+
+def paperId_key(paperId: str) -> int:
+    return int(paperId[:16], 16)
+
+
+def doi_key(doi: str) -> int:
+    return int.from_bytes(hashlib.blake2b(doi.lower().encode("utf8"), digest_size=8).digest(), "little")
+
+
+def open_dump(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, 'rb')  # 流式解压，不会整个读入内存
+    return open(path, 'rb')
+
+
+def iter_dump(dump_dir: str, dataset: str) -> Iterator[bytes]:
+    for path in sorted(glob.glob(os.path.join(dump_dir, dataset, "*"))):
+        logger.info("Reading dump: %s" % path)
+        with open_dump(path) as f:
+            for line in f:
+                if line.strip():
+                    yield line
+
+
+def _write_chunk(pairs: List[Tuple[int, int]], tmpdir: str, i: int) -> str:
+    path = os.path.join(tmpdir, f"chunk-{i}")
+    a = array('Q')
+    for k, v in pairs:
+        a.append(k)
+        a.append(v)
+    with open(path, 'wb') as f:
+        a.tofile(f)
+    return path
+
+
+def _read_chunk(path: str, block: int = 1 << 16) -> Iterator[Tuple[int, int]]:
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(block * 16)
+            if not data:
+                return
+            a = array('Q')
+            a.frombytes(data)
+            for i in range(0, len(a), 2):
+                yield a[i], a[i + 1]
+
+
+def write_table(path: str, pairs: Iterable[Tuple[int, int]], chunk: int = 1 << 22) -> int:
+    """把(key, value)排序后写成定长的二进制表，超过chunk个时分块排序再归并（外部排序），返回写入的数量"""
+    tmpdir = tempfile.mkdtemp(dir=os.path.dirname(path) or ".")
+    try:
+        chunks, buf = [], []
+        for pair in pairs:
+            buf.append(pair)
+            if len(buf) >= chunk:
+                buf.sort()
+                chunks.append(_write_chunk(buf, tmpdir, len(chunks)))
+                buf = []
+        buf.sort()
+        if len(chunks) <= 0:
+            merged = iter(buf)
+        else:
+            chunks.append(_write_chunk(buf, tmpdir, len(chunks)))
+            merged = heapq.merge(*[_read_chunk(c) for c in chunks])
+        n = 0
+        with open(path, 'wb') as f:
+            a = array('Q')
+            for k, v in merged:
+                a.append(k)
+                a.append(v)
+                n += 1
+                if len(a) >= 1 << 17:
+                    a.tofile(f)
+                    a = array('Q')
+            a.tofile(f)
+        return n
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+class SortedTable:
+    """write_table写出的表，mmap后二分查找"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.file = open(path, 'rb')
+        size = os.path.getsize(path)
+        self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size > 0 else None
+        self.view = memoryview(self.mmap).cast('Q') if self.mmap is not None else []
+        self.n = len(self.view) // 2
+
+    def _lower_bound(self, key: int) -> int:
+        view, lo, hi = self.view, 0, self.n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if view[mid * 2] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def get(self, key: int) -> Optional[int]:
+        i = self._lower_bound(key)
+        if i < self.n and self.view[i * 2] == key:
+            return self.view[i * 2 + 1]
+        return None
+
+    def values(self, key: int) -> Iterator[int]:
+        i = self._lower_bound(key)
+        while i < self.n and self.view[i * 2] == key:
+            yield self.view[i * 2 + 1]
+            i += 1
+
+    def __len__(self) -> int:
+        return self.n
+
+    def close(self) -> None:
+        if self.mmap is not None:
+            self.view.release()
+            self.mmap.close()
+        self.file.close()
+
+
+class RecordFile:
+    """每行一条JSON的文件，按偏移mmap读取"""
+
+    def __init__(self, path: str) -> None:
+        self.file = open(path, 'rb')
+        size = os.path.getsize(path)
+        self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size > 0 else None
+
+    def get(self, offset: int) -> Dict:
+        end = self.mmap.find(b"\n", offset)
+        return json.loads(self.mmap[offset:end if end >= 0 else len(self.mmap)])
+
+    def close(self) -> None:
+        if self.mmap is not None:
+            self.mmap.close()
+        self.file.close()
+
+
+def record_paperId(record: Dict) -> Optional[str]:
+    """数据集里的论文以corpusid为主键，paperId在url的最后"""
+    if record.get('url'):
+        return record['url'].rstrip("/").split("/")[-1] or None
+    return None
+
+
+def paper_record_to_data(record: Dict) -> Dict:
+    """把数据集里的论文转换成Graph API的格式，这样就能直接用SSPaper"""
+    paperId = record_paperId(record) or f"CorpusId:{record['corpusid']}"
+    externalIds = {k: v for k, v in (record.get('externalids') or {}).items() if v}
+    data = {
+        'paperId': paperId,
+        'corpusId': record['corpusid'],
+        'title': record.get('title'),
+        'year': record.get('year'),
+        'publicationDate': record.get('publicationdate'),
+        'externalIds': externalIds,
+        'publicationTypes': record.get('publicationtypes'),
+        'journal': record.get('journal'),
+        'authors': [a for a in (record.get('authors') or []) if a.get('authorId')],
+    }
+    if record.get('abstract'):
+        data['abstract'] = record['abstract']
+    return normalize_paper(data)
+
+
+def author_record_to_data(record: Dict) -> Dict:
+    return {
+        'authorId': str(record['authorid']),
+        'name': record.get('name'),
+        'externalIds': record.get('externalids') or {},
+        'homepage': record.get('homepage'),
+    }
+
+
+def copy_records(dump_dir: str, dataset: str, path: str, key: str) -> Iterator[Tuple[int, int]]:
+    """把数据集解压复制到path，边复制边产出(record[key], 在path中的偏移)"""
+    with open(path, 'wb') as f:
+        for line in iter_dump(dump_dir, dataset):
+            record = json.loads(line)
+            yield int(record[key]), f.tell()
+            f.write(line.rstrip(b"\n") + b"\n")
+
+
+def iter_records(path: str) -> Iterator[Dict]:
+    with open(path, 'rb') as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def paperId_pairs(path: str) -> Iterator[Tuple[int, int]]:
+    for record in iter_records(path):
+        paperId = record_paperId(record)
+        if paperId is not None:
+            try:
+                yield paperId_key(paperId), int(record['corpusid'])
+            except ValueError:
+                pass
+
+
+def doi_pairs(path: str) -> Iterator[Tuple[int, int]]:
+    for record in iter_records(path):
+        doi = (record.get('externalids') or {}).get('DOI')
+        if doi:
+            yield doi_key(doi), int(record['corpusid'])
+
+
+def author_paper_pairs(path: str) -> Iterator[Tuple[int, int]]:
+    for record in iter_records(path):
+        for author in record.get('authors') or []:
+            if str(author.get('authorId')).isdigit():
+                yield int(author['authorId']), int(record['corpusid'])
+
+
+def citation_pairs(dump_dir: str, reverse: bool) -> Iterator[Tuple[int, int]]:
+    for line in iter_dump(dump_dir, "citations"):
+        record = json.loads(line)
+        citing, cited = record.get('citingcorpusid'), record.get('citedcorpusid')
+        if citing is None or cited is None:
+            continue
+        yield (int(cited), int(citing)) if reverse else (int(citing), int(cited))
+
+
+def build_index(dump_dir: str, index_dir: str, chunk: int = 1 << 22) -> Dict[str, int]:
+    """
+    从dump_dir/papers、dump_dir/citations和dump_dir/authors下的JSONL(.gz)文件构建索引到index_dir
+    每个表都边读边写入write_table，内存中最多只有chunk个(key, value)
+    论文先解压成papers.jsonl，其他论文相关的表各读一遍papers.jsonl
+    返回每个表的条目数
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    counts = {}
+
+    def write(name: str, pairs: Iterable[Tuple[int, int]]) -> None:
+        counts[name] = write_table(os.path.join(index_dir, f"{name}.idx"), pairs, chunk)
+
+    papers_path = os.path.join(index_dir, "papers.jsonl")
+    write("papers", copy_records(dump_dir, "papers", papers_path, 'corpusid'))
+    write("paperIds", paperId_pairs(papers_path))
+    write("dois", doi_pairs(papers_path))
+    write("author_papers", author_paper_pairs(papers_path))
+    write("references", citation_pairs(dump_dir, False))
+    write("citations", citation_pairs(dump_dir, True))
+    write("authors", copy_records(dump_dir, "authors", os.path.join(index_dir, "authors.jsonl"), 'authorid'))
+
+    with open(os.path.join(index_dir, "index.json"), 'w', encoding="utf8") as f:
+        json.dump({"tables": tables, "counts": counts}, f, indent=2)
+    logger.info("Built index of %s into %s: %s" % (dump_dir, index_dir, counts))
+    return counts
+
+
+class SemanticScholarDump:
+    """build_index构建的索引，所有查询都在本地完成"""
+
+    def __init__(self, index_dir: str) -> None:
+        self.index_dir = index_dir
+        self.tables = {name: SortedTable(os.path.join(index_dir, f"{name}.idx")) for name in tables}
+        self.papers = RecordFile(os.path.join(index_dir, "papers.jsonl"))
+        self.authors = RecordFile(os.path.join(index_dir, "authors.jsonl"))
+
+    def get_paper_data(self, corpusId: int) -> Optional[Dict]:
+        offset = self.tables["papers"].get(corpusId)
+        if offset is None:
+            return None
+        return paper_record_to_data(self.papers.get(offset))
+
+    def get_corpusId(self, paperId: str) -> Optional[int]:
+        """支持paperId、CorpusId:xxx和DOI:xxx"""
+        lower = paperId.lower()
+        if lower.startswith("corpusid:"):
+            try:
+                return int(lower[len("corpusid:"):])
+            except ValueError:
+                logger.warning("Invalid CorpusId: %s" % paperId)
+                return None
+        if lower.startswith("doi:"):
+            doi = lower[len("doi:"):]
+            for corpusId in self.tables["dois"].values(doi_key(doi)):
+                data = self.get_paper_data(corpusId)
+                if data and (data['externalIds'].get('DOI') or '').lower() == doi:
+                    return corpusId
+            return None
+        try:
+            key = paperId_key(lower)
+        except ValueError:
+            return None
+        corpusIds = list(self.tables["paperIds"].values(key))
+        if len(corpusIds) == 1:  # 64位前缀几乎不会冲突，只有冲突时才读出论文核对
+            return corpusIds[0]
+        for corpusId in corpusIds:
+            data = self.get_paper_data(corpusId)
+            if data and data['paperId'].lower() == lower:
+                return corpusId
+        return None
+
+    def get_author_data(self, authorId: str) -> Optional[Dict]:
+        if not str(authorId).isdigit():
+            return None
+        offset = self.tables["authors"].get(int(authorId))
+        if offset is None:
+            return None
+        return author_record_to_data(self.authors.get(offset))
+
+    def _neighbours(self, table: str, corpusId: int) -> List[Dict]:
+        papers = []
+        for neighbour in self.tables[table].values(corpusId):
+            data = self.get_paper_data(neighbour)
+            if data is not None:
+                papers.append(data)
+        return papers
+
+    def get_references_data(self, corpusId: int) -> List[Dict]:
+        return self._neighbours("references", corpusId)
+
+    def get_citations_data(self, corpusId: int) -> List[Dict]:
+        return self._neighbours("citations", corpusId)
+
+    def get_author_papers_data(self, authorId: str) -> List[Dict]:
+        if not str(authorId).isdigit():
+            return []
+        return self._neighbours("author_papers", int(authorId))
+
+    def close(self) -> None:
+        for table in self.tables.values():
+            table.close()
+        self.papers.close()
+        self.authors.close()
+
+
+shared_dumps: Dict[str, SemanticScholarDump] = {}
+
+
+def open_shared_dump(index_dir: str) -> SemanticScholarDump:
+    """同一个index_dir在进程内只打开一次，DumpPaper unpickle时也用它"""
+    index_dir = os.path.abspath(index_dir)
+    if index_dir not in shared_dumps:
+        shared_dumps[index_dir] = SemanticScholarDump(index_dir)
+    return shared_dumps[index_dir]
+
+
+class DumpPaper(SSPaper):
+    def __init__(self, data, dump: SemanticScholarDump) -> None:
+        super().__init__(data)
+        self.dump = dump
+
+    def __getstate__(self) -> Dict:
+        state = dict(object.__getstate__(self))  # Paper把__dict__定义成了方法
+        state['dump'] = self.dump.index_dir  # mmap不能pickle，只保存索引目录，读回时重新打开（见PaperStore）
+        return state
+
+    def __setstate__(self, state: Dict) -> None:
+        state['dump'] = open_shared_dump(state['dump'])
+        super().__setstate__(state)
+
+    def prefetch_authors(self) -> None:
+        pass  # 作者详情都在本地
+
+    async def authors(self) -> Iterable[SSAuthor]:
+        for a in self.data['authors']:
+            data = self.dump.get_author_data(a['authorId'])
+            yield SSAuthor(data if data is not None else a)
+
+    async def get_references(self) -> Iterable[Paper]:
+        for data in self.dump.get_references_data(self.data['corpusId']):
+            yield DumpPaper(data, self.dump)
+
+    async def get_citations(self) -> Iterable[Paper]:
+        for data in self.dump.get_citations_data(self.data['corpusId']):
+            yield DumpPaper(data, self.dump)
+
+
+class SemanticScholarDumpCrawler(SemanticScholarCrawler):
+    """与SemanticScholarCrawler相同，但从build_index构建的本地索引读取论文、引文和作者，不发出任何请求"""
+
+    def __init__(self, authorId_list: List[str], *args, dump: str, **kwargs) -> None:
+        super().__init__(authorId_list, *args, **kwargs)
+        self.dump = open_shared_dump(dump)
+
+    def _papers(self, papers: List[Dict]) -> Iterable[DumpPaper]:
+        if self.prefilter is not None:  # 同ss.decode_list，整批过滤
+            if hasattr(self.prefilter, 'match_records'):
+                verdicts = self.prefilter.match_records(papers)
+            else:
+                verdicts = [self.prefilter(paper.get('title'), paper.get('year')) for paper in papers]
+            for paper, verdict in zip(papers, verdicts):
+                paper['_match'] = verdict
+        for paper in papers:
+            yield DumpPaper(paper, self.dump)
+
+    async def get_init_paperIds(self):
+        async for authorId in self._iter_authorIds():
+            for data in self.dump.get_author_papers_data(authorId):
+                yield data['paperId']
+
+    async def get_paper(self, paperId):
+        corpusId = self.dump.get_corpusId(paperId)
+        if corpusId is None:
+            return None
+        data = self.dump.get_paper_data(corpusId)
+        if data is None:
+            return None
+        return DumpPaper(data, self.dump)
+
+    async def get_references(self, paper):
+        if 'corpusId' not in paper.data:
+            return
+        for paper in self._papers(self.dump.get_references_data(paper.data['corpusId'])):
+            yield paper
+
+    async def get_citations(self, paper):
+        if 'corpusId' not in paper.data:
+            return
+        for paper in self._papers(self.dump.get_citations_data(paper.data['corpusId'])):
+            yield paper
+
+    async def citations_expired(self, paperId):
+        return False  # 数据集不会变化
+
+    async def get_cached_citations(self, paperId):
+        return None
+
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build lookup index of Semantic Scholar dataset dumps.")
+    parser.add_argument("dump", type=str, help="Directory with papers/, citations/ and authors/ JSONL(.gz) files.")
+    parser.add_argument("index", type=str, help="Directory to write the index.")
+    parser.add_argument("--chunk", type=int, default=1 << 22, help="Pairs sorted in memory at once.")
+    args = parser.parse_args()
+    build_index(args.dump, args.index, args.chunk)
@@ -0,0 +1,269 @@
+import json
+import logging
+import os
+import re
+from typing import AsyncIterable, Dict, Iterable, List, Optional, Tuple
+
+from citation_crawler import Crawler, Author, Paper
+from citation_crawler.items import title_hash, parse_date
+from .common import download_item, getenv_int
+from .ss import get_citations_cache_days
+
+logger = logging.getLogger("openalex")
+
+'''Crawl from an OpenAlex-style works API, papers are identified by work ids (W...) or DOI:xxx'''
+
+api_root = os.getenv('OPENALEX_API_ROOT') or "https://api.openalex.org"
+
+select_work = "id,doi,title,publication_year,publication_date,authorships,referenced_works,abstract_inverted_index"
+root_work = f"openalex/openalex-work--{select_work.replace(',', '-')}"
+root_works = f"openalex/openalex-works--{select_work.replace(',', '-')}"
+root_citations = f"openalex/openalex-citations--{select_work.replace(',', '-')}"
+works_per_page = 50  # OpenAlex的filter最多同时查询100个id
+citations_per_page = 200
+
+work_id_re = re.compile(r"^w\d+$")
+
+
+def is_work_id(paperId: str) -> bool:
+    return work_id_re.match(paperId.lower()) is not None
+
+
+def short_id(url: Optional[str]) -> Optional[str]:
+    """https://openalex.org/W123 -> W123"""
+    if not url:
+        return None
+    return url.rsplit("/", 1)[-1]
+
+
+def short_doi(url: Optional[str]) -> Optional[str]:
+    """https://doi.org/10.xxx/yyy -> 10.xxx/yyy"""
+    if not url:
+        return None
+    return re.sub(r"^(https?://)?(dx\.)?doi\.org/", "", url)
+
+
+def abstract_from_index(index: Optional[Dict[str, List[int]]]) -> Optional[str]:
+    """OpenAlex用倒排索引表示摘要，还原成文本"""
+    if not index:
+        return None
+    words = {}
+    for word, positions in index.items():
+        for position in positions:
+            words[position] = word
+    return " ".join(words[k] for k in sorted(words))
+
+
+def normalize_work(data: Dict) -> Dict:
+    """转成与SSPaper的data相近的格式，并预先计算title_hash和解析日期"""
+    work = {
+        'paperId': short_id(data.get('id')),
+        'title': data.get('title'),
+        'year': data.get('publication_year'),
+        'publicationDate': data.get('publication_date'),
+        'doi': short_doi(data.get('doi')),
+        'abstract': abstract_from_index(data.get('abstract_inverted_index')),
+        'authors': [
+            {'authorId': short_id(a['author'].get('id')), 'name': a['author'].get('display_name'), 'orcid': a['author'].get('orcid')}
+            for a in data.get('authorships') or [] if a.get('author') and a['author'].get('id')
+        ],
+        'referenced_works': [short_id(w) for w in data.get('referenced_works') or []],
+    }
+    if work['title']:
+        work['_title_hash'] = title_hash(work['title'])
+    try:
+        work['_date'] = parse_date(work['publicationDate'])
+    except Exception:
+        work['_date'] = None
+    return work
+
+
+def decode_work(text: str) -> Dict:
+    data = json.loads(text)
+    if not data.get('id'):
+        raise ValueError(f"Invalid work data: {text}")
+    return normalize_work(data)
+
+
+def decode_works(text: str) -> Dict:
+    """一页works，results中每一项都是论文"""
+    data = json.loads(text)
+    if 'results' not in data:
+        raise ValueError(f"Invalid works data: {text}")
+    data['results'] = [normalize_work(d) for d in data['results'] if d and d.get('id')]
+    return data
+
+
+class OpenAlexAuthor(Author):
+    def __init__(self, data) -> None:
+        super().__init__()
+        self.data = data
+
+    def authorId(self) -> str:
+        return self.data['authorId']
+
+    def name(self) -> Optional[str]:
+        return self.data.get('name')
+
+    def dblp_pid(self) -> Optional[str]:
+        return None
+
+
+class OpenAlexPaper(Paper):
+    def __init__(self, data) -> None:
+        super().__init__()
+        self.data = data
+        assert 'paperId' in self.data and self.data['paperId']
+
+    def paperId(self) -> str:
+        return self.data['paperId']
+
+    def dblp_id(self) -> Optional[str]:
+        return None
+
+    def title(self) -> Optional[str]:
+        return self.data.get('title')
+
+    def title_hash(self) -> str:
+        if '_title_hash' not in self.data:
+            self.data['_title_hash'] = super().title_hash()
+        return self.data['_title_hash']
+
+    def year(self) -> Optional[int]:
+        return self.data.get('year')
+
+    def date(self) -> Optional[str]:
+        return self.data.get('publicationDate')
+
+    def parsed_date(self) -> Optional[Tuple[int, int, int]]:
+        if '_date' in self.data:
+            return self.data['_date']
+        return super().parsed_date()
+
+    def prefiltered(self) -> Optional[bool]:
+        return self.data.get('_match')
+
+    def doi(self) -> Optional[str]:
+        return self.data.get('doi')
+
+    def abstract(self) -> Optional[str]:
+        return self.data.get('abstract')
+
+    async def authors(self) -> Iterable[OpenAlexAuthor]:
+        for a in self.data.get('authors', []):
+            yield OpenAlexAuthor(a)
+
+    async def authors_kv(self) -> Iterable[Tuple[str, str]]:
+        for _ in []:
+            yield None  # OpenAlex的作者与数据库中的作者没有共同的标识
+
+    async def get_references(self) -> Iterable[Paper]:
+        async for paper in get_references(self):
+            yield paper
+
+    async def get_citations(self) -> Iterable[Paper]:
+        async for paper in get_citations(self.paperId()):
+            yield paper
+
+
+def get_work_cache_days() -> int:
+    cache_days = getenv_int('CITATION_CRAWLER_MAX_CACHE_DAYS_PAPER')
+    return cache_days if cache_days is not None else -1
+
+
+async def get_work(paperId: str) -> Optional[OpenAlexPaper]:
+    """paperId为W...或DOI:xxx"""
+    paperId = paperId.lower()
+    if paperId.startswith("doi:"):
+        url = f"{api_root}/works/doi:{paperId[4:]}?select={select_work}"
+        path = os.path.join(root_work, "doi", f"{paperId[4:]}.json")
+    else:
+        url = f"{api_root}/works/{paperId.upper()}?select={select_work}"
+        path = os.path.join(root_work, f"{paperId.upper()}.json")
+    data = await download_item(url, path, get_work_cache_days(), None, decode_work)
+    if not data or not data.get('paperId'):
+        return None
+    return OpenAlexPaper(data)
+
+
+async def get_works(workIds: List[str], cache_name: str, cache_days: int) -> List[OpenAlexPaper]:
+    """按id批量获取，每works_per_page个一页，缓存在cache_name目录下"""
+    papers = []
+    for offset in range(0, len(workIds), works_per_page):
+        ids = "|".join(workIds[offset:offset + works_per_page])
+        url = f"{api_root}/works?filter=ids.openalex:{ids}&per-page={works_per_page}&select={select_work}"
+        path = os.path.join(root_works, cache_name, f"{offset}.json")
+        data = await download_item(url, path, cache_days, None, decode_works)
+        if not data or 'results' not in data:
+            continue
+        papers.extend(OpenAlexPaper(d) for d in data['results'])
+    return papers
+
+
+async def get_references(paper: OpenAlexPaper) -> AsyncIterable[OpenAlexPaper]:
+    """论文详情里已有referenced_works，只需批量获取它们的详情"""
+    cache_days = getenv_int('CITATION_CRAWLER_MAX_CACHE_DAYS_REFERENCES')
+    cache_days = cache_days if cache_days is not None else -1
+    for reference in await get_works(paper.data.get('referenced_works', []), paper.paperId(), cache_days):
+        yield reference
+
+
+async def get_citations(paperId: str) -> AsyncIterable[OpenAlexPaper]:
+    """按cursor翻页获取，每页分别缓存"""
+    cache_days = get_citations_cache_days()
+    paperId = paperId.upper()
+    cursor, page = "*", 0
+    while cursor:
+        url = f"{api_root}/works?filter=cites:{paperId}&per-page={citations_per_page}&cursor={cursor}&select={select_work}"
+        path = os.path.join(root_citations, paperId, f"{page}.json")
+        data = await download_item(url, path, cache_days, None, decode_works)
+        if not data or 'results' not in data:
+            return
+        for d in data['results']:
+            yield OpenAlexPaper(d)
+        cursor = data.get('meta', {}).get('next_cursor') if len(data['results']) > 0 else None
+        page += 1
+
+
+class OpenAlexCrawler(Crawler):
+    """从OpenAlex风格的works API爬取，只接受W...和DOI:xxx形式的paperId"""
+
+    def __init__(self, *args, prefilter=None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.prefilter = prefilter
+
+    def _prefilter(self, papers: List[OpenAlexPaper]) -> List[OpenAlexPaper]:
+        if self.prefilter is not None:  # 同ss.decode_list，整批过滤
+            records = [paper.data for paper in papers]
+            if hasattr(self.prefilter, 'match_records'):
+                verdicts = self.prefilter.match_records(records)
+            else:
+                verdicts = [self.prefilter(record.get('title'), record.get('year')) for record in records]
+            for record, verdict in zip(records, verdicts):
+                record['_match'] = verdict
+        return papers
+
+    async def get_init_paperIds(self):
+        for _ in []:
+            yield None
+
+    async def get_paper(self, paperId):
+        if not (is_work_id(paperId) or paperId.lower().startswith("doi:")):
+            return None
+        return await get_work(paperId)
+
+    async def get_references(self, paper):
+        for reference in self._prefilter([reference async for reference in get_references(paper)]):
+            yield reference
+
+    async def get_citations(self, paper):
+        for citation in self._prefilter([citation async for citation in get_citations(paper.paperId())]):
+            yield citation
+
+    async def filter_papers(self, papers):
+        async for paper in papers:
+            yield paper
+
+    async def match_authors(self, paper, authors):
+        for _ in []:
+            yield None  # OpenAlex的作者与数据库中的作者没有共同的标识
@@ -1,15 +1,24 @@
+import asyncio
 import logging
 import re
 import os
 import json
-from typing import AsyncIterable, Iterable, Optional, Tuple, Dict, List
+from functools import partial
+from typing import AsyncIterable, Iterable, Optional, Tuple, Dict, List, Callable
 from urllib.parse import urlparse
 
+from dblp_crawler.gather import gather
+
 from citation_crawler import Crawler, Author, Paper
-from .common import download_item, getenv_int
+from citation_crawler.items import title_hash, parse_date
+from citation_crawler.priority import request_priority, PRIORITY_SPECULATIVE
+from .common import download_item, post_item, getenv_int, is_cache_fresh, read_cache, write_cache, cache_total, get_endpoint, negative_cache, \
+    split_cache_path, find_subset_cache, remove_cache
 
 logger = logging.getLogger("semanticscholar")
 
+api_root = os.getenv('SEMANTIC_SCHOLAR_API_ROOT') or "https://api.semanticscholar.org/graph/v1"
+
 
 class SSAuthor(Author):
     def __init__(self, data) -> None:
@@ -46,16 +55,51 @@ class SSAuthor(Author):
         return d
 
 
-async def download_list(url: str, path: str, cache_days: int):
-    def list_data_is_valid(text):
-        data = json.loads(text)
-        if 'data' in data:
-            return True
+def normalize_paper(data: Dict) -> Dict:
+    """预先计算title_hash和解析日期，SSPaper会直接使用这些字段"""
+    if data.get('title'):
+        data['_title_hash'] = title_hash(data['title'])
+    try:
+        data['_date'] = parse_date(data.get('publicationDate'))
+    except Exception:
+        data['_date'] = None
+    return data
+
+
+def decode_list(text: str, key: Optional[str] = None, prefilter: Optional[Callable[[str, int], bool]] = None) -> Dict:
+    """
+    解码列表页，无效时抛出异常，可在进程池中运行
+    指定key时只保留data中每一项的key字段并normalize，得到更紧凑的结果
+    指定prefilter时对整页运行prefilter，有match_records方法（例如YearKeywordFilter）时批量运行
+    """
+    data = json.loads(text)
+    if 'data' not in data:
         raise ValueError(f"Invalid list data: {text}")
-    text = await download_item(url, path, cache_days, list_data_is_valid)
-    if not text:
-        return
-    return json.loads(text)
+    if key is not None:
+        papers = [
+            normalize_paper(d[key]) for d in data['data']
+            if key in d and d[key] and 'paperId' in d[key] and d[key]['paperId']
+        ]
+        if prefilter is not None:  # 整页一起过滤
+            if hasattr(prefilter, 'match_records'):
+                verdicts = prefilter.match_records(papers)
+            else:
+                verdicts = [prefilter(paper.get('title'), paper.get('year')) for paper in papers]
+            for paper, verdict in zip(papers, verdicts):
+                paper['_match'] = verdict
+        data['data'] = papers
+    return data
+
+
+def decode_paper(text: str) -> Dict:
+    data = json.loads(text)
+    if 'paperId' not in data:
+        raise ValueError(f"Invalid paper data: {text}")
+    return normalize_paper(data)
+
+
+async def download_list(url: str, path: str, cache_days: int, key: Optional[str] = None, prefilter=None, upgrade=None):
+    return await download_item(url, path, cache_days, None, partial(decode_list, key=key, prefilter=prefilter), upgrade)
 
 
 fields_authors = "externalIds,name,affiliations,homepage"
@@ -66,7 +110,7 @@ async def get_authors(paperId: str) -> Iterable[Author]:
     cache_days = getenv_int('CITATION_CRAWLER_MAX_CACHE_DAYS_AUTHORS')
     cache_days = cache_days if cache_days is not None else -1
     paperId = paperId.lower()
-    url = f"https://api.semanticscholar.org/graph/v1/paper/{paperId}/authors?fields={fields_authors}"
+    url = f"{api_root}/paper/{paperId}/authors?fields={fields_authors}"
     data = await download_list(url, os.path.join(root_authors, f"{paperId}.json"), cache_days)
     if not data or 'data' not in data:
         return
@@ -75,6 +119,236 @@ async def get_authors(paperId: str) -> Iterable[Author]:
             yield SSAuthor(a)
 
 
+root_author_batch = f"semanticscholar/author-batch--{fields_authors.replace(',', '-')}"
+
+
+def decode_author_batch(text: str) -> List[Optional[Dict]]:
+    data = json.loads(text)
+    assert isinstance(data, list)
+    return data
+
+
+class Batcher:
+    """
+    短时间内需要获取的key攒在一起，由_request一次获取，相同的key只请求一次
+    子类实现_request，并可在_accept中检查、缓存结果
+    """
+
+    def __init__(self, batch_size: int, delay: float) -> None:
+        self.batch_size = batch_size
+        self.delay = delay
+        self.pending: Dict[str, asyncio.Future] = {}
+        self.queue: List[str] = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.priority = PRIORITY_SPECULATIVE  # queue中最急的请求的优先级
+        self.tasks = set()
+
+    def _enqueue(self, key: str) -> asyncio.Future:
+        self.priority = min(self.priority, request_priority.get())
+        if key in self.pending:
+            return self.pending[key]
+        future = asyncio.get_event_loop().create_future()
+        self.pending[key] = future
+        self.queue.append(key)
+        if len(self.queue) >= self.batch_size:
+            self._flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_event_loop().call_later(self.delay, self._flush)
+        return future
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.ensure_future(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def _flush(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        keys, self.queue = self.queue, []
+        priority, self.priority = self.priority, PRIORITY_SPECULATIVE
+        if len(keys) > 0:
+            self._spawn(self._fetch(keys, priority))
+
+    async def _request(self, keys: List[str]) -> Optional[List[Optional[Dict]]]:
+        """按keys的顺序返回结果，失败时返回None"""
+        raise NotImplementedError
+
+    async def _accept(self, key: str, data: Optional[Dict]) -> Optional[Dict]:
+        """检查_request得到的一项，返回交给等待者的结果"""
+        return data
+
+    async def _fetch(self, keys: List[str], priority: int) -> None:
+        request_priority.set(priority)
+        try:
+            results = await self._request(keys)
+        except Exception as e:
+            logger.error("Batch request failed: %s" % e)
+            results = None
+        for i, key in enumerate(keys):
+            data = results[i] if results is not None and i < len(results) else None
+            try:
+                data = await self._accept(key, data)
+            except Exception as e:
+                logger.error("Invalid batch item %s: %s" % (key, e))
+                data = None
+            future = self.pending.pop(key)
+            if not future.done():
+                future.set_result(data)
+
+
+class AuthorBatcher(Batcher):
+    """
+    按作者缓存作者详情，所有SSPaper共用
+    短时间内各论文需要的、缓存里没有的authorId攒在一起，通过POST /author/batch一次获取
+    """
+
+    def __init__(self, batch_size: int = 1000, delay: float = 0.05, max_cache: int = 1000000) -> None:
+        super().__init__(batch_size, delay)
+        self.max_cache = max_cache
+        self.cache: Dict[str, Dict] = {}
+
+    @staticmethod
+    def path(authorId: str) -> str:
+        return os.path.join(root_author_batch, f"{authorId}.json")
+
+    async def _load(self, authorId: str) -> Optional[Dict]:
+        cache_days = getenv_int('CITATION_CRAWLER_MAX_CACHE_DAYS_AUTHORS')
+        cache_days = cache_days if cache_days is not None else -1
+        path = self.path(authorId)
+        if not is_cache_fresh(path, cache_days):
+            cache_total.inc(endpoint=get_endpoint(path), result="miss")
+            return None
+        try:
+            data = json.loads(await read_cache(path))
+            assert data['authorId'] == authorId
+        except Exception:
+            cache_total.inc(endpoint=get_endpoint(path), result="error")
+            return None
+        cache_total.inc(endpoint=get_endpoint(path), result="hit")
+        return data
+
+    async def _request(self, authorIds: List[str]) -> Optional[List[Optional[Dict]]]:
+        url = f"{api_root}/author/batch?fields={fields_authors}"
+        return await post_item(url, root_author_batch, {"ids": authorIds}, decode_author_batch)
+
+    async def _accept(self, authorId: str, data: Optional[Dict]) -> Optional[Dict]:
+        if data is not None and data.get('authorId') == authorId:
+            await write_cache(self.path(authorId), json.dumps(data))
+            self._remember(authorId, data)
+            return data
+        return None
+
+    def _remember(self, authorId: str, data: Dict) -> None:
+        if len(self.cache) >= self.max_cache:
+            self.cache.clear()
+        self.cache[authorId] = data
+
+    async def _get(self, authorId: str) -> Optional[Dict]:
+        if authorId in self.cache:
+            return self.cache[authorId]
+        if authorId in self.pending:
+            return await self._enqueue(authorId)
+        data = await self._load(authorId)
+        if data is not None:
+            self._remember(authorId, data)
+            return data
+        return await self._enqueue(authorId)
+
+    async def get(self, authorIds: List[str]) -> Dict[str, Optional[Dict]]:
+        """返回authorId到作者详情的dict，获取失败的为None"""
+        results = await asyncio.gather(*[self._get(authorId) for authorId in authorIds])
+        return dict(zip(authorIds, results))
+
+    async def _prefetch(self, authorIds: List[str]) -> None:
+        request_priority.set(PRIORITY_SPECULATIVE)  # 只影响这个task
+        await self.get(authorIds)
+
+    def prefetch(self, authorIds: List[str]) -> None:
+        """不等待结果，让之后的get直接从缓存中读取，请求的优先级低于需要等待结果的请求"""
+        authorIds = [a for a in authorIds if a not in self.cache and a not in self.pending]
+        if len(authorIds) > 0:
+            self._spawn(self._prefetch(authorIds))
+
+
+author_batcher = AuthorBatcher()
+
+
+def decode_paper_batch(text: str) -> List[Optional[Dict]]:
+    data = json.loads(text)
+    assert isinstance(data, list)
+    return data
+
+
+class PaperBatcher(Batcher):
+    """通过POST /paper/batch获取论文的指定字段，用于给字段较少的缓存补上缺少的字段"""
+
+    def __init__(self, fields: str, batch_size: int = 500, delay: float = 0.05) -> None:
+        super().__init__(batch_size, delay)
+        self.fields = fields
+        self.root = f"semanticscholar/paper-batch--{fields.replace(',', '-')}"
+
+    async def _request(self, paperIds: List[str]) -> Optional[List[Optional[Dict]]]:
+        url = f"{api_root}/paper/batch?fields={self.fields}"
+        return await post_item(url, self.root, {"ids": paperIds}, decode_paper_batch)
+
+    async def _accept(self, paperId: str, data: Optional[Dict]) -> Optional[Dict]:
+        if data is not None and (data.get('paperId') or '').lower() == paperId.lower():
+            return data
+        return None
+
+    async def get(self, paperId: str) -> Optional[Dict]:
+        return await self._enqueue(paperId)
+
+
+paper_batchers: Dict[str, PaperBatcher] = {}
+
+
+async def upgrade_cache(path: str, cache_days: int, key: Optional[str] = None) -> Optional[str]:
+    """
+    作为download_item的upgrade，在path没有可用缓存时调用
+    有字段较少的缓存时，只通过/paper/batch获取缺少的字段，合并后写入path并返回文本，否则返回None
+    key为列表页中每一项的论文所在的字段，为None时缓存是单篇论文
+    旧缓存的字段都包含在path中时删除旧缓存，字段变化后每个条目仍然只有一份
+    """
+    split, subset = split_cache_path(path), find_subset_cache(path, cache_days)
+    if split is None or subset is None:
+        return None
+    alternative, cached = subset
+    needed = split[2]
+    missing = needed - cached
+    if any(field.startswith("authors.") for field in missing):  # authors要整个替换，需要全部子字段
+        missing |= {field for field in needed if field.startswith("authors.")}
+    try:
+        data = json.loads(await read_cache(alternative))
+        if key is None:
+            items = [data] if data.get('paperId') else []
+        else:
+            items = [d[key] for d in data['data'] if d.get(key) and d[key].get('paperId')]
+    except Exception:
+        return None
+    fields = ",".join(sorted(missing))
+    if fields not in paper_batchers:
+        paper_batchers[fields] = PaperBatcher(fields)
+    batcher = paper_batchers[fields]
+    results = await asyncio.gather(*[batcher.get(item['paperId']) for item in items])
+    if any(result is None for result in results):
+        return None  # 交给download_item完整下载
+    keys = {field.split(".")[0] for field in missing}
+    for item, result in zip(items, results):
+        for k in keys:
+            if k in result:
+                item[k] = result[k]
+            else:
+                item.pop(k, None)
+    text = json.dumps(data)
+    await write_cache(path, text)
+    if cached <= needed:
+        remove_cache(alternative)
+    cache_total.inc(endpoint=get_endpoint(path), result="upgrade")
+    return text
+
+
 class SSPaper(Paper):
     def __init__(self, data) -> None:
         super().__init__()
@@ -93,6 +367,11 @@ class SSPaper(Paper):
         if 'title' in self.data:
             return self.data['title']
 
+    def title_hash(self) -> str:
+        if '_title_hash' not in self.data:
+            self.data['_title_hash'] = super().title_hash()
+        return self.data['_title_hash']
+
     def year(self) -> Optional[int]:
         if 'year' in self.data:
             return self.data['year']
@@ -101,6 +380,15 @@ class SSPaper(Paper):
         if 'publicationDate' in self.data:
             return self.data['publicationDate']
 
+    def parsed_date(self) -> Optional[Tuple[int, int, int]]:
+        if '_date' in self.data:
+            return self.data['_date']
+        return super().parsed_date()
+
+    def prefiltered(self) -> Optional[bool]:
+        """SemanticScholarCrawler的prefilter结果，没有运行过prefilter时为None"""
+        return self.data.get('_match')
+
     def doi(self) -> Optional[str]:
         if 'externalIds' in self.data and self.data['externalIds'] and 'DOI' in self.data['externalIds']:
             doi = self.data['externalIds']['DOI']
@@ -121,15 +409,30 @@ class SSPaper(Paper):
         for author in self.author_data:
             yield author
 
+    def _missing_authorIds(self) -> List[str]:
+        """缺少externalIds需要另外获取详情的作者"""
+        return [a['authorId'] for a in self.data.get('authors', [])
+                if a.get('authorId') and ('externalIds' not in a or not a['externalIds'])]
+
+    def prefetch_authors(self) -> None:
+        authorIds = self._missing_authorIds()
+        if len(authorIds) > 0:
+            author_batcher.prefetch(authorIds)
+
     async def authors(self) -> Iterable[SSAuthor]:
         if 'authors' in self.data and len(self.data['authors']) >= 0:
+            authorIds = self._missing_authorIds()
+            details = await author_batcher.get(authorIds) if len(authorIds) > 0 else {}
+            missing = set(authorId for authorId in authorIds if details.get(authorId) is None)
+            if len(missing) > 0:  # /author/batch失败或对某些作者返回null时，改用这篇论文的/authors获取
+                async for author in get_authors(self.paperId()):
+                    if author.authorId() in missing:
+                        details[author.authorId()] = author.data
             for a in self.data['authors']:
-                if 'authorId' not in a or 'externalIds' not in a or not a['externalIds']:
-                    async for author in self._get_authors_from_author_data():
-                        yield author
-                    return
-            for a in self.data['authors']:
-                yield SSAuthor(a)
+                if not a.get('authorId'):
+                    continue
+                detail = details.get(a['authorId'])
+                yield SSAuthor(detail if detail is not None else a)
         else:
             async for author in self._get_authors_from_author_data():
                 yield author
@@ -155,44 +458,55 @@ root_references = f"semanticscholar/references--{fields_references.replace(',',
 root_citations = f"semanticscholar/citations--{fields_references.replace(',', '-')}"
 
 
-async def get_references(paperId: str) -> Iterable[SSPaper]:
+async def get_references(paperId: str, prefilter: Optional[Callable[[str, int], bool]] = None) -> Iterable[SSPaper]:
     cache_days = getenv_int('CITATION_CRAWLER_MAX_CACHE_DAYS_REFERENCES')
     cache_days = cache_days if cache_days is not None else -1
     paperId = paperId.lower()
-    url = f"https://api.semanticscholar.org/graph/v1/paper/{paperId}/references?fields={fields_references}"
-    data = await download_list(url, os.path.join(root_references, f"{paperId}.json"), cache_days)
+    url = f"{api_root}/paper/{paperId}/references?fields={fields_references}"
+    path = os.path.join(root_references, f"{paperId}.json")
+    data = await download_list(url, path, cache_days, 'citedPaper', prefilter, partial(upgrade_cache, key='citedPaper'))
     if not data or 'data' not in data:
         return
-    data = data['data']
-    for d in data:
-        if 'citedPaper' in d and 'paperId' in d['citedPaper'] and d['citedPaper']['paperId']:
-            yield SSPaper(d['citedPaper'])
+    for d in data['data']:
+        yield SSPaper(d)
 
 
-async def get_citations(paperId: str) -> Iterable[SSPaper]:
+def get_citations_cache_days() -> int:
     cache_days = getenv_int('CITATION_CRAWLER_MAX_CACHE_DAYS_CITATIONS')
-    cache_days = cache_days if cache_days is not None else 7
+    return cache_days if cache_days is not None else 7
+
+
+async def get_citations(paperId: str, prefilter: Optional[Callable[[str, int], bool]] = None) -> Iterable[SSPaper]:
+    cache_days = get_citations_cache_days()
     paperId = paperId.lower()
-    url = f"https://api.semanticscholar.org/graph/v1/paper/{paperId}/citations?fields={fields_references}"
-    data = await download_list(url, os.path.join(root_citations, f"{paperId}.json"), cache_days)
+    url = f"{api_root}/paper/{paperId}/citations?fields={fields_references}"
+    path = os.path.join(root_citations, f"{paperId}.json")
+    data = await download_list(url, path, cache_days, 'citingPaper', prefilter, partial(upgrade_cache, key='citingPaper'))
     if not data or 'data' not in data:
         return
-    data = data['data']
-    for d in data:
-        if 'citingPaper' in d and 'paperId' in d['citingPaper'] and d['citingPaper']['paperId']:
-            yield SSPaper(d['citingPaper'])
+    for d in data['data']:
+        yield SSPaper(d)
+
+
+def citations_expired(paperId: str) -> bool:
+    """引用列表没有缓存或缓存已过期，下次get_citations会重新下载"""
+    return not is_cache_fresh(os.path.join(root_citations, f"{paperId.lower()}.json"), get_citations_cache_days())
+
+
+async def get_cached_citations(paperId: str) -> Optional[List[str]]:
+    """缓存中（不管是否过期）引用该论文的paperId，没有缓存或缓存无效时返回None"""
+    text = await read_cache(os.path.join(root_citations, f"{paperId.lower()}.json"))
+    if text is None:
+        return None
+    try:
+        data = decode_list(text, 'citingPaper')
+    except Exception:
+        return None
+    return [d['paperId'] for d in data['data']]
 
 
 async def download_paper(url: str, path: str, cache_days: int):
-    def paper_is_valid(text):
-        data = json.loads(text)
-        if 'paperId' in data:
-            return True
-        raise ValueError(f"Invalid paper data: {text}")
-    text = await download_item(url, path, cache_days, paper_is_valid)
-    if not text:
-        return
-    return json.loads(text)
+    return await download_item(url, path, cache_days, None, decode_paper, upgrade_cache)
 
 
 fields_authors_sub = ','.join([("authors." + f) for f in fields_authors.split(',')])
@@ -206,51 +520,128 @@ async def get_paper(paperId: str) -> Optional[SSPaper]:
     cache_days = getenv_int('CITATION_CRAWLER_MAX_CACHE_DAYS_PAPER')
     cache_days = cache_days if cache_days is not None else -1
     paperId = paperId.lower()
-    url = f"https://api.semanticscholar.org/graph/v1/paper/{paperId}?fields={fields_paper}"
-    data = await download_paper(url, os.path.join(root_paper, f"{paperId2path(paperId)}.json"), cache_days)
-    if not data or 'paperId' not in data or data['paperId'].lower() != paperId:
+    url = f"{api_root}/paper/{paperId}?fields={fields_paper}"
+    path = os.path.join(root_paper, f"{paperId2path(paperId)}.json")
+    if negative_cache.get(path) == "mismatch" and negative_cache.skip(path):
+        return None
+    data = await download_paper(url, path, cache_days)
+    if not data or 'paperId' not in data:
+        return None
+    if data['paperId'].lower() != paperId:
+        await negative_cache.add(path, "mismatch")
+        remove_cache(path)  # 缓存的论文不是要的这篇，有效期过后重新请求
         return None
     return SSPaper(data)
 
 
-fields_author = "paperId,title"
-root_author = f"semanticscholar/author--{fields_author.replace(',', '-')}"
+fields_author_papers = "title,abstract,year,publicationDate,authors,externalIds,publicationTypes,journal"
+root_author_papers = f"semanticscholar/author-papers--{fields_author_papers.replace(',', '-')}"
+author_papers_limit = 1000
+
 
+def decode_papers(text: str) -> Dict:
+    """/author/{authorId}/papers的一页，data中每一项都是论文"""
+    data = decode_list(text)
+    data['data'] = [normalize_paper(d) for d in data['data'] if d and d.get('paperId')]
+    return data
 
-async def get_paperIds_by_authorId(authorId: str) -> List[str]:
+
+async def get_papers_by_authorId(authorId: str) -> Iterable[SSPaper]:
+    """翻页获取作者的所有论文，字段与get_paper相同（作者详情由author_batcher补全），每页分别缓存"""
     cache_days = getenv_int('CITATION_CRAWLER_MAX_CACHE_DAYS_INIT_AUTHOR')
     cache_days = cache_days if cache_days is not None else 7
     authorId = authorId.lower()
-    url = f"https://api.semanticscholar.org/graph/v1/author/{authorId}/papers?fields={fields_author}&limit=100"
-    data = await download_list(url, os.path.join(root_author, f"{authorId}.json"), cache_days)
-    if not data or 'data' not in data:
-        return
-    for paper in data['data']:
-        yield paper['paperId'].lower()
+    offset = 0
+    while offset is not None:
+        url = f"{api_root}/author/{authorId}/papers?fields={fields_author_papers}&offset={offset}&limit={author_papers_limit}"
+        path = os.path.join(root_author_papers, authorId, f"{offset}.json")
+        data = await download_item(url, path, cache_days, None, decode_papers)
+        if not data or 'data' not in data:
+            return
+        for d in data['data']:
+            yield SSPaper(d)
+        offset = data.get('next')
 
 
 class SemanticScholarCrawler(Crawler):
 
-    def __init__(self, authorId_list: List[str], *args, **kwargs) -> None:
+    def __init__(self, authorId_list: List[str], *args, prefilter: Optional[Callable[[str, int], bool]] = None, **kwargs) -> None:
+        """prefilter(title, year)会在解码引文时（可能在executor里）预先运行，结果见SSPaper.prefiltered()"""
         super().__init__(*args, **kwargs)
         self.authors = authorId_list
+        self.prefilter = prefilter
+        self.seed_papers: Dict[str, SSPaper] = {}  # 作者的论文已经带有全部字段，init时不用再get_paper
+        self.author_concurrency = 256
 
-    async def get_init_paperIds(self):
+    async def _iter_authorIds(self) -> AsyncIterable[str]:
         for author in self.authors:
-            async for paperId in get_paperIds_by_authorId(author):
-                yield paperId
+            if hasattr(author, '__aiter__'):  # 例如init.stream_authors_in_neo4j
+                async for authorId in author:
+                    yield authorId
+                continue
+            yield author
+
+    async def _get_author_papers(self, authorId: str) -> List[SSPaper]:
+        papers = []
+        async for paper in get_papers_by_authorId(authorId):
+            self.seed_papers[paper.paperId().lower()] = paper
+            papers.append(paper)
+        logger.info("There are %d papers by author %s" % (len(papers), authorId))
+        return papers
+
+    async def _get_authors_papers(self, authorIds: List[str]) -> AsyncIterable[str]:
+        async for papers in gather(*[self._get_author_papers(authorId) for authorId in authorIds]):
+            for paper in papers:
+                yield paper.paperId()
+
+    async def get_init_paperIds(self):
+        # 每author_concurrency个作者一起翻页获取
+        authorIds = []
+        async for authorId in self._iter_authorIds():
+            authorIds.append(authorId)
+            if len(authorIds) >= self.author_concurrency:
+                async for paperId in self._get_authors_papers(authorIds):
+                    yield paperId
+                authorIds = []
+        async for paperId in self._get_authors_papers(authorIds):
+            yield paperId
 
     async def get_paper(self, paperId):
+        paper = self.seed_papers.pop(paperId.lower(), None)
+        if paper is not None:
+            return paper
         return await get_paper(paperId)
 
+    async def init_paper(self, paperId):
+        try:
+            paper, news = await super().init_paper(paperId)
+        finally:
+            self.seed_papers.pop(paperId.lower(), None)  # 因为已知其他标识而跳过时不会get_paper
+        if isinstance(paper, SSPaper):  # 各论文并发init，此时预取作者能攒成更大的batch
+            paper.prefetch_authors()
+        return paper, news
+
+    async def _init_papers(self):
+        try:
+            async for result in super()._init_papers():
+                yield result
+        finally:
+            self.seed_papers.clear()  # 已经fetch过而没有init的论文也不再需要
+
     async def get_references(self, paper):
-        async for paper in get_references(paper.paperId()):
+        async for paper in get_references(paper.paperId(), self.prefilter):
             yield paper
 
     async def get_citations(self, paper):
-        async for paper in get_citations(paper.paperId()):
+        async for paper in get_citations(paper.paperId(), self.prefilter):
             yield paper
 
+    async def citations_expired(self, paperId):
+        return citations_expired(paperId)
+
+    async def get_cached_citations(self, paperId):
+        return await get_cached_citations(paperId)
+
     async def match_authors(self, paper: SSPaper, authors: AsyncIterable[Dict]) -> AsyncIterable[Tuple[Dict, Dict, bool]]:
         dblp_names, authorIds = {}, {}
         async for author in paper.authors():
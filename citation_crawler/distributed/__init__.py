@@ -0,0 +1,2 @@
+from .queue import WorkQueue, SQLiteWorkQueue
+from .worker import DistributedWorker
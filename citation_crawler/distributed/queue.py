@@ -0,0 +1,111 @@
+import abc
+import sqlite3
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Iterable, List, Optional, Tuple
+
+'''Work queue shared by distributed workers, the primary key of queued paperIds is also the shared visited set'''
+
+QUEUED, CLAIMED, DONE = 0, 1, 2
+
+
+def get_shard(paperId: str, shards: int) -> int:
+    return zlib.crc32(paperId.lower().encode("utf8")) % shards
+
+
+class WorkQueue(metaclass=abc.ABCMeta):
+
+    @abc.abstractmethod
+    def put(self, paperIds: Iterable[str], level: int) -> int:
+        """把paperId加入队列，已访问过的paperId会被忽略，返回新加入的数量"""
+        return 0
+
+    @abc.abstractmethod
+    def claim(self, worker: str, shard: int, n: int, steal: bool = False,
+              abandoned: Optional[float] = None) -> List[Tuple[str, int]]:
+        """
+        领取某个shard中最多n个(paperId, level)，steal时本shard为空就从其他shard领取
+        指定abandoned时，本shard为空就从abandoned秒内没有worker领取过的shard领取（那些worker可能已经挂了）
+        """
+        return []
+
+    @abc.abstractmethod
+    def done(self, paperIds: Iterable[str]) -> None:
+        pass
+
+    @abc.abstractmethod
+    def requeue_stale(self, timeout: float) -> int:
+        """把领取后超时未完成的paperId放回队列（领取它的worker可能已经挂了）"""
+        return 0
+
+    @abc.abstractmethod
+    def pending(self) -> int:
+        """排队中和已领取但未完成的数量，为0时整个爬取结束"""
+        return 0
+
+
+class SQLiteWorkQueue(WorkQueue):
+    def __init__(self, path: str, shards: int = 1, timeout: float = 60) -> None:
+        self.path = path
+        self.shards = shards
+        self.conn = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS queue ("
+                          "paperId TEXT PRIMARY KEY, shard INTEGER, level INTEGER, "
+                          "state INTEGER, worker TEXT, claimed REAL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS queue_state_shard_level ON queue (state, shard, level)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS shards (shard INTEGER PRIMARY KEY, seen REAL)")  # 各shard最近一次领取的时间
+
+    @contextmanager
+    def transaction(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.conn
+            self.conn.execute("COMMIT")
+        except:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def put(self, paperIds: Iterable[str], level: int) -> int:
+        rows = [(paperId.lower(), get_shard(paperId, self.shards), level, QUEUED) for paperId in paperIds]
+        if len(rows) <= 0:
+            return 0
+        with self.transaction():
+            before = self.conn.total_changes
+            self.conn.executemany("INSERT OR IGNORE INTO queue (paperId, shard, level, state) VALUES (?, ?, ?, ?)", rows)
+            return self.conn.total_changes - before
+
+    def claim(self, worker: str, shard: int, n: int, steal: bool = False,
+              abandoned: Optional[float] = None) -> List[Tuple[str, int]]:
+        with self.transaction():
+            now = time.time()
+            self.conn.execute("INSERT OR REPLACE INTO shards VALUES (?, ?)", (shard, now))
+            rows = self.conn.execute("SELECT paperId, level FROM queue WHERE state=? AND shard=? ORDER BY level LIMIT ?",
+                                     (QUEUED, shard, n)).fetchall()
+            if len(rows) <= 0 and steal:
+                rows = self.conn.execute("SELECT paperId, level FROM queue WHERE state=? ORDER BY level LIMIT ?",
+                                         (QUEUED, n)).fetchall()
+            elif len(rows) <= 0 and abandoned is not None:
+                rows = self.conn.execute("SELECT paperId, level FROM queue WHERE state=? AND shard NOT IN "
+                                         "(SELECT shard FROM shards WHERE seen>=?) ORDER BY level LIMIT ?",
+                                         (QUEUED, now - abandoned, n)).fetchall()
+            self.conn.executemany("UPDATE queue SET state=?, worker=?, claimed=? WHERE paperId=?",
+                                  [(CLAIMED, worker, now, paperId) for paperId, _ in rows])
+        return rows
+
+    def done(self, paperIds: Iterable[str]) -> None:
+        with self.transaction():
+            self.conn.executemany("UPDATE queue SET state=? WHERE paperId=?",
+                                  [(DONE, paperId.lower()) for paperId in paperIds])
+
+    def requeue_stale(self, timeout: float) -> int:
+        with self.transaction():
+            return self.conn.execute("UPDATE queue SET state=?, worker=NULL WHERE state=? AND claimed<?",
+                                     (QUEUED, CLAIMED, time.time() - timeout)).rowcount
+
+    def pending(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM queue WHERE state!=?", (DONE,)).fetchone()[0]
+
+    def close(self) -> None:
+        self.conn.close()
@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import List, Optional, Tuple
+
+from dblp_crawler.gather import gather
+
+from citation_crawler import Crawler, Paper
+from .queue import WorkQueue
+
+logger = logging.getLogger("distributed")
+
+
+class DistributedWorker:
+    """
+    从共享的WorkQueue中领取自己shard的paperId，用`Crawler`获取引文，写入`Crawler.summarizer`，再把新的paperId放回队列
+    每个worker进程有自己的Crawler（也就有自己的http_sem和HTTP客户端）
+    运行超过stale_timeout秒后，本shard为空时也处理stale_timeout秒内没有worker领取过的shard，挂掉的worker的论文不会一直没人处理
+    """
+
+    def __init__(self, crawler: Crawler, queue: WorkQueue, shard: int = 0,
+                 batch: int = 64, steal: bool = False, poll: float = 1, stale_timeout: float = 600) -> None:
+        self.crawler = crawler
+        self.queue = queue
+        self.shard = shard
+        self.batch = batch
+        self.steal = steal
+        self.poll = poll
+        self.stale_timeout = stale_timeout
+        self.name = f"{socket.gethostname()}-{os.getpid()}-{shard}"
+        self.total, self.total_news = 0, 0
+
+    async def put_init_paperIds(self) -> None:
+        paperIds = [paperId async for paperId in self.crawler._iter_init_paperIds()]
+        news = self.queue.put(paperIds, 0)
+        logger.info("Put %d init papers into queue, %d are new" % (len(paperIds), news))
+
+    async def crawl_paper(self, paperId: str, level: int, limit: int) -> Tuple[Optional[Paper], int]:
+        crawler = self.crawler
+        paper = await crawler.get_paper(paperId)
+        if not isinstance(paper, Paper):
+            return None, 0
+        if paper.paperId().lower() != paperId:  # 例如DOI:xxx，换成真正的paperId再查重
+            if self.queue.put([paper.paperId()], level) <= 0:
+                return None, 0
+            self.queue.done([paper.paperId()])
+
+        refs: List[Paper] = await crawler._collect(crawler.get_references(paper))
+        cits: List[Paper] = await crawler._collect(crawler.get_citations(paper))
+        await crawler.write_batch([paper], [(paper, ref) for ref in refs] + [(cit, paper) for cit in cits])
+
+        news = 0
+        if limit < 0 or level < limit:
+            news = self.queue.put([p.paperId() for p in refs + cits], level + 1)
+        logger.info("There are %s refernces and %s citations in %s, %s are new" % (len(refs), len(cits), paperId, news))
+        return paper, news
+
+    async def _crawl_paper(self, paperId: str, level: int, limit: int) -> Tuple[Optional[Paper], int]:
+        try:
+            return await self.crawl_paper(paperId, level, limit)
+        finally:
+            self.queue.done([paperId])
+
+    async def run(self, limit: int = -1) -> int:
+        """一直运行到队列中所有paperId都处理完，limit为BFS深度限制，返回本worker发现的新paperId数"""
+        await self.put_init_paperIds()
+        start = time.monotonic()
+        while True:
+            claimed = self.queue.claim(self.name, self.shard, self.batch, self.steal)
+            if len(claimed) <= 0 and not self.steal and time.monotonic() - start >= self.stale_timeout:  # 先等其他worker启动
+                claimed = self.queue.claim(self.name, self.shard, self.batch, abandoned=self.stale_timeout)
+                if len(claimed) > 0:
+                    logger.warning("Worker %s took over %d papers of abandoned shards" % (self.name, len(claimed)))
+            if len(claimed) <= 0:
+                if self.queue.pending() <= 0:
+                    break
+                self.queue.requeue_stale(self.stale_timeout)
+                await asyncio.sleep(self.poll)
+                continue
+            tasks = [self._crawl_paper(paperId, level, limit) for paperId, level in claimed]
+            async for paper, news in gather(*tasks):
+                if isinstance(paper, Paper):
+                    self.total += 1
+                    self.total_news += news
+        logger.info("Worker %s fetched %d papers and found %d new papers" % (self.name, self.total, self.total_news))
+        return self.total_news
@@ -0,0 +1,81 @@
+import re
+from bisect import bisect_right
+from typing import Dict, List, Optional
+
+'''Picklable paper filters, can be evaluated in a process pool'''
+
+
+class YearKeywordFilter:
+    """
+    只保留year之后（或没有year）且标题匹配keywords的论文，结果与keywords.match相同
+    keywords的所有单词编译成一个正则，整页标题拼接起来一次匹配，每条rule变成一个bitmask
+    结果按paperId缓存，被多次引用的论文只过滤一次
+    缓存不随pickle传递，所以在进程池（CITATION_CRAWLER_EXECUTOR=process）中每次调用都从空缓存开始，只有同一页内的重复论文能命中
+    """
+
+    def __init__(self, year: int, keywords, max_cache: int = 1000000) -> None:
+        self.year = year
+        self.keywords = keywords
+        self.max_cache = max_cache
+        self.verdicts: Dict[str, bool] = {}
+        self.always = len(keywords.rules) <= 0 and len(keywords.words) <= 0  # 没有规则就全过
+        words = sorted(set(word for rule in keywords.rules for word in rule if re.fullmatch(r"\w+", word)),
+                       key=len, reverse=True)
+        self.bits = {word: 1 << i for i, word in enumerate(words)}
+        self.rule_masks = []
+        for rule in keywords.rules:
+            if all(word in self.bits for word in rule):  # 含非\w字符的单词永远匹配不上，这条rule也就不可能匹配
+                mask = 0
+                for word in rule:
+                    mask |= self.bits[word]
+                self.rule_masks.append(mask)
+        self.regex = re.compile(r"(?<!\w)(?:%s)(?!\w)" % "|".join(re.escape(word) for word in words)) if words else None
+
+    def __getstate__(self) -> Dict:
+        state = self.__dict__.copy()
+        state['verdicts'] = {}  # 缓存不传给进程池
+        return state
+
+    def _match_mask(self, mask: int) -> bool:
+        for rule_mask in self.rule_masks:
+            if mask & rule_mask == rule_mask:
+                return True
+        return False
+
+    def match_batch(self, titles: List[Optional[str]], years: List[Optional[int]]) -> List[bool]:
+        if self.always:
+            return [year is None or year >= self.year for year in years]
+        masks = [0] * len(titles)
+        if self.regex is not None:
+            lowered = [(title or "").lower() for title in titles]  # lower()可能改变长度，例如'İ'，所以按lower之后的长度算偏移
+            starts, offset = [], 0
+            for title in lowered:
+                starts.append(offset)
+                offset += len(title) + 1
+            text = "\n".join(lowered)
+            for m in self.regex.finditer(text):
+                masks[bisect_right(starts, m.start()) - 1] |= self.bits[m.group()]
+        return [(year is None or year >= self.year) and self._match_mask(mask) for mask, year in zip(masks, years)]
+
+    def match_records(self, records: List[Dict]) -> List[bool]:
+        """records为含paperId、title和year的dict，未缓存的一次批量匹配"""
+        if self.max_cache <= 0:
+            return self.match_batch([r.get('title') for r in records], [r.get('year') for r in records])
+        # 返回本次调用读到和算出的结果，不再回读self.verdicts，其他线程可能已经把它清空了
+        results = [self.verdicts.get(r['paperId']) for r in records]
+        misses = [i for i, verdict in enumerate(results) if verdict is None]
+        if len(misses) > 0:
+            if len(self.verdicts) + len(misses) > self.max_cache:
+                self.verdicts.clear()
+            verdicts = self.match_batch([records[i].get('title') for i in misses],
+                                        [records[i].get('year') for i in misses])
+            for i, verdict in zip(misses, verdicts):
+                results[i] = verdict
+                self.verdicts[records[i]['paperId']] = verdict
+        return results
+
+    def __call__(self, title: Optional[str], year: Optional[int]) -> bool:
+        return self.match_batch([title], [year])[0]
+
+    def match_paper(self, paper) -> bool:
+        return self.match_records([{'paperId': paper.paperId(), 'title': paper.title(), 'year': paper.year()}])[0]
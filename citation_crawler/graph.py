@@ -1,14 +1,31 @@
 import abc
+import asyncio
 import logging
+import time
 from tqdm.asyncio import tqdm
-from typing import Tuple, Optional, AsyncIterable, List, Dict
+from typing import Tuple, Optional, AsyncIterable, Callable, List, Dict, Set
 import random
 from dblp_crawler.gather import gather
 from .items import Paper
+from .store import PaperStore, IdMap, IdSet
+from .priority import request_priority, PRIORITY_SEED
+from . import metrics, profiling
 
 
 logger = logging.getLogger("graph")
 
+init_paper_latency = metrics.histogram("crawler_init_paper_seconds", "Time to fetch a paper with its references and citations.")
+references_per_paper = metrics.histogram("crawler_references_per_paper", "New references found per paper.", metrics.count_buckets)
+citations_per_paper = metrics.histogram("crawler_citations_per_paper", "New citations found per paper.", metrics.count_buckets)
+papers_total = metrics.counter("crawler_papers_total", "Papers fetched by the crawler.")
+bfs_levels_total = metrics.counter("crawler_bfs_levels_total", "Finished BFS levels.")
+bfs_level_latency = metrics.histogram("crawler_bfs_level_seconds", "Time of each BFS level.", metrics.latency_buckets + (300, 1800, 3600, 21600))
+frontier_size = metrics.gauge("crawler_frontier_size", "Papers to be fetched in the current BFS level.")
+papers_known = metrics.gauge("crawler_papers_known", "Papers known by the crawler.")
+edges_pending = metrics.gauge("crawler_edges_pending", "References waiting for both ends to be written.")
+summarizer_latency = metrics.histogram("summarizer_call_seconds", "Time of each Summarizer call by method.")
+dedup_saved_total = metrics.counter("crawler_dedup_saved_total", "Fetches saved by merging papers known under another identifier.")
+
 
 class Summarizer(metaclass=abc.ABCMeta):
 
@@ -42,15 +59,168 @@ class Summarizer(metaclass=abc.ABCMeta):
     async def write_author(self, paper: Paper, author_kv: dict, write_fields: dict, division_kv: bool) -> None:
         pass
 
+    async def filter_paper_batch(self, papers: List[Paper]) -> List[Paper]:
+        """
+        filter_papers的批量版本，默认逐个交给filter_papers
+        子类可以覆盖它一次过滤一批论文
+        """
+        async def iterate():
+            for paper in papers:
+                yield paper
+        return [paper async for paper in self.filter_papers(iterate())]
+
+    async def write_papers(self, papers: List[Paper]) -> None:
+        """write_paper的批量版本，默认逐个调用write_paper"""
+        for paper in papers:
+            await self.write_paper(paper)
+
+    async def write_references(self, references: List[Tuple[Paper, Paper]]) -> None:
+        """write_reference的批量版本，references为(paper, reference)的list，默认逐个调用write_reference"""
+        for paper, reference in references:
+            await self.write_reference(paper, reference)
+
+    async def write_authors(self, authors: List[Tuple[Paper, dict, dict, bool]]) -> None:
+        """write_author的批量版本，authors为(paper, author_kv, write_fields, division_kv)的list，默认逐个调用write_author"""
+        for paper, author_kv, write_fields, division_kv in authors:
+            await self.write_author(paper, author_kv, write_fields, division_kv)
+
+    async def finish_level(self) -> None:
+        """Crawler.bfs_once每写完一层调用一次，默认什么也不做"""
+        pass
+
+    async def get_existing_citations(self, paper: Paper) -> Optional[set]:
+        """
+        title_hash of papers already written as citing this paper, None if unknown
+        用于增量更新时与新获取的引用比较
+        """
+        return None
+
+
+async def iter_paperIds(paperId_list: list) -> AsyncIterable[str]:
+    """展开paperId列表，其中的异步可迭代对象（例如init.stream_papers_in_neo4j）边读边产出"""
+    for paperId in paperId_list:
+        if hasattr(paperId, '__aiter__'):
+            async for pid in paperId:
+                yield pid
+            continue
+        yield paperId
+
+
+class PaperIndex:
+    """
+    paperId、DOI、DBLP key和title_hash到paperId的索引，同一篇论文不管以哪个标识出现都能找到最先登记的paperId
+    与Neo4jSummarizer一样认为title_hash相同的就是同一篇论文，但只在两边DOI都没有或者相同时才按title_hash合并
+    超出内存预算（CITATION_CRAWLER_MAX_PAPERS_IN_MEMORY）后与PaperStore一样移到磁盘
+    """
+
+    def __init__(self, max_items: Optional[int] = None) -> None:
+        self.index = IdMap("index", max_items)
+
+    @staticmethod
+    def id_key(paperId: str) -> Tuple[str, str]:
+        """`DOI:xxx`和`DBLP:xxx`形式的paperId按DOI和DBLP key查找"""
+        paperId = paperId.lower()
+        for prefix, kind in (("doi:", "doi"), ("dblp:", "dblp")):
+            if paperId.startswith(prefix):
+                return kind, paperId[len(prefix):]
+        return "paperId", paperId
+
+    @staticmethod
+    def keys(paper: Paper) -> List[Tuple[str, str]]:
+        keys = [("paperId", paper.paperId().lower())]
+        if paper.doi():
+            keys.append(("doi", paper.doi().lower()))
+        if paper.dblp_id():
+            keys.append(("dblp", paper.dblp_id().lower()))
+        if paper.title():
+            h = paper.title_hash()
+            if h:  # DOI不同的同名论文（例如会议版和期刊版）不合并
+                keys.append(("title_hash", h + " " + (paper.doi() or "").lower()))
+        return keys
+
+    @staticmethod
+    def _key(key: Tuple[str, str]) -> str:
+        return "%s:%s" % key
+
+    def add_id(self, paperId: str) -> str:
+        return self.index.setdefault(self._key(self.id_key(paperId)), paperId)
+
+    def find_id(self, paperId: str) -> Optional[str]:
+        return self.index.get(self._key(self.id_key(paperId)))
+
+    def find(self, paper: Paper) -> Optional[str]:
+        for key in self.keys(paper):
+            paperId = self.index.get(self._key(key))
+            if paperId is not None:
+                return paperId
+        return None
+
+    def add(self, paper: Paper, paperId: Optional[str] = None) -> str:
+        """把paper的所有标识登记到paperId（默认为已登记的paperId或paper自己的paperId），返回该paperId"""
+        if paperId is None:
+            paperId = self.find(paper) or paper.paperId()
+        for key in self.keys(paper):
+            self.index.setdefault(self._key(key), paperId)
+        return paperId
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+
+class PendingReferences:
+    """
+    还没写入的引用(paperId, referenceId)，两个方向都有索引，按写入的论文取出时不用遍历所有引用
+    两端都已处理过（写入或被Summarizer过滤掉）的引用不会再写入，由prune删除，所以只留下一端还在frontier上的引用
+    """
+
+    def __init__(self) -> None:
+        self.references: Dict[str, Set[str]] = {}
+        self.citations: Dict[str, Set[str]] = {}
+        self.count = 0
+
+    def add(self, paperId: str, referenceId: str) -> None:
+        refs = self.references.setdefault(paperId, set())
+        if referenceId not in refs:
+            refs.add(referenceId)
+            self.citations.setdefault(referenceId, set()).add(paperId)
+            self.count += 1
+
+    def remove(self, paperId: str, referenceId: str) -> None:
+        for index, a, b in ((self.references, paperId, referenceId), (self.citations, referenceId, paperId)):
+            ids = index[a]
+            ids.remove(b)
+            if len(ids) <= 0:
+                del index[a]
+        self.count -= 1
+
+    def related(self, paperId: str) -> List[Tuple[str, str]]:
+        """与paperId相关的引用"""
+        return list(set((paperId, referenceId) for referenceId in self.references.get(paperId, ())) |
+                    set((citationId, paperId) for citationId in self.citations.get(paperId, ())))
+
+    def prune(self, done: Callable[[str], bool]) -> int:
+        """删除两端都done的引用，返回删除的数量"""
+        pruned = [(paperId, referenceId) for paperId, refs in self.references.items() if done(paperId)
+                  for referenceId in refs if done(referenceId)]
+        for paperId, referenceId in pruned:
+            self.remove(paperId, referenceId)
+        return len(pruned)
+
+    def __len__(self) -> int:
+        return self.count
+
 
 class Crawler(metaclass=abc.ABCMeta):
     def __init__(self, summarizer: Summarizer, paperId_list: List[str]) -> None:
         self.summarizer = summarizer
         self._init_paper_list = paperId_list
-        self.papers: Dict[str, Paper] = {}
-        self.fetched = set()
-        self.ref_idx: Dict[str, set[str]] = {}
+        self.papers: Dict[str, Paper] = PaperStore()  # 已写入的论文超出内存预算后移到磁盘
+        self.fetched = IdSet("fetched")  # 已fetch的论文，与papers共用内存预算
+        self.ref_idx = PendingReferences()
         self.inited = False
+        self.index = PaperIndex()
+        self.dedup_saved = 0  # 因为已知同一篇论文的其他标识而省下的fetch数
+        self.write_batch_size = 64  # bfs_once每攒够这么多篇论文就按批量接口写入一次
 
     @abc.abstractmethod
     async def get_init_paperIds(self) -> AsyncIterable[str]:
@@ -91,63 +261,173 @@ class Crawler(metaclass=abc.ABCMeta):
         async for author in authors:
             yield author, author
 
+    async def filter_paper_batch(self, papers: List[Paper]) -> List[Paper]:
+        """
+        filter_papers的批量版本，默认逐个交给filter_papers
+        子类可以覆盖它一次过滤一批论文
+        """
+        async def iterate():
+            for paper in papers:
+                yield paper
+        return [paper async for paper in self.filter_papers(iterate())]
+
+    async def match_authors_batch(self, papers: List[Paper]) -> List[Tuple[Paper, dict, dict, bool]]:
+        """
+        对每篇论文调用Summarizer.get_corrlated_authors和match_authors
+        返回可以直接交给Summarizer.write_authors的list
+        """
+        authors = []
+        for paper in papers:
+            async for author_kv, write_fields, division_kv in self.match_authors(paper, self.summarizer.get_corrlated_authors(paper)):
+                authors.append((paper, author_kv, write_fields, division_kv))
+        return authors
+
+    async def write_batch(self, papers: List[Paper], references: Optional[List[Tuple[Paper, Paper]]] = None) -> List[Paper]:
+        """
+        按Summarizer的批量接口写入论文、作者和引用，返回通过Summarizer过滤的论文
+        references为None时写入ref_idx中与通过过滤的论文相关的引用
+        """
+        summarizer = self.summarizer
+        papers = await summarizer.filter_paper_batch(papers)
+        if references is None:
+            references = self._pop_references(set(paper.paperId() for paper in papers))
+        if len(papers) > 0:
+            with summarizer_latency.time(method="write_papers"):
+                await summarizer.write_papers(papers)
+            authors = await self.match_authors_batch(papers)
+            if len(authors) > 0:
+                with summarizer_latency.time(method="write_authors"):
+                    await summarizer.write_authors(authors)
+        if len(references) > 0:
+            with summarizer_latency.time(method="write_references"):
+                await summarizer.write_references(references)
+        return papers
+
+    async def _collect(self, papers: AsyncIterable[Paper]) -> List[Paper]:
+        """收集get_references或get_citations的结果，再一次过滤"""
+        return await self.filter_paper_batch([paper async for paper in papers if paper])
+
+    def _dedup_saved(self, source: str) -> None:
+        self.dedup_saved += 1
+        dedup_saved_total.inc(source=source)
+
+    def _merge_paper(self, paper: Paper, source: str) -> str:
+        """把引文登记到索引，返回它在self.papers中应使用的paperId，以其他标识已知的论文不会再被fetch"""
+        new_alias = self.index.find_id(paper.paperId()) is None
+        paperId = self.index.add(paper)
+        if new_alias and paperId != paper.paperId():  # 只在这个标识第一次并入已知论文时计数，重复出现不算
+            self._dedup_saved(source)
+        return paperId
+
+    async def citations_expired(self, paperId: str) -> bool:
+        """增量更新时判断引用该论文的论文列表是否需要重新获取，默认总是重新获取"""
+        return True
+
+    async def get_cached_citations(self, paperId: str) -> Optional[List[str]]:
+        """增量更新时重新获取之前已知的引用该论文的paperId，None表示未知"""
+        return None
+
     async def init_paper(self, paperId) -> Tuple[Optional[Paper], int]:
+        start = time.perf_counter()
         # fetch论文
         if paperId not in self.papers:  # init时self.papers里肯定没有数据
+            known = self.index.find_id(paperId)
+            if known is not None and known != paperId and known in self.fetched:
+                self._dedup_saved("init")  # 换个标识的同一篇论文已经fetch过
+                return None, 0
             paper = await self.get_paper(paperId)
             if not isinstance(paper, Paper):
                 return None, 0
-            paperId = paper.paperId()
+            known = self.index.add(paper)
+            if known != paperId and known in self.fetched:
+                self._dedup_saved("init")  # 例如DOI:xxx和大小写不同的paperId
+                return None, 0
+            self.fetched.add(known)
+            if known != paper.paperId():  # 已经作为其他paperId的引文出现过，沿用之前的paperId
+                paper = self.papers[known]
         else:  # init之后的文章肯定作为references或citations已经下载过了
             paper = self.papers[paperId]
-            paperId = paper.paperId()
+        paperId = paper.paperId()
         self.papers[paperId] = paper
 
         # fetch references
         refs, cits = 0, 0
-        async for new_paper in self.filter_papers(self.get_references(paper)):
-            if not new_paper:
-                continue
-            new_paperId = new_paper.paperId()
-            if paperId not in self.ref_idx:
-                self.ref_idx[paperId] = set()
-            self.ref_idx[paperId].add(new_paperId)
-            if new_paperId not in self.papers or not self.papers[new_paperId]:
+        for new_paper in await self._collect(self.get_references(paper)):
+            new_paperId = self._merge_paper(new_paper, "reference")
+            self.ref_idx.add(paperId, new_paperId)
+            if new_paperId not in self.papers:
                 self.papers[new_paperId] = new_paper
                 refs += 1
 
         # fetch citations
-        async for new_paper in self.filter_papers(self.get_citations(paper)):
-            if not new_paper:
-                continue
-            new_paperId = new_paper.paperId()
-            if new_paperId not in self.ref_idx:
-                self.ref_idx[new_paperId] = set()
-            self.ref_idx[new_paperId].add(paperId)
-            if new_paperId not in self.papers or not self.papers[new_paperId]:
+        for new_paper in await self._collect(self.get_citations(paper)):
+            new_paperId = self._merge_paper(new_paper, "citation")
+            self.ref_idx.add(new_paperId, paperId)
+            if new_paperId not in self.papers:
                 self.papers[new_paperId] = new_paper
                 cits += 1
 
         logger.info("There are %s refernces and %s citations in %s" % (refs, cits, paperId))
+        init_paper_latency.observe(time.perf_counter() - start)
+        profiling.record_paper(paperId, time.perf_counter() - start)
+        references_per_paper.observe(refs)
+        citations_per_paper.observe(cits)
+        papers_total.inc()
         return paper, refs + cits
 
+    async def _iter_init_paperIds(self) -> AsyncIterable[str]:
+        async for paperId in iter_paperIds(self._init_paper_list):
+            yield paperId
+        async for paperId in self.get_init_paperIds():
+            yield paperId
+
     async def _init_papers(self):
+        # 边读取初始paperId边开始fetch，不等读完
+        results = asyncio.Queue()
         tasks = []
-        for paperId in self._init_paper_list:
-            if paperId in self.fetched:
-                continue
-            self.fetched.add(paperId)
-            logger.info("Init paper: %s" % paperId)
-            tasks.append(self.init_paper(paperId))
-        async for paperId in self.get_init_paperIds():
-            if paperId in self.fetched:
-                continue
-            self.fetched.add(paperId)
-            logger.info("Init paper: %s" % paperId)
-            tasks.append(self.init_paper(paperId))
-        random.shuffle(tasks)
-        async for paper, news in tqdm(gather(*tasks), desc="Writing init papers", total=len(tasks)):
-            yield paper, news
+
+        async def task(paperId):
+            request_priority.set(PRIORITY_SEED)  # 初始论文的请求优先
+            try:
+                await results.put(await self.init_paper(paperId))
+            except Exception as e:
+                await results.put(e)
+
+        async def produce():
+            request_priority.set(PRIORITY_SEED)
+            try:
+                async for paperId in self._iter_init_paperIds():
+                    if paperId in self.fetched:
+                        continue
+                    self.fetched.add(paperId)
+                    logger.info("Init paper: %s" % paperId)
+                    tasks.append(asyncio.ensure_future(task(paperId)))
+            finally:
+                await results.put(None)
+
+        producer = asyncio.ensure_future(produce())
+        done, produced = 0, False
+        try:
+            with tqdm(desc="Writing init papers") as bar:
+                while not produced or done < len(tasks):
+                    result = await results.get()
+                    if result is None:
+                        produced = True
+                        bar.total = len(tasks)
+                        bar.refresh()
+                        continue
+                    done += 1
+                    bar.update()
+                    if isinstance(result, Exception):
+                        raise result
+                    yield result
+            await producer
+        except BaseException:
+            # 出错时先取消并等待其他任务结束，再抛出第一个异常
+            for t in [producer, *tasks]:
+                t.cancel()
+            await asyncio.gather(producer, *tasks, return_exceptions=True)
+            raise
 
     async def _bfs_once(self):
         # 初始化
@@ -159,12 +439,14 @@ class Crawler(metaclass=abc.ABCMeta):
 
         # 构造待fetch论文列表
         paperIds = []
-        for paperId in list(self.papers.keys()):
+        for paperId in self.papers.in_memory():  # 还没fetch的论文不会被移到磁盘
             if paperId in self.fetched:
                 continue
             self.fetched.add(paperId)
             paperIds.append(paperId)
             logger.info("Fetch paper: %s" % paperId)
+        frontier_size.set(len(paperIds))
+        papers_known.set(len(self.papers))
 
         # 执行fetch论文
         tasks = [self.init_paper(paperId) for paperId in paperIds]
@@ -173,25 +455,49 @@ class Crawler(metaclass=abc.ABCMeta):
             if isinstance(paper, Paper):
                 yield paper, news
 
+    def _pop_references(self, paperIds: set) -> List[Tuple[Paper, Paper]]:
+        """取出与paperIds相关、两端都已知的引用，从ref_idx中删除"""
+        references = []
+        for related in paperIds:
+            # _bfs_once里面出来的paper不能保证引文全部已获取到
+            for paperId, ref_paperId in self.ref_idx.related(related):
+                if not (paperId in self.papers and ref_paperId in self.papers):
+                    continue  # 只写入已入库的论文引文
+                references.append((self.papers[paperId], self.papers[ref_paperId]))
+                self.ref_idx.remove(paperId, ref_paperId)  # 删除已入库的论文引文
+        return references
+
+    async def _write_level_batch(self, batch: List[Tuple[Paper, int]]) -> Tuple[int, int]:
+        # _bfs_once里面出来的每个paper都是新的，所以直接写入
+        news = {paper.paperId(): n for paper, n in batch}
+        written = await self.write_batch([paper for paper, _ in batch])
+        for paper in written:
+            self.papers.mark_written(paper.paperId())
+        return len(written), sum(news.get(paper.paperId(), 0) for paper in written)
+
     async def bfs_once(self) -> None:
+        start = time.perf_counter()
+        level = profiling.start_level()
         total, total_news = 0, 0
-        async for paper, news in self.summarizer.filter_papers(self._bfs_once()):
-            total += 1
-            total_news += news
-            await self.summarizer.write_paper(paper)  # _bfs_once里面出来的每个paper都是新的，所以直接写入
-            async for author_kv, write_fields, division_kv in self.match_authors(paper, self.summarizer.get_corrlated_authors(paper)):
-                # _bfs_once里面出来的每个paper都是新的，所以直接写入
-                await self.summarizer.write_author(paper, author_kv, write_fields, division_kv)
-            for paperId, refs_paperId in list(self.ref_idx.items()):
-                # _bfs_once里面出来的paper不能保证引文全部已获取到
-                for ref_paperId in list(refs_paperId):
-                    if not (paperId == paper.paperId() or ref_paperId == paper.paperId()):
-                        continue  # 只写入相关的论文引文
-                    if not (paperId in self.papers and ref_paperId in self.papers):
-                        continue  # 只写入已入库的论文引文
-                    await self.summarizer.write_reference(self.papers[paperId], self.papers[ref_paperId])
-                    refs_paperId.remove(ref_paperId)  # 删除已入库的论文引文
-                    if len(refs_paperId) <= 0:
-                        del self.ref_idx[paperId]  # 删除已入库的论文引文
+        try:  # 出错时也要停止采样和cProfile
+            batch: List[Tuple[Paper, int]] = []
+            async for paper, news in self._bfs_once():
+                batch.append((paper, news))
+                if len(batch) >= self.write_batch_size:
+                    n, n_news = await self._write_level_batch(batch)
+                    total, total_news, batch = total + n, total_news + n_news, []
+            if len(batch) > 0:
+                n, n_news = await self._write_level_batch(batch)
+                total, total_news = total + n, total_news + n_news
+            with summarizer_latency.time(method="finish_level"):
+                await self.summarizer.finish_level()
+        finally:
+            profiling.finish_level(level, total_news)
+        self.ref_idx.prune(lambda paperId: paperId in self.fetched)  # 这一层的论文都已写入或被过滤掉了
+        edges_pending.set(len(self.ref_idx))
+        papers_known.set(len(self.papers))
+        bfs_levels_total.inc()
+        bfs_level_latency.observe(time.perf_counter() - start)
         logger.info("Fetched %d papers from %d papers" % (total_news, total))
+        logger.info("Dedup index has %d identifiers, %d fetches saved" % (len(self.index), self.dedup_saved))
         return total_news
@@ -1 +1,2 @@
-from .neo4j import papers_in_neo4j, authors_in_neo4j, papers_in_neo4j_keywords
\ No newline at end of file
+from .neo4j import papers_in_neo4j, authors_in_neo4j, papers_in_neo4j_keywords
+from .neo4j import stream_papers_in_neo4j, stream_authors_in_neo4j
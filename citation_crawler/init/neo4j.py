@@ -70,3 +70,109 @@ def papers_in_neo4j_keywords(uri, auth=None, year=2000, *keywords):
     with GraphDatabase.driver(uri, auth=auth) as driver:
         with driver.session() as session:
             return session.execute_read(match_papers_keywords, year, *keywords)
+
+
+def paper_to_paperId(paperId, doi):
+    if paperId is not None:
+        return paperId
+    elif doi is not None:
+        u = urlparse(doi)
+        return "DOI:" + re.sub(r"^/+", "", u.path)
+    return None
+
+
+def keywords_where(arg_keywords, ki=0):
+    """同match_papers_keywords，每个keyword参数中空格分隔的单词都要出现在title_hash中"""
+    k_or, values = [], {}
+    for keywords in arg_keywords:
+        k_and = []
+        for k in keywords.split(" "):
+            if not k:
+                continue
+            ki += 1
+            k_and.append(f"p.title_hash CONTAINS $keyword{ki}")
+            values[f"keyword{ki}"] = k
+        if len(k_and) > 0:
+            k_or.append(f"({' and '.join(k_and)})")
+    if len(k_or) <= 0:
+        return "", values
+    return f"({' OR '.join(k_or)})", values
+
+
+lucene_special_re = re.compile(r'([+\-&|!(){}\[\]^"~*?:\\/])')
+
+
+def keywords_lucene(arg_keywords, field="title"):
+    """把keyword参数变成全文索引的Lucene查询：参数之间OR，参数中空格分隔的单词之间AND"""
+    k_or = []
+    for keywords in arg_keywords:
+        k_and = [field + ":" + lucene_special_re.sub(r"\\\1", k) for k in keywords.split(" ") if k]
+        if len(k_and) > 0:
+            k_or.append(f"({' AND '.join(k_and)})")
+    return " OR ".join(k_or)
+
+
+async def match_papers_page(tx, after, batch, where, values):
+    result = await tx.run("MATCH (p:Publication) WHERE p.title_hash > $after" + where +
+                          " RETURN p.title_hash, p.paperId, p.doi ORDER BY p.title_hash LIMIT $batch",
+                          after=after, batch=batch, **values)
+    return await result.values()
+
+
+async def stream_papers_in_neo4j(uri, auth=None, year=None, *keywords, batch=10000, fulltext_index=None):
+    """
+    papers_in_neo4j和papers_in_neo4j_keywords的异步生成器版本，按title_hash分页（keyset pagination）读取，边读边输出
+    指定fulltext_index时用全文索引（例如`CREATE FULLTEXT INDEX publication_title_fulltext FOR (p:Publication) ON EACH [p.title]`）匹配keywords，
+    此时按单词而不是title_hash的子串匹配
+    """
+    from neo4j import AsyncGraphDatabase
+    async with AsyncGraphDatabase.driver(uri, auth=auth) as driver:
+        async with driver.session() as session:
+            if fulltext_index is not None and len(keywords) > 0:
+                query = "CALL db.index.fulltext.queryNodes($index, $query) YIELD node AS p"
+                if year is not None:
+                    query += " WHERE p.year >= $year"
+                result = await session.run(query + " RETURN p.paperId, p.doi",
+                                           index=fulltext_index, query=keywords_lucene(keywords), year=year)
+                async for record in result:
+                    paperId = paper_to_paperId(*record.values())
+                    if paperId is not None:
+                        yield paperId
+                return
+            where, values = keywords_where(keywords)
+            where = f" AND {where}" if where else ""
+            if year is not None:
+                where += " AND p.year >= $year"
+                values['year'] = year
+            after = ""
+            while True:
+                records = await session.execute_read(match_papers_page, after, batch, where, values)
+                for title_hash, paperId, doi in records:
+                    paperId = paper_to_paperId(paperId, doi)
+                    if paperId is not None:
+                        yield paperId
+                if len(records) < batch:
+                    break
+                after = records[-1][0]
+
+
+async def match_authors_page(tx, after, batch):
+    result = await tx.run("MATCH (p:Person) WHERE p.authorId > $after "
+                          "RETURN p.authorId ORDER BY p.authorId LIMIT $batch",
+                          after=after, batch=batch)
+    return await result.values()
+
+
+async def stream_authors_in_neo4j(uri, auth=None, batch=10000):
+    """authors_in_neo4j的异步生成器版本，按authorId分页读取，边读边输出"""
+    from neo4j import AsyncGraphDatabase
+    async with AsyncGraphDatabase.driver(uri, auth=auth) as driver:
+        async with driver.session() as session:
+            after = ""
+            while True:
+                records = await session.execute_read(match_authors_page, after, batch)
+                for (authorId,) in records:
+                    yield authorId
+                if len(records) < batch:
+                    break
+                after = records[-1][0]
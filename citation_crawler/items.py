@@ -2,10 +2,29 @@ import abc
 import re
 from typing import Optional, Iterable, Tuple
 from typing_extensions import Self
+import dateutil.parser
+
+title_hash_re = re.compile(r"[^0-9a-z\u4e00-\u9fa5]")
+
+
+def title_hash(title: str) -> str:
+    return title_hash_re.sub("", title.lower())
+
+
+def parse_date(date: Optional[str]) -> Optional[Tuple[int, int, int]]:
+    if not date:
+        return None
+    _date = dateutil.parser.parse(date)
+    return _date.year, _date.month, _date.day
 
 
 class Author(metaclass=abc.ABCMeta):
 
+    def __setstate__(self, state: dict) -> None:
+        # __dict__被定义成了方法，pickle默认的恢复方式不能用
+        for k, v in state.items():
+            setattr(self, k, v)
+
     @abc.abstractmethod
     def authorId(self) -> str:
         return ''
@@ -31,6 +50,11 @@ class Author(metaclass=abc.ABCMeta):
 
 class Paper(metaclass=abc.ABCMeta):
 
+    def __setstate__(self, state: dict) -> None:
+        # __dict__被定义成了方法，pickle默认的恢复方式不能用（例如PaperStore移到磁盘的论文）
+        for k, v in state.items():
+            setattr(self, k, v)
+
     @abc.abstractmethod
     def paperId(self) -> str:
         return ''
@@ -44,7 +68,7 @@ class Paper(metaclass=abc.ABCMeta):
         return None
 
     def title_hash(self) -> str:
-        return re.sub(r"[^0-9a-z\u4e00-\u9fa5]", "", self.title().lower())
+        return title_hash(self.title())
 
     @abc.abstractmethod
     def year(self) -> Optional[int]:
@@ -54,6 +78,10 @@ class Paper(metaclass=abc.ABCMeta):
     def date(self) -> Optional[str]:
         return None
 
+    def parsed_date(self) -> Optional[Tuple[int, int, int]]:
+        """(year, month, day) of self.date()"""
+        return parse_date(self.date())
+
     @abc.abstractmethod
     def doi(self) -> Optional[str]:
         return None
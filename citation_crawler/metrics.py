@@ -0,0 +1,217 @@
+import asyncio
+import bisect
+import json
+import logging
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger("metrics")
+
+'''Counters, gauges and histograms updated from the hot paths of crawlers and summarizers'''
+
+latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+count_buckets = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def labels_key(labels: Dict) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def labels_str(labels: Labels, extra: Labels = ()) -> str:
+    labels = labels + extra
+    if len(labels) <= 0:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (k, v.replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels)
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str = "") -> None:
+        self.name = name
+        self.help = help
+        self.values: Dict[Labels, float] = {}
+
+    def get(self, **labels) -> float:
+        return self.values.get(labels_key(labels), 0)
+
+    def samples(self) -> Iterable[Tuple[str, Labels, float]]:
+        for labels, value in self.values.items():
+            yield self.name, labels, value
+
+    def to_dict(self) -> Dict:
+        return {"type": self.type, "help": self.help, "values": [
+            {"labels": dict(labels), "value": value} for labels, value in self.values.items()
+        ]}
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, value: float = 1, **labels) -> None:
+        key = labels_key(labels)
+        self.values[key] = self.values.get(key, 0) + value
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        self.values[labels_key(labels)] = value
+
+    def inc(self, value: float = 1, **labels) -> None:
+        key = labels_key(labels)
+        self.values[key] = self.values.get(key, 0) + value
+
+    def dec(self, value: float = 1, **labels) -> None:
+        self.inc(-value, **labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str = "", buckets: Tuple[float, ...] = latency_buckets) -> None:
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+        self.counts: Dict[Labels, list] = {}
+        self.sums: Dict[Labels, float] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = labels_key(labels)
+        if key not in self.counts:
+            self.counts[key] = [0] * (len(self.buckets) + 1)
+            self.sums[key] = 0
+        self.counts[key][bisect.bisect_left(self.buckets, value)] += 1
+        self.sums[key] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        return sum(self.counts.get(labels_key(labels), []))
+
+    def sum(self, **labels) -> float:
+        return self.sums.get(labels_key(labels), 0)
+
+    def samples(self) -> Iterable[Tuple[str, Labels, float]]:
+        for labels, counts in self.counts.items():
+            cumulative = 0
+            for le, c in zip(list(self.buckets) + ["+Inf"], counts):
+                cumulative += c
+                yield self.name + "_bucket", labels + (("le", str(le)),), cumulative
+            yield self.name + "_sum", labels, self.sums[labels]
+            yield self.name + "_count", labels, cumulative
+
+    def to_dict(self) -> Dict:
+        return {"type": self.type, "help": self.help, "buckets": list(self.buckets), "values": [
+            {"labels": dict(labels), "count": sum(counts), "sum": self.sums[labels], "buckets": counts}
+            for labels, counts in self.counts.items()
+        ]}
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics: Dict[str, Metric] = {}
+
+    def _get(self, cls, name: str, *args, **kwargs):
+        if name not in self.metrics:
+            self.metrics[name] = cls(name, *args, **kwargs)
+        metric = self.metrics[name]
+        assert isinstance(metric, cls), f"Metric {name} is already registered as {metric.type}"
+        return metric
+
+    def counter(self, name: str, help: str = "") -> Counter:
+        return self._get(Counter, name, help)
+
+    def gauge(self, name: str, help: str = "") -> Gauge:
+        return self._get(Gauge, name, help)
+
+    def histogram(self, name: str, help: str = "", buckets: Tuple[float, ...] = latency_buckets) -> Histogram:
+        return self._get(Histogram, name, help, buckets)
+
+    def to_dict(self) -> Dict:
+        return {name: metric.to_dict() for name, metric in self.metrics.items()}
+
+    def to_prometheus(self) -> str:
+        lines = []
+        for name, metric in self.metrics.items():
+            if metric.help:
+                lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for sample_name, labels, value in metric.samples():
+                lines.append(f"{sample_name}{labels_str(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def counter(name: str, help: str = "") -> Counter:
+    return registry.counter(name, help)
+
+
+def gauge(name: str, help: str = "") -> Gauge:
+    return registry.gauge(name, help)
+
+
+def histogram(name: str, help: str = "", buckets: Tuple[float, ...] = latency_buckets) -> Histogram:
+    return registry.histogram(name, help, buckets)
+
+
+async def serve_metrics(host: str = "0.0.0.0", port: int = 9100):
+    """Prometheus风格的HTTP接口，返回AppRunner，用完需要cleanup"""
+    from aiohttp import web
+
+    async def handle_metrics(request):
+        return web.Response(text=registry.to_prometheus(), content_type="text/plain")
+
+    async def handle_json(request):
+        return web.json_response(registry.to_dict())
+
+    app = web.Application()
+    app.add_routes([web.get("/metrics", handle_metrics), web.get("/metrics.json", handle_json)])
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Serving metrics at http://%s:%d/metrics" % (host, port))
+    return runner
+
+
+def dump_metrics(path: str) -> None:
+    with open(path, 'w', encoding="utf8") as f:
+        json.dump({"time": time.time(), "metrics": registry.to_dict()}, f, indent=2)
+
+
+async def dump_metrics_periodically(path: str, interval: float = 60) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            dump_metrics(path)
+        except Exception as e:
+            logger.error("Cannot dump metrics to %s: %s" % (path, e))
+
+
+@asynccontextmanager
+async def exporting(port: Optional[int] = None, dump_path: Optional[str] = None, interval: float = 60):
+    """在运行期间开启HTTP接口和定时JSON输出，结束时再输出一次"""
+    runner, task = None, None
+    if port is not None:
+        runner = await serve_metrics(port=port)
+    if dump_path is not None:
+        task = asyncio.ensure_future(dump_metrics_periodically(dump_path, interval))
+    try:
+        yield registry
+    finally:
+        if task is not None:
+            task.cancel()
+            dump_metrics(dump_path)
+        if runner is not None:
+            await runner.cleanup()
@@ -0,0 +1,58 @@
+import asyncio
+import heapq
+import itertools
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+'''Priorities of HTTP requests, and a semaphore that wakes up waiters by priority'''
+
+PRIORITY_SEED = 0  # 初始论文
+PRIORITY_FRONTIER = 1  # 当前BFS层的论文
+PRIORITY_SPECULATIVE = 2  # 预取，例如作者详情
+
+request_priority: ContextVar[int] = ContextVar("request_priority", default=PRIORITY_FRONTIER)
+
+
+class PrioritySemaphore:
+    """
+    与asyncio.Semaphore相同，但有空位时先唤醒priority小的，priority相同时先到先得
+    priority默认取当前context的request_priority，由发起请求的task设置
+    """
+
+    def __init__(self, value: int = 1) -> None:
+        self._value = value  # 与asyncio.Semaphore相同，profiling用它计算利用率
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    def locked(self) -> bool:
+        return self._value <= 0
+
+    async def acquire(self, priority: Optional[int] = None) -> bool:
+        if self._value > 0 and len(self._waiters) <= 0:
+            self._value -= 1
+            return True
+        if priority is None:
+            priority = request_priority.get()
+        future = asyncio.get_event_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # 已经拿到空位才被取消，还回去
+            raise
+        return True
+
+    def release(self) -> None:
+        while len(self._waiters) > 0:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(True)  # 空位直接交给等待者，_value不变
+                return
+        self._value += 1
+
+    async def __aenter__(self) -> None:
+        await self.acquire()
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        self.release()
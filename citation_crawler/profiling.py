@@ -0,0 +1,173 @@
+import asyncio
+import cProfile
+import heapq
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from . import metrics
+
+logger = logging.getLogger("profiling")
+
+'''Opt-in per-BFS-level profiling report, built from metrics deltas plus a loop lag and semaphore sampler'''
+
+# (metric name, stage name)
+stage_metrics = [
+    ("download_http_wait_seconds", "http_wait"),
+    ("download_http_latency_seconds", "http"),
+    ("download_cache_read_seconds", "cache_read"),
+    ("download_cache_write_seconds", "cache_write"),
+    ("json_decode_seconds", "json_decode"),
+    ("crawler_filter_seconds_total", "filter"),
+    ("summarizer_call_seconds", "summarizer"),
+]
+
+semaphores: Dict[str, Tuple[asyncio.Semaphore, int]] = {}
+
+
+def watch_semaphore(name: str, sem: asyncio.Semaphore, capacity: int) -> None:
+    """登记需要统计利用率的Semaphore"""
+    semaphores[name] = (sem, capacity)
+
+
+def percentiles(values: List[float]) -> Dict:
+    if len(values) <= 0:
+        return {"samples": 0}
+    values = sorted(values)
+    def p(q): return values[min(len(values) - 1, int(q * len(values)))]
+    return {"samples": len(values), "mean": sum(values) / len(values),
+            "p50": p(0.5), "p90": p(0.9), "p99": p(0.99), "max": values[-1]}
+
+
+def stage_seconds() -> Dict[str, float]:
+    stages = {}
+    for name, stage in stage_metrics:
+        metric = metrics.registry.metrics.get(name)
+        if metric is None:
+            continue
+        if isinstance(metric, metrics.Histogram):
+            for labels, value in metric.sums.items():
+                key = stage + "".join(f".{v}" for k, v in labels if k in ("method",))
+                stages[key] = stages.get(key, 0) + value
+        else:
+            stages[stage] = stages.get(stage, 0) + sum(metric.values.values())
+    return stages
+
+
+class Level:
+    def __init__(self, profiler: "Profiler", index: int) -> None:
+        self.profiler = profiler
+        self.index = index
+        self.start = time.perf_counter()
+        self.stages = stage_seconds()
+        self.papers: List[Tuple[float, str]] = []
+        self.requests: List[Tuple[float, str]] = []
+        self.lags: List[float] = []
+        self.in_use: Dict[str, List[int]] = {name: [] for name in semaphores}
+        self.cprofile: Optional[cProfile.Profile] = None
+        self.sampler = asyncio.ensure_future(self.sample())
+        if index in profiler.cprofile_levels:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    def _top(self, heap: List[Tuple[float, str]], seconds: float, key: str) -> None:
+        if len(heap) < self.profiler.top:
+            heapq.heappush(heap, (seconds, key))
+        elif seconds > heap[0][0]:
+            heapq.heapreplace(heap, (seconds, key))
+
+    async def sample(self) -> None:
+        loop = asyncio.get_event_loop()
+        interval = self.profiler.interval
+        while True:
+            t = loop.time()
+            await asyncio.sleep(interval)
+            self.lags.append(max(0, loop.time() - t - interval))
+            for name, (sem, capacity) in semaphores.items():
+                self.in_use[name].append(capacity - sem._value)
+
+    def finish(self, news: int) -> Dict:
+        self.sampler.cancel()
+        report = {"level": self.index, "news": news, "wall_seconds": time.perf_counter() - self.start}
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            path = os.path.join(self.profiler.path, f"level-{self.index}.prof")
+            self.cprofile.dump_stats(path)
+            report["cprofile"] = path
+        stages = stage_seconds()
+        report["stages"] = {k: v - self.stages.get(k, 0) for k, v in stages.items() if v - self.stages.get(k, 0) > 0}
+        report["slowest_papers"] = [{"paperId": k, "seconds": s} for s, k in sorted(self.papers, reverse=True)]
+        report["slowest_requests"] = [{"url": k, "seconds": s} for s, k in sorted(self.requests, reverse=True)]
+        report["loop_lag"] = percentiles(self.lags)
+        report["concurrency"] = {}
+        for name, in_use in self.in_use.items():
+            capacity = semaphores[name][1]
+            mean = sum(in_use) / len(in_use) if len(in_use) > 0 else 0
+            report["concurrency"][name] = {"capacity": capacity, "mean_in_use": mean,
+                                           "max_in_use": max(in_use, default=0), "utilization": mean / capacity}
+        return report
+
+
+class Profiler:
+    def __init__(self, path: str, cprofile_levels: List[int] = [], top: int = 20, interval: float = 0.05) -> None:
+        self.path = path
+        self.cprofile_levels = set(cprofile_levels)
+        self.top = top
+        self.interval = interval
+        self.levels = 0
+        self.current: Optional[Level] = None
+
+    def start_level(self) -> Level:
+        self.current = Level(self, self.levels)
+        self.levels += 1
+        return self.current
+
+    def finish_level(self, level: Level, news: int) -> Dict:
+        report = level.finish(news)
+        if self.current is level:
+            self.current = None
+        os.makedirs(self.path, exist_ok=True)
+        path = os.path.join(self.path, f"level-{level.index}.json")
+        with open(path, 'w', encoding="utf8") as f:
+            json.dump(report, f, indent=2)
+        logger.info("Profiling report of level %d: %s" % (level.index, path))
+        return report
+
+
+profiler: Optional[Profiler] = None
+
+
+def enable(path: str, cprofile_levels: List[int] = [], **kwargs) -> Profiler:
+    global profiler
+    os.makedirs(path, exist_ok=True)
+    profiler = Profiler(path, cprofile_levels, **kwargs)
+    return profiler
+
+
+def disable() -> None:
+    global profiler
+    profiler = None
+
+
+def start_level() -> Optional[Level]:
+    if profiler is None:
+        return None
+    return profiler.start_level()
+
+
+def finish_level(level: Optional[Level], news: int) -> Optional[Dict]:
+    if level is None:
+        return None
+    return level.profiler.finish_level(level, news)
+
+
+def record_paper(paperId: str, seconds: float) -> None:
+    if profiler is not None and profiler.current is not None:
+        profiler.current._top(profiler.current.papers, seconds, paperId)
+
+
+def record_request(url: str, seconds: float) -> None:
+    if profiler is not None and profiler.current is not None:
+        profiler.current._top(profiler.current.requests, seconds, url)
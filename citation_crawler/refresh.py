@@ -0,0 +1,92 @@
+import logging
+from typing import List, Optional, Tuple
+
+from dblp_crawler.gather import gather
+
+from .graph import Crawler, PaperIndex, iter_paperIds
+from .items import Paper
+from . import metrics
+
+logger = logging.getLogger("refresh")
+
+'''Incremental refresh of papers already written, only stale citation pages are fetched again and only deltas are written'''
+
+refresh_pages_total = metrics.counter("refresh_citation_pages_total", "Citation pages checked by refresh, by result (fresh/stale/failed).")
+refresh_edges_total = metrics.counter("refresh_new_citations_total", "New citations found by refresh, by whether the citing paper is new.")
+
+
+class Refresher:
+    """
+    从已写入的论文（例如`init.papers_in_neo4j`的结果）出发，只重新获取缓存已过期的引用列表
+    与重新获取前的缓存（没有缓存时与`Summarizer.get_existing_citations`）比较，只写入新增的引用
+    新出现的论文交给`Crawler.bfs_once`，最多扩展depth层
+    """
+
+    def __init__(self, crawler: Crawler, paperId_list: List[str], depth: int = 1) -> None:
+        self.crawler = crawler
+        self.paperId_list = paperId_list
+        self.depth = depth
+        self.fresh, self.stale, self.new_citations, self.new_papers = 0, 0, 0, 0
+
+    async def refresh_paper(self, paperId: str) -> Tuple[Optional[Paper], int]:
+        crawler = self.crawler
+        kind, _ = PaperIndex.id_key(paperId)
+        if kind == "paperId" and not await crawler.citations_expired(paperId):
+            self.fresh += 1
+            refresh_pages_total.inc(result="fresh")
+            return None, 0
+        paper = await crawler.get_paper(paperId)  # 论文详情的缓存不过期，一般不会发出请求
+        if not isinstance(paper, Paper):
+            refresh_pages_total.inc(result="failed")
+            return None, 0
+        paperId = crawler.index.add(paper)
+        crawler.fetched.add(paperId)
+        if kind != "paperId" and not await crawler.citations_expired(paperId):  # DOI:xxx要先换成paperId
+            self.fresh += 1
+            refresh_pages_total.inc(result="fresh")
+            return None, 0
+        self.stale += 1
+        refresh_pages_total.inc(result="stale")
+
+        # 重新获取前的引用
+        old_paperIds = set(p.lower() for p in (await crawler.get_cached_citations(paperId) or []))
+        old_title_hashes = set()
+        if len(old_paperIds) <= 0:
+            old_title_hashes = await crawler.summarizer.get_existing_citations(paper) or set()
+
+        citations, news = 0, 0
+        for cit in await crawler._collect(crawler.get_citations(paper)):
+            if cit.paperId().lower() in old_paperIds or (cit.title() and cit.title_hash() in old_title_hashes):
+                continue
+            citId = crawler._merge_paper(cit, "citation")
+            if citId in crawler.fetched:  # 两端都已写入，直接写入引用
+                await crawler.summarizer.write_reference(crawler.papers.get(citId, cit), paper)
+                refresh_edges_total.inc(paper="existing")
+            else:  # 新论文交给bfs_once，写入论文时一起写入引用
+                crawler.papers[paperId] = paper
+                crawler.ref_idx.add(citId, paperId)
+                if citId not in crawler.papers:
+                    crawler.papers[citId] = cit
+                    news += 1
+                refresh_edges_total.inc(paper="new")
+            citations += 1
+        self.new_citations += citations
+        logger.info("There are %s new citations in %s, %s are new papers" % (citations, paperId, news))
+        return paper, news
+
+    async def run(self) -> int:
+        """返回新论文数"""
+        crawler = self.crawler
+        self.paperId_list = [paperId async for paperId in iter_paperIds(self.paperId_list)]
+        for paperId in self.paperId_list:
+            crawler.fetched.add(crawler.index.add_id(paperId))
+        crawler.inited = True  # 已写入的论文不再作为初始论文重新爬取
+        tasks = [self.refresh_paper(paperId) for paperId in self.paperId_list]
+        async for paper, news in gather(*tasks):
+            self.new_papers += news
+        logger.info("Refresh checked %d papers: %d citation pages are fresh, %d are stale, %d new citations, %d new papers" %
+                    (len(self.paperId_list), self.fresh, self.stale, self.new_citations, self.new_papers))
+        for _ in range(self.depth):
+            if await crawler.bfs_once() <= 0:
+                break
+        return self.new_papers
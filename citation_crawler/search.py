@@ -0,0 +1,137 @@
+import logging
+from typing import Dict, List, Optional, Set, Tuple
+
+from dblp_crawler.gather import gather
+
+from .graph import Crawler, Summarizer, summarizer_latency
+from .items import Paper
+from . import metrics
+
+logger = logging.getLogger("search")
+
+'''Bidirectional search of citation paths between two papers, without a full BFS'''
+
+search_expanded_total = metrics.counter("search_papers_expanded_total", "Papers expanded by path search, by direction (references/citations).")
+
+
+class PathSearch:
+    """
+    从source沿references向前、从target沿citations向后同时搜索，每次扩展较小的一侧，两侧相遇后停止
+    结果是source到target的所有最短引用路径（source引用...引用target）组成的子图
+    """
+
+    def __init__(self, crawler: Crawler, source: str, target: str, max_depth: int = 6, filtered: bool = False) -> None:
+        self.crawler = crawler
+        self.source = source
+        self.target = target
+        self.max_depth = max_depth
+        self.filtered = filtered  # 是否用Crawler.filter_papers过滤中间的论文
+        self.papers: Dict[str, Paper] = {}
+        self.dist: Tuple[Dict[str, int], Dict[str, int]] = ({}, {})
+        self.parents: Tuple[Dict[str, Set[str]], Dict[str, Set[str]]] = ({}, {})
+        self.frontiers: Tuple[Set[str], Set[str]] = (set(), set())
+        self.depths = [0, 0]
+        self.expanded = 0
+
+    async def _neighbours(self, paperId: str, forward: bool) -> Tuple[str, List[Paper]]:
+        paper = self.papers[paperId]
+        papers = self.crawler.get_references(paper) if forward else self.crawler.get_citations(paper)
+        neighbours = [new_paper async for new_paper in papers if new_paper]
+        if self.filtered:
+            neighbours = await self.crawler.filter_paper_batch(neighbours)
+        return paperId, neighbours
+
+    async def _expand(self, side: int) -> None:
+        forward = side == 0
+        dist, parents = self.dist[side], self.parents[side]
+        frontier = set()
+        tasks = [self._neighbours(paperId, forward) for paperId in self.frontiers[side]]
+        async for paperId, neighbours in gather(*tasks):
+            self.expanded += 1
+            search_expanded_total.inc(direction="references" if forward else "citations")
+            for new_paper in neighbours:
+                new_paperId = new_paper.paperId()
+                if new_paperId not in self.papers:
+                    self.papers[new_paperId] = new_paper
+                if new_paperId not in dist:
+                    dist[new_paperId] = dist[paperId] + 1
+                    frontier.add(new_paperId)
+                if dist[new_paperId] == dist[paperId] + 1:
+                    parents.setdefault(new_paperId, set()).add(paperId)
+        self.frontiers[side].clear()
+        self.frontiers[side].update(frontier)
+        self.depths[side] += 1
+        logger.info("Expanded %s to depth %d, %d papers in frontier" % (
+            "references" if forward else "citations", self.depths[side], len(frontier)))
+
+    def _meets(self) -> List[str]:
+        dist_f, dist_b = self.dist
+        meets = [paperId for paperId in dist_f if paperId in dist_b]
+        if len(meets) <= 0:
+            return []
+        best = min(dist_f[paperId] + dist_b[paperId] for paperId in meets)
+        return [paperId for paperId in meets if dist_f[paperId] + dist_b[paperId] == best]
+
+    def _subgraph(self, meets: List[str]) -> Set[Tuple[str, str]]:
+        """从相遇点沿两侧的parents回溯，得到所有最短路径上的引用(paper, reference)"""
+        edges = set()
+        for side in (0, 1):
+            parents, stack, visited = self.parents[side], list(meets), set(meets)
+            while len(stack) > 0:
+                paperId = stack.pop()
+                for parent in parents.get(paperId, []):
+                    edges.add((parent, paperId) if side == 0 else (paperId, parent))
+                    if parent not in visited:
+                        visited.add(parent)
+                        stack.append(parent)
+        return edges
+
+    async def search(self) -> Set[Tuple[str, str]]:
+        """返回source到target的所有最短路径上的引用，找不到时返回空集"""
+        for side, paperId in ((0, self.source), (1, self.target)):
+            paper = await self.crawler.get_paper(paperId)
+            if not isinstance(paper, Paper):
+                logger.error("Cannot get paper %s" % paperId)
+                return set()
+            self.papers[paper.paperId()] = paper
+            self.dist[side][paper.paperId()] = 0
+            self.frontiers[side].add(paper.paperId())
+        meets = self._meets()
+        while len(meets) <= 0 and sum(self.depths) < self.max_depth:
+            if len(self.frontiers[0]) <= 0 or len(self.frontiers[1]) <= 0:
+                break
+            await self._expand(0 if len(self.frontiers[0]) <= len(self.frontiers[1]) else 1)
+            meets = self._meets()
+        if len(meets) <= 0:
+            logger.info("No path from %s to %s within depth %d, expanded %d papers" % (
+                self.source, self.target, sum(self.depths), self.expanded))
+            return set()
+        edges = self._subgraph(meets)
+        logger.info("Found paths of length %d from %s to %s through %d papers, expanded %d papers" % (
+            self.dist[0][meets[0]] + self.dist[1][meets[0]], self.source, self.target, len(meets), self.expanded))
+        return edges
+
+    async def write(self, edges: Set[Tuple[str, str]], summarizer: Optional[Summarizer] = None) -> None:
+        """把子图写入summarizer（默认为Crawler.summarizer）"""
+        crawler = self.crawler
+        summarizer = summarizer or crawler.summarizer
+        paperIds = set()
+        for paperId, referenceId in edges:
+            paperIds.add(paperId)
+            paperIds.add(referenceId)
+        papers = await summarizer.filter_paper_batch([self.papers[paperId] for paperId in paperIds])
+        with summarizer_latency.time(method="write_papers"):
+            await summarizer.write_papers(papers)
+        authors = []
+        for paper in papers:
+            async for author_kv, write_fields, division_kv in crawler.match_authors(paper, summarizer.get_corrlated_authors(paper)):
+                authors.append((paper, author_kv, write_fields, division_kv))
+        with summarizer_latency.time(method="write_authors"):
+            await summarizer.write_authors(authors)
+        with summarizer_latency.time(method="write_references"):
+            await summarizer.write_references([(self.papers[paperId], self.papers[referenceId]) for paperId, referenceId in edges])
+
+    async def run(self) -> Set[Tuple[str, str]]:
+        edges = await self.search()
+        await self.write(edges)
+        return edges
@@ -0,0 +1,283 @@
+import logging
+import os
+import pickle
+import sqlite3
+import tempfile
+from collections import OrderedDict
+from collections.abc import MutableMapping, MutableSet
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .items import Paper
+from . import metrics
+
+logger = logging.getLogger("graph")
+
+'''Tiered storage of papers known by the crawler, written papers are spilled to an on-disk table'''
+
+papers_spilled = metrics.gauge("crawler_papers_spilled", "Papers spilled from memory to the on-disk paper store.")
+ids_spilled = metrics.gauge("crawler_ids_spilled", "Identifiers spilled from memory to on-disk crawler indexes, by index.")
+paper_store_loads_total = metrics.counter("crawler_paper_store_loads_total", "Papers loaded back from the on-disk paper store.")
+
+
+def getenv_max_papers() -> int:
+    value = os.getenv('CITATION_CRAWLER_MAX_PAPERS_IN_MEMORY')
+    try:
+        return int(value) if value else -1
+    except ValueError:
+        logger.error("Invalid CITATION_CRAWLER_MAX_PAPERS_IN_MEMORY: %s" % value)
+        return -1
+
+
+missing = object()
+
+
+def open_temporary_db(prefix: str) -> Tuple[sqlite3.Connection, str]:
+    """只在本进程内使用的SQLite临时文件，不需要日志和fsync"""
+    fd, path = tempfile.mkstemp(prefix=prefix, suffix=".sqlite")
+    os.close(fd)
+    db = sqlite3.connect(path)
+    db.execute("PRAGMA journal_mode=OFF")
+    db.execute("PRAGMA synchronous=OFF")
+    return db, path
+
+
+class PaperStore(MutableMapping):
+    """
+    代替Crawler.papers的dict，还没fetch或还没写入的论文（frontier和待写入的引用两端）一直在内存里
+    内存中的论文超过max_papers篇时，已写入的论文按写入顺序pickle到SQLite临时文件，之后按需读回
+    max_papers小于0时不限制，与dict相同；无法pickle的论文（例如持有文件句柄的）留在内存里
+    最近读回的cache篇论文缓存为同一个对象，更早读回的论文被挤出缓存后再读回是新的对象，
+    所以读回的论文只是写入时的快照，之后在上面设置的状态（例如预取的作者）不会保存
+    """
+
+    def __init__(self, max_papers: Optional[int] = None, path: Optional[str] = None, batch: int = 10000, cache: int = 1024) -> None:
+        self.max_papers = getenv_max_papers() if max_papers is None else max_papers
+        self.path = path
+        self.temporary = path is None
+        self.batch = batch
+        self.hot: Dict[str, Paper] = {}
+        self.written: Dict[str, None] = {}  # 已写入还在内存里的论文，按写入顺序
+        self.spilled = 0  # 磁盘上的论文数，paperId只存在SQLite里
+        self.cache = cache
+        self.loaded: OrderedDict = OrderedDict()  # 最近读回的论文
+        self.unpicklable = 0
+        self.db: Optional[sqlite3.Connection] = None
+
+    def _open(self) -> sqlite3.Connection:
+        if self.db is None:
+            if self.path is None:
+                self.db, self.path = open_temporary_db("citation_crawler_papers_")
+            else:
+                self.db = sqlite3.connect(self.path)
+                self.db.execute("PRAGMA journal_mode=OFF")
+                self.db.execute("PRAGMA synchronous=OFF")
+            self.db.execute("CREATE TABLE IF NOT EXISTS papers (paperId TEXT PRIMARY KEY, paper BLOB)")
+            logger.info("Spilling written papers to %s" % self.path)
+        return self.db
+
+    def __getitem__(self, paperId: str) -> Paper:
+        if paperId in self.hot:
+            return self.hot[paperId]
+        if paperId in self.loaded:
+            self.loaded.move_to_end(paperId)
+            return self.loaded[paperId]
+        row = None
+        if self.spilled > 0:
+            row = self.db.execute("SELECT paper FROM papers WHERE paperId=?", (paperId,)).fetchone()
+        if row is None:
+            raise KeyError(paperId)
+        paper_store_loads_total.inc()
+        paper = pickle.loads(row[0])
+        if self.cache > 0:
+            self.loaded[paperId] = paper
+            if len(self.loaded) > self.cache:
+                self.loaded.popitem(last=False)
+        return paper
+
+    def _unspill(self, paperId: str) -> bool:
+        """从磁盘上删除，返回是否在磁盘上"""
+        if paperId in self.hot or self.spilled <= 0:
+            return False
+        self.loaded.pop(paperId, None)
+        if self.db.execute("DELETE FROM papers WHERE paperId=?", (paperId,)).rowcount <= 0:
+            return False
+        self.spilled -= 1
+        papers_spilled.set(self.spilled)
+        return True
+
+    def __setitem__(self, paperId: str, paper: Paper) -> None:
+        self._unspill(paperId)
+        self.hot[paperId] = paper
+
+    def __delitem__(self, paperId: str) -> None:
+        if paperId in self.hot:
+            del self.hot[paperId]
+            self.written.pop(paperId, None)
+        elif not self._unspill(paperId):
+            raise KeyError(paperId)
+
+    def __contains__(self, paperId) -> bool:
+        if paperId in self.hot:
+            return True
+        return self.spilled > 0 and self.db.execute("SELECT 1 FROM papers WHERE paperId=?", (paperId,)).fetchone() is not None
+
+    def __iter__(self) -> Iterator[str]:
+        yield from list(self.hot.keys())
+        if self.spilled > 0:
+            yield from [paperId for paperId, in self.db.execute("SELECT paperId FROM papers")]
+
+    def __len__(self) -> int:
+        return len(self.hot) + self.spilled
+
+    def in_memory(self) -> List[str]:
+        """内存中论文的paperId，还没写入的论文都在这里"""
+        return list(self.hot.keys())
+
+    def mark_written(self, paperId: str) -> None:
+        """论文及其作者已写入summarizer，可以移出内存"""
+        if self.max_papers < 0 or paperId not in self.hot:
+            return
+        self.written[paperId] = None
+        if len(self.hot) > self.max_papers:
+            self.spill()
+
+    def spill(self) -> int:
+        """把最早写入的论文移到磁盘，直到内存中的论文不超过max_papers或没有可移出的论文"""
+        rows = []
+        n = max(len(self.hot) - self.max_papers, min(self.batch, len(self.written)))
+        for paperId in list(self.written.keys())[:n]:
+            del self.written[paperId]
+            try:
+                rows.append((paperId, pickle.dumps(self.hot[paperId], protocol=pickle.HIGHEST_PROTOCOL)))
+            except Exception as e:
+                log = logger.warning if self.unpicklable <= 0 else logger.debug  # 只警告一次
+                log("Cannot spill paper %s: %s" % (paperId, e))
+                self.unpicklable += 1
+        if len(rows) <= 0:
+            return 0
+        db = self._open()
+        db.executemany("INSERT OR REPLACE INTO papers VALUES (?, ?)", rows)
+        db.commit()
+        for paperId, _ in rows:
+            del self.hot[paperId]
+        self.spilled += len(rows)
+        papers_spilled.set(self.spilled)
+        return len(rows)
+
+    def close(self) -> None:
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+            if self.temporary:
+                os.remove(self.path)
+
+    def __del__(self) -> None:
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class IdMap(MutableMapping):
+    """
+    标识到str（或None）的映射，用于Crawler.fetched和PaperIndex这类每篇论文都有一项的索引
+    内存中超过max_items项后，最早加入的一半移到SQLite临时文件，之后内存中没有的再查表
+    max_items小于0时不限制，与dict相同
+    """
+
+    def __init__(self, name: str, max_items: Optional[int] = None) -> None:
+        self.name = name
+        self.max_items = getenv_max_papers() if max_items is None else max_items
+        self.hot: Dict[str, Optional[str]] = {}
+        self.spilled = 0
+        self.path: Optional[str] = None
+        self.db: Optional[sqlite3.Connection] = None
+
+    def _spilled_value(self, key: str):
+        """磁盘上的值，不在磁盘上时返回missing"""
+        if self.spilled <= 0:
+            return missing
+        row = self.db.execute("SELECT value FROM ids WHERE key=?", (key,)).fetchone()
+        return missing if row is None else row[0]
+
+    def __getitem__(self, key: str) -> Optional[str]:
+        if key in self.hot:
+            return self.hot[key]
+        value = self._spilled_value(key)
+        if value is missing:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Optional[str]) -> None:
+        if key not in self.hot and self.spilled > 0:
+            if self.db.execute("UPDATE ids SET value=? WHERE key=?", (value, key)).rowcount > 0:
+                return
+        self.hot[key] = value
+        if 0 <= self.max_items < len(self.hot):
+            self.spill()
+
+    def __delitem__(self, key: str) -> None:
+        if key in self.hot:
+            del self.hot[key]
+        elif self.spilled > 0 and self.db.execute("DELETE FROM ids WHERE key=?", (key,)).rowcount > 0:
+            self.spilled -= 1
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        return key in self.hot or self._spilled_value(key) is not missing
+
+    def __iter__(self) -> Iterator[str]:
+        yield from list(self.hot.keys())
+        if self.spilled > 0:
+            yield from [key for key, in self.db.execute("SELECT key FROM ids")]
+
+    def __len__(self) -> int:
+        return len(self.hot) + self.spilled
+
+    def spill(self) -> int:
+        """把最早加入的项移到磁盘，内存中只留下max_items的一半"""
+        keys = list(self.hot.keys())[:len(self.hot) - self.max_items // 2]
+        if self.db is None:
+            self.db, self.path = open_temporary_db(f"citation_crawler_{self.name}_")
+            self.db.execute("CREATE TABLE ids (key TEXT PRIMARY KEY, value TEXT)")
+            logger.info("Spilling %s to %s" % (self.name, self.path))
+        self.db.executemany("INSERT OR REPLACE INTO ids VALUES (?, ?)", [(key, self.hot.pop(key)) for key in keys])
+        self.db.commit()
+        self.spilled += len(keys)
+        ids_spilled.set(self.spilled, index=self.name)
+        return len(keys)
+
+    def close(self) -> None:
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+            os.remove(self.path)
+
+    def __del__(self) -> None:
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class IdSet(MutableSet):
+    """标识的集合，超出内存预算后与IdMap一样移到磁盘"""
+
+    def __init__(self, name: str, max_items: Optional[int] = None) -> None:
+        self.ids = IdMap(name, max_items)
+
+    def __contains__(self, key) -> bool:
+        return key in self.ids
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.ids)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, key: str) -> None:
+        self.ids[key] = None
+
+    def discard(self, key: str) -> None:
+        self.ids.pop(key, None)
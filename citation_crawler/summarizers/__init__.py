@@ -1,2 +1,4 @@
 from .neo4j import Neo4jSummarizer
-from .nx import NetworkxSummarizer
\ No newline at end of file
+from .nx import NetworkxSummarizer
+from .sqlite import SQLiteSummarizer
+from .rank import CitationMetricsSummarizer
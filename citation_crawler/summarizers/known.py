@@ -0,0 +1,98 @@
+import hashlib
+import logging
+import math
+from typing import List, Set, Tuple
+
+from citation_crawler import metrics
+
+logger = logging.getLogger("graph")
+
+'''Memory-bounded set of written edges, exact at first and a Bloom filter once it grows too large'''
+
+known_skips_total = metrics.counter("summarizer_known_skips_total", "Writes skipped because the edge is known to be written, by kind.")
+
+
+def hash64(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf8"), digest_size=8).digest(), "little")
+
+
+def pair_key(a: str, b: str) -> int:
+    """两个字符串的64位hash拼成一个128位整数"""
+    return (hash64(a) << 64) | hash64(b)
+
+
+class BloomFilter:
+    """能容纳capacity个元素、误判率为error_rate的Bloom filter，元素为pair_key得到的整数"""
+
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.bloom = bytearray((self.bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: int) -> Tuple[int, ...]:
+        h1, h2 = key >> 64, (key & 0xFFFFFFFFFFFFFFFF) | 1
+        return tuple((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def add(self, key: int) -> None:
+        for p in self._positions(key):
+            self.bloom[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def __contains__(self, key: int) -> bool:
+        return all(self.bloom[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+    def full(self) -> bool:
+        return self.count >= self.capacity
+
+
+class KnownSet:
+    """
+    已写入的边的集合，元素为pair_key得到的整数
+    元素数超过max_exact后转为能容纳bloom_capacity个元素的Bloom filter，装满后再加一个容量翻倍的，查询时查所有的
+    第n个Bloom filter的误判率为error_rate/2^n，所以总的误判率不超过error_rate
+    Bloom filter误判时会把没写入的边当作已写入，所以error_rate要足够小
+    """
+
+    def __init__(self, max_exact: int = 2000000, bloom_capacity: int = 20000000, error_rate: float = 1e-5) -> None:
+        self.max_exact = max_exact
+        self.bloom_capacity = bloom_capacity
+        self.error_rate = error_rate
+        self.exact: Set[int] = set()
+        self.blooms: List[BloomFilter] = []
+        self.count = 0
+
+    def _add_bloom(self, key: int) -> None:
+        if len(self.blooms) <= 0 or self.blooms[-1].full():
+            n = len(self.blooms)
+            bloom = BloomFilter(self.bloom_capacity * 2 ** n, self.error_rate / 2 ** (n + 1))
+            if n <= 0:
+                logger.info("Known set has %d keys, switching to a Bloom filter of %d bytes" % (self.count, len(bloom.bloom)))
+            else:
+                logger.warning("Known set has %d keys, more than the Bloom filter capacity %d, adding a Bloom filter of %d bytes" % (
+                    self.count, sum(b.capacity for b in self.blooms), len(bloom.bloom)))
+            self.blooms.append(bloom)
+        self.blooms[-1].add(key)
+
+    def add(self, key: int) -> None:
+        if key in self:
+            return
+        self.count += 1
+        if len(self.blooms) > 0:
+            self._add_bloom(key)
+            return
+        self.exact.add(key)
+        if len(self.exact) > self.max_exact:
+            keys, self.exact = self.exact, set()
+            for k in keys:
+                self._add_bloom(k)
+
+    def __contains__(self, key: int) -> bool:
+        if len(self.blooms) <= 0:
+            return key in self.exact
+        return any(key in bloom for bloom in self.blooms)
+
+    def __len__(self) -> int:
+        return self.count
@@ -1,8 +1,9 @@
+import json
 import logging
-from typing import AsyncIterable
+from typing import AsyncIterable, List, Optional, Tuple
 from citation_crawler import Summarizer, Paper
+from .known import KnownSet, known_skips_total, pair_key
 
-import dateutil.parser
 from neo4j import AsyncSession
 import neo4j.time
 
@@ -25,11 +26,11 @@ async def add_paper(tx, paper: Paper):
     date = None
     if paper.date():
         try:
-            _date = dateutil.parser.parse(paper.date())
+            year, month, day = paper.parsed_date()
             date = neo4j.time.Date(
-                year=_date.year,
-                month=_date.month,
-                day=_date.day,
+                year=year,
+                month=month,
+                day=day,
             )
             n4jset += ", p.date=$date"
         except Exception as e:
@@ -52,6 +53,21 @@ async def add_reference(tx, a: Paper, b: Paper):
                  a=a.title_hash(), b=b.title_hash())
 
 
+async def add_references(tx, pairs: List[Tuple[str, str]]):
+    await tx.run("UNWIND $pairs AS pair "
+                 "MATCH (a:Publication {title_hash: pair[0]}) "
+                 "MATCH (b:Publication {title_hash: pair[1]}) "
+                 "MERGE (a)-[:CITE]->(b)",
+                 pairs=[list(pair) for pair in pairs])
+
+
+async def set_metrics(tx, rows: List[dict]):
+    await tx.run("UNWIND $rows AS row "
+                 "MATCH (p:Publication {title_hash: row.title_hash}) "
+                 "SET p.citation_count=row.citation_count, p.reference_count=row.reference_count, p.pagerank=row.pagerank",
+                 rows=rows)
+
+
 async def match_corrlated_authors(tx, paper: Paper):
     nodes = []
     for record in await (await tx.run("MATCH (a:Person)-[:WRITE]->(p:Publication {title_hash: $title_hash}) return a",
@@ -90,45 +106,151 @@ async def divide_author(tx, paper: Paper, author_kv, write_fields, division_kv):
                  title_hash=paper.title_hash(), **write_fields)
 
 
-async def _add_references(tx, paper: Paper, skip_exists=True):
-    title_hash_exists = set([
-        title_hash for (title_hash,) in
-        await (await tx.run("MATCH (a:Publication)-[:CITE]->(p:Publication {title_hash: $title_hash}) RETURN a.title_hash",
-               title_hash=paper.title_hash())).values()
-    ])
+async def _add_references(tx, paper: Paper, skip_exists=True, known: Optional[KnownSet] = None) -> List[int]:
+    """返回写入的边的pair_key，事务提交后再加入known，重试时不会被跳过"""
+    title_hash_exists = set()
+    if skip_exists:
+        title_hash_exists = set([
+            title_hash for (title_hash,) in
+            await (await tx.run("MATCH (a:Publication)-[:CITE]->(p:Publication {title_hash: $title_hash}) RETURN a.title_hash",
+                   title_hash=paper.title_hash())).values()
+        ])
+    written = []
     async for ref in paper.get_references():
         if skip_exists and ref.title_hash() in title_hash_exists:
             continue
+        key = pair_key(paper.title_hash(), ref.title_hash())
+        if known is not None and key in known:
+            known_skips_total.inc(kind="cite")
+            continue
         await add_paper(tx, ref)
         await add_reference(tx, paper, ref)
+        written.append(key)
+    return written
 
 
-async def _add_citations(tx, paper: Paper, skip_exists=True):
-    title_hash_exists = set([
-        title_hash for (title_hash,) in
-        await (await tx.run("MATCH (p:Publication {title_hash: $title_hash})-[:CITE]->(a:Publication) RETURN a.title_hash",
-               title_hash=paper.title_hash())).values()
-    ])
+async def _add_citations(tx, paper: Paper, skip_exists=True, known: Optional[KnownSet] = None) -> List[int]:
+    title_hash_exists = set()
+    if skip_exists:
+        title_hash_exists = set([
+            title_hash for (title_hash,) in
+            await (await tx.run("MATCH (p:Publication {title_hash: $title_hash})-[:CITE]->(a:Publication) RETURN a.title_hash",
+                   title_hash=paper.title_hash())).values()
+        ])
+    written = []
     async for cit in paper.get_references():
         if skip_exists and cit.title_hash() in title_hash_exists:
             continue
+        key = pair_key(cit.title_hash(), paper.title_hash())
+        if known is not None and key in known:
+            known_skips_total.inc(kind="cite")
+            continue
         await add_paper(tx, cit)
         await add_reference(tx, cit, paper)
+        written.append(key)
+    return written
+
+
+async def match_citations(tx, paper: Paper):
+    return set([
+        title_hash for (title_hash,) in
+        await (await tx.run("MATCH (a:Publication)-[:CITE]->(p:Publication {title_hash: $title_hash}) RETURN a.title_hash",
+               title_hash=paper.title_hash())).values()
+    ])
+
+
+def link_keys(title_hash: str, author_kv: dict, write_fields: dict) -> List[int]:
+    """WRITE的key和作者每个属性的key，都已知时说明link_author不会改变数据库"""
+    author = json.dumps(author_kv, sort_keys=True, default=str)
+    return [pair_key(title_hash, author)] + \
+        [pair_key(author, json.dumps([k, v], default=str)) for k, v in sorted(write_fields.items())]
 
 
 class Neo4jSummarizer(Summarizer):
-    def __init__(self, session: AsyncSession, skip_exists=True, *args, **kwargs):
+    """
+    known_edges和known_links记录已写入的CITE和WRITE，重复的写入直接跳过，不访问数据库
+    prewarm从数据库一次读入所有CITE和WRITE，之后不再需要skip_exists的查询
+    WRITE按author_keys中的属性（即match_authors给出的author_kv）记录
+    """
+    author_keys = ("authorId", "dblp_pid")
+
+    def __init__(self, session: AsyncSession, skip_exists=True, *args, known: bool = True, **kwargs):
         super().__init__(*args, **kwargs)
         self.session = session
         self.skip_exists = skip_exists
+        self.known_edges: Optional[KnownSet] = KnownSet() if known else None
+        self.known_links: Optional[KnownSet] = KnownSet() if known else None
+        self.prewarmed = False
+
+    async def prewarm(self) -> int:
+        """流式读取数据库中所有的CITE和WRITE，返回读入的边数"""
+        if self.known_edges is None:
+            return 0
+        result = await self.session.run("MATCH (a:Publication)-[:CITE]->(b:Publication) RETURN a.title_hash, b.title_hash")
+        n = 0
+        async for record in result:
+            a, b = record.values()
+            if a is not None and b is not None:
+                self.known_edges.add(pair_key(a, b))
+                n += 1
+        self.prewarmed = True
+        logger.info("Prewarmed %d CITE edges from database" % n)
+        links = 0
+        result = await self.session.run("MATCH (a:Person)-[:WRITE]->(p:Publication) RETURN p.title_hash, properties(a)")
+        async for record in result:
+            title_hash, properties = record.values()
+            if title_hash is None:
+                continue
+            for k in self.author_keys:
+                if properties.get(k) is not None:
+                    write_fields = {f: v for f, v in properties.items() if f != k}
+                    for key in link_keys(title_hash, {k: properties[k]}, write_fields):
+                        self.known_links.add(key)
+            links += 1
+        logger.info("Prewarmed %d WRITE edges from database" % links)
+        return n + links
 
     async def write_paper(self, paper) -> None:
         await self.session.execute_write(add_paper, paper)
-        await self.session.execute_write(_add_references, paper, self.skip_exists)
-        await self.session.execute_write(_add_citations, paper, self.skip_exists)
+        skip_exists = self.skip_exists and not self.prewarmed  # 预读过的边都在known_edges里
+        for add in (_add_references, _add_citations):
+            written = await self.session.execute_write(add, paper, skip_exists, self.known_edges)
+            if self.known_edges is not None:
+                for key in written:
+                    self.known_edges.add(key)
 
     async def write_reference(self, paper, reference) -> None:
+        key = pair_key(paper.title_hash(), reference.title_hash())
+        if self.known_edges is not None and key in self.known_edges:
+            known_skips_total.inc(kind="cite")
+            return
         await self.session.execute_write(add_reference, paper, reference)
+        if self.known_edges is not None:
+            self.known_edges.add(key)
+
+    async def write_references(self, references: List[Tuple[Paper, Paper]]) -> None:
+        """所有引用在一个事务里用UNWIND一次写入"""
+        pairs, keys = [], set()
+        for paper, reference in references:
+            key = pair_key(paper.title_hash(), reference.title_hash())
+            if key in keys or (self.known_edges is not None and key in self.known_edges):
+                known_skips_total.inc(kind="cite")
+                continue
+            keys.add(key)
+            pairs.append((paper.title_hash(), reference.title_hash()))
+        if len(pairs) <= 0:
+            return
+        await self.session.execute_write(add_references, pairs)
+        if self.known_edges is not None:
+            for key in keys:
+                self.known_edges.add(key)
+
+    async def write_metrics(self, rows: List[dict]) -> None:
+        """在一个事务里用UNWIND写入CitationMetricsSummarizer的计算结果，rows中每项有title_hash和各指标"""
+        await self.session.execute_write(set_metrics, rows)
+
+    async def get_existing_citations(self, paper: Paper) -> set:
+        return await self.session.execute_read(match_citations, paper)
 
     async def get_corrlated_authors(self, paper: Paper) -> AsyncIterable[dict]:
         authors = set()
@@ -143,6 +265,14 @@ class Neo4jSummarizer(Summarizer):
                     authors.add(author["element_id"])
 
     async def write_author(self, paper: Paper, author_kv, write_fields, division_kv) -> None:
+        keys = []
         if division_kv:
             await self.session.execute_write(divide_author, paper, author_kv, write_fields, division_kv)
+        elif self.known_links is not None:  # WRITE已写入且作者的属性都相同时才跳过
+            keys = link_keys(paper.title_hash(), author_kv, write_fields)
+            if all(key in self.known_links for key in keys):
+                known_skips_total.inc(kind="write")
+                return
         await self.session.execute_write(link_author, paper, author_kv, write_fields)
+        for key in keys:
+            self.known_links.add(key)
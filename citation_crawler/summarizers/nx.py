@@ -1,5 +1,6 @@
 import logging
 import json
+from typing import Dict, Optional
 from citation_crawler import Summarizer
 
 
@@ -31,13 +32,16 @@ class NetworkxSummarizer(Summarizer):
         self.graph.add_node(reference.paperId(), paper=reference)
         self.graph.add_edge(paper.paperId(), reference.paperId())
 
-    async def save(self, jsonpath) -> None:
+    async def save(self, jsonpath, node_metrics: Optional[Dict[str, dict]] = None) -> None:
+        """node_metrics为paperId到附加字段的dict，例如CitationMetricsSummarizer的计算结果"""
         nodes = {}
         for k, d in self.graph.nodes(data=True):
             if k not in nodes:
                 nodes[k] = await d["paper"].__dict__()
             else:
                 nodes[k] = {**nodes[k], **await d["paper"].__dict__()}
+            if node_metrics is not None and k in node_metrics:
+                nodes[k].update(node_metrics[k])
         edges = [(u, v) for u, v in self.graph.edges()]
         with open(jsonpath, 'w', encoding="utf8") as f:
             json.dump(dict(nodes=nodes, edges=edges), f, indent=2)
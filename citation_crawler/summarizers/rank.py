@@ -0,0 +1,224 @@
+import json
+import logging
+import time
+from array import array
+from typing import AsyncIterable, Dict, List, Optional, Set, Tuple
+
+from citation_crawler import Summarizer, Paper
+from citation_crawler import metrics
+
+'''Citation counts and PageRank of the crawled subgraph, maintained while references are written'''
+
+logger = logging.getLogger("graph")
+
+rank_latency = metrics.histogram("summarizer_pagerank_seconds", "Time of each PageRank update.")
+rank_iterations = metrics.histogram("summarizer_pagerank_iterations", "Power iterations of each PageRank update.", metrics.count_buckets)
+
+
+class CitationGraph:
+    """
+    整数下标的引用图，paperId按出现顺序编号，边(paper, reference)只增不减
+    边存在两个array里（COO格式），需要时一次转成稀疏矩阵
+    """
+
+    def __init__(self) -> None:
+        self.index: Dict[str, int] = {}
+        self.paperIds: List[str] = []
+        self.title_hashes: List[Optional[str]] = []
+        self.src = array('q')  # 引用者
+        self.dst = array('q')  # 被引用者
+        self.edges: Set[int] = set()
+        self.in_degree = array('q')  # 被引数
+        self.out_degree = array('q')  # 引用数
+
+    def __len__(self) -> int:
+        return len(self.paperIds)
+
+    def node(self, paper: Paper) -> int:
+        paperId = paper.paperId()
+        if paperId not in self.index:
+            self.index[paperId] = len(self.paperIds)
+            self.paperIds.append(paperId)
+            self.title_hashes.append(paper.title_hash())
+            self.in_degree.append(0)
+            self.out_degree.append(0)
+        return self.index[paperId]
+
+    def add_edge(self, paper: Paper, reference: Paper) -> bool:
+        """添加引用，已有时返回False"""
+        i, j = self.node(paper), self.node(reference)
+        key = (i << 32) | j
+        if i == j or key in self.edges:
+            return False
+        self.edges.add(key)
+        self.src.append(i)
+        self.dst.append(j)
+        self.out_degree[i] += 1
+        self.in_degree[j] += 1
+        return True
+
+
+def pagerank_scipy(graph: CitationGraph, init: List[float], damping: float, tol: float, max_iter: int) -> Tuple[List[float], int]:
+    """用SciPy稀疏矩阵向量化地幂迭代，init为初值，返回结果和迭代次数"""
+    import numpy as np
+    from scipy import sparse
+    n = len(graph)
+    src = np.frombuffer(graph.src, dtype=np.int64)
+    dst = np.frombuffer(graph.dst, dtype=np.int64)
+    out_degree = np.frombuffer(graph.out_degree, dtype=np.int64)
+    matrix = sparse.csr_matrix((1.0 / out_degree[src], (dst, src)), shape=(n, n))
+    dangling = out_degree == 0
+    rank = np.asarray(init, dtype=np.float64)
+    rank /= rank.sum()
+    for i in range(1, max_iter + 1):
+        last = rank
+        rank = damping * (matrix @ last + last[dangling].sum() / n) + (1 - damping) / n
+        if np.abs(rank - last).sum() < n * tol:
+            break
+    return rank.tolist(), i
+
+
+def pagerank_python(graph: CitationGraph, init: List[float], damping: float, tol: float, max_iter: int) -> Tuple[List[float], int]:
+    """没有SciPy时的纯Python实现，结果与pagerank_scipy相同"""
+    n = len(graph)
+    out_degree = graph.out_degree
+    dangling = [k for k in range(n) if out_degree[k] == 0]
+    total = sum(init)
+    rank = [r / total for r in init]
+    for i in range(1, max_iter + 1):
+        last = rank
+        base = damping * sum(last[k] for k in dangling) / n + (1 - damping) / n
+        rank = [base] * n
+        for s, d in zip(graph.src, graph.dst):
+            rank[d] += damping * last[s] / out_degree[s]
+        if sum(abs(a - b) for a, b in zip(rank, last)) < n * tol:
+            break
+    return rank, i
+
+
+class CitationMetricsSummarizer(Summarizer):
+    """
+    记录写入的引用，计算每篇论文在已爬取子图中的被引数、引用数和PageRank
+    可以放在另一个summarizer前面，此时所有调用都转交给它
+    每个BFS层结束时以上一层的PageRank为初值继续迭代，新论文的初值为1/n，所以每层只需要几次迭代
+    安装了SciPy时用稀疏矩阵向量化计算，否则用纯Python计算
+    """
+
+    def __init__(self, summarizer: Optional[Summarizer] = None, damping: float = 0.85, tol: float = 1e-6, max_iter: int = 100) -> None:
+        super().__init__()
+        self.summarizer = summarizer
+        self.damping = damping
+        self.tol = tol
+        self.max_iter = max_iter
+        self.graph = CitationGraph()
+        self.rank: List[float] = []
+        self.ranked_edges = -1  # 计算rank时的边数，边数不变时不用重新计算
+
+    async def filter_papers(self, papers: AsyncIterable[Paper]) -> AsyncIterable[Paper]:
+        if self.summarizer is None:
+            async for paper in papers:
+                yield paper
+            return
+        async for paper in self.summarizer.filter_papers(papers):
+            yield paper
+
+    async def filter_paper_batch(self, papers: List[Paper]) -> List[Paper]:
+        if self.summarizer is None:
+            return papers
+        return await self.summarizer.filter_paper_batch(papers)
+
+    async def write_paper(self, paper: Paper) -> None:
+        self.graph.node(paper)
+        if self.summarizer is not None:
+            await self.summarizer.write_paper(paper)
+
+    async def write_papers(self, papers: List[Paper]) -> None:
+        for paper in papers:
+            self.graph.node(paper)
+        if self.summarizer is not None:
+            await self.summarizer.write_papers(papers)
+
+    async def write_reference(self, paper: Paper, reference: Paper) -> None:
+        self.graph.add_edge(paper, reference)
+        if self.summarizer is not None:
+            await self.summarizer.write_reference(paper, reference)
+
+    async def write_references(self, references: List[Tuple[Paper, Paper]]) -> None:
+        for paper, reference in references:
+            self.graph.add_edge(paper, reference)
+        if self.summarizer is not None:
+            await self.summarizer.write_references(references)
+
+    async def get_corrlated_authors(self, paper: Paper) -> AsyncIterable[dict]:
+        if self.summarizer is None:
+            return
+        async for author in self.summarizer.get_corrlated_authors(paper):
+            yield author
+
+    async def write_author(self, paper: Paper, author_kv: dict, write_fields: dict, division_kv: bool) -> None:
+        if self.summarizer is not None:
+            await self.summarizer.write_author(paper, author_kv, write_fields, division_kv)
+
+    async def write_authors(self, authors: List[Tuple[Paper, dict, dict, bool]]) -> None:
+        if self.summarizer is not None:
+            await self.summarizer.write_authors(authors)
+
+    async def get_existing_citations(self, paper: Paper) -> Optional[set]:
+        if self.summarizer is None:
+            return None
+        return await self.summarizer.get_existing_citations(paper)
+
+    async def finish_level(self) -> None:
+        self.update()
+        if self.summarizer is not None:
+            await self.summarizer.finish_level()
+
+    def update(self) -> List[float]:
+        """有新的论文或引用时以上次的结果为初值重新计算PageRank"""
+        n = len(self.graph)
+        if n <= 0 or (n == len(self.rank) and len(self.graph.src) == self.ranked_edges):
+            return self.rank
+        init = self.rank + [1.0 / n] * (n - len(self.rank))
+        start = time.perf_counter()
+        try:
+            self.rank, iterations = pagerank_scipy(self.graph, init, self.damping, self.tol, self.max_iter)
+        except ImportError:
+            self.rank, iterations = pagerank_python(self.graph, init, self.damping, self.tol, self.max_iter)
+        self.ranked_edges = len(self.graph.src)
+        rank_latency.observe(time.perf_counter() - start)
+        rank_iterations.observe(iterations)
+        logger.info("PageRank of %d papers and %d references converged in %d iterations" % (n, len(self.graph.src), iterations))
+        return self.rank
+
+    def node_metrics(self) -> Dict[str, dict]:
+        """paperId到被引数、引用数和PageRank的dict"""
+        rank = self.update()
+        graph = self.graph
+        return {
+            paperId: dict(citation_count=graph.in_degree[i], reference_count=graph.out_degree[i], pagerank=rank[i])
+            for i, paperId in enumerate(graph.paperIds)
+        }
+
+    async def write_metrics(self, batch_size: int = 10000) -> int:
+        """把结果按title_hash批量写回summarizer（需要有write_metrics方法，例如Neo4jSummarizer），返回写入的论文数"""
+        if self.summarizer is None or not hasattr(self.summarizer, "write_metrics"):
+            return 0
+        rank = self.update()
+        graph = self.graph
+        rows = [
+            dict(title_hash=graph.title_hashes[i], citation_count=graph.in_degree[i], reference_count=graph.out_degree[i], pagerank=rank[i])
+            for i in range(len(graph)) if graph.title_hashes[i]
+        ]
+        for k in range(0, len(rows), batch_size):
+            await self.summarizer.write_metrics(rows[k:k + batch_size])
+        logger.info("Wrote citation metrics of %d papers" % len(rows))
+        return len(rows)
+
+    async def save(self, jsonpath) -> None:
+        """交给summarizer的save（例如NetworkxSummarizer）并附上结果，没有时只输出结果和引用"""
+        if self.summarizer is not None and hasattr(self.summarizer, "save"):
+            await self.summarizer.save(jsonpath, node_metrics=self.node_metrics())
+            return
+        edges = [(self.graph.paperIds[s], self.graph.paperIds[d]) for s, d in zip(self.graph.src, self.graph.dst)]
+        with open(jsonpath, 'w', encoding="utf8") as f:
+            json.dump(dict(nodes=self.node_metrics(), edges=edges), f, indent=2)
@@ -0,0 +1,143 @@
+import json
+import logging
+import sqlite3
+from typing import Iterable, Optional, Tuple
+
+from citation_crawler import Summarizer, Paper, Author
+
+'''Write results into a SQLite file shared by several processes, then merge them into one Summarizer'''
+
+logger = logging.getLogger("graph")
+
+
+class DictAuthor(Author):
+    def __init__(self, data: dict) -> None:
+        super().__init__()
+        self.data = data
+
+    def authorId(self) -> str:
+        return self.data.get('authorId')
+
+    def name(self) -> Optional[str]:
+        return self.data.get('name')
+
+    def dblp_pid(self) -> Optional[str]:
+        return self.data.get('dblp_pid')
+
+    def __dict__(self) -> dict:
+        return self.data
+
+
+class DictPaper(Paper):
+    """由`Paper.__dict__()`的输出重建的`Paper`，没有引文信息"""
+
+    def __init__(self, data: dict) -> None:
+        super().__init__()
+        self.data = data
+
+    def paperId(self) -> str:
+        return self.data.get('paperId')
+
+    def dblp_id(self) -> Optional[str]:
+        return self.data.get('dblp_key')
+
+    def title(self) -> str:
+        return self.data.get('title')
+
+    def title_hash(self) -> str:
+        if 'title_hash' in self.data:
+            return self.data['title_hash']
+        return super().title_hash()
+
+    def year(self) -> Optional[int]:
+        return self.data.get('year')
+
+    def date(self) -> Optional[str]:
+        return self.data.get('date')
+
+    def doi(self) -> Optional[str]:
+        return self.data.get('doi')
+
+    def abstract(self) -> Optional[str]:
+        return self.data.get('abstract')
+
+    async def authors(self) -> Iterable[Author]:
+        for a in self.data.get('authors', []):
+            yield DictAuthor(a)
+
+    async def authors_kv(self) -> Iterable[Tuple[str, str]]:
+        async for author in self.authors():
+            if author.dblp_pid():
+                yield "dblp_pid", author.dblp_pid()
+            if author.authorId():
+                yield "authorId", author.authorId()
+
+    async def get_references(self) -> Iterable[Paper]:
+        for _ in []:
+            yield None
+
+    async def get_citations(self) -> Iterable[Paper]:
+        for _ in []:
+            yield None
+
+    async def __dict__(self) -> dict:
+        return self.data
+
+
+class SQLiteSummarizer(Summarizer):
+    def __init__(self, path: str, timeout: float = 60, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=timeout)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS papers (paperId TEXT PRIMARY KEY, data TEXT, written INTEGER)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS edges (paperId TEXT, referenceId TEXT, PRIMARY KEY (paperId, referenceId))")
+        self.conn.commit()
+
+    def _exists(self, paperId: str) -> bool:
+        return self.conn.execute("SELECT 1 FROM papers WHERE paperId=?", (paperId,)).fetchone() is not None
+
+    async def _add_paper(self, paper: Paper, written: bool) -> None:
+        if written:
+            data = json.dumps(await paper.__dict__())
+            with self.conn:
+                self.conn.execute("INSERT INTO papers VALUES (?, ?, 1) ON CONFLICT(paperId) DO UPDATE SET data=excluded.data, written=1",
+                                  (paper.paperId(), data))
+        elif not self._exists(paper.paperId()):
+            data = json.dumps(await paper.__dict__())
+            with self.conn:
+                self.conn.execute("INSERT OR IGNORE INTO papers VALUES (?, ?, 0)", (paper.paperId(), data))
+
+    async def write_paper(self, paper) -> None:
+        await self._add_paper(paper, True)
+
+    async def write_author(self, paper, author_dict, write_fields, division):
+        for _ in []:
+            yield None  # authors are written with papers
+
+    async def get_corrlated_authors(self, paper):
+        for _ in []:
+            yield None  # authors are written with papers
+
+    async def write_reference(self, paper, reference) -> None:
+        await self._add_paper(paper, False)
+        await self._add_paper(reference, False)
+        with self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO edges VALUES (?, ?)", (paper.paperId(), reference.paperId()))
+
+    async def merge(self, summarizer: Summarizer) -> None:
+        """把所有结果写入另一个`Summarizer`"""
+        for paperId, data, written in self.conn.execute("SELECT paperId, data, written FROM papers").fetchall():
+            if written:
+                await summarizer.write_paper(DictPaper(json.loads(data)))
+        papers = {}
+        for paperId, referenceId in self.conn.execute("SELECT paperId, referenceId FROM edges").fetchall():
+            for k in (paperId, referenceId):
+                if k not in papers:
+                    row = self.conn.execute("SELECT data FROM papers WHERE paperId=?", (k,)).fetchone()
+                    papers[k] = DictPaper(json.loads(row[0]))
+            await summarizer.write_reference(papers[paperId], papers[referenceId])
+        logger.info("Merged %s into %s" % (self.path, summarizer))
+
+    def close(self) -> None:
+        self.conn.close()
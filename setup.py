@@ -11,6 +11,8 @@ package_dir = {
     'citation_crawler.crawlers': 'citation_crawler/crawlers',
     'citation_crawler.summarizers': 'citation_crawler/summarizers',
     'citation_crawler.init': 'citation_crawler/init',
+    'citation_crawler.distributed': 'citation_crawler/distributed',
+    'citation_crawler.bench': 'citation_crawler/bench',
 }
 
 setup(
@@ -35,4 +37,7 @@ setup(
         'neo4j>=5.15.0',
         'typing-extensions'
     ],
+    extras_require={
+        'metrics': ['numpy', 'scipy'],
+    },
 )
@@ -0,0 +1,132 @@
+import asyncio
+import copy
+import os
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+import pytest
+
+from citation_crawler import Crawler, Summarizer, Paper
+from citation_crawler.bench.graph import SyntheticGraph
+from citation_crawler.crawlers.ss import SSPaper, normalize_paper
+
+
+class GraphCrawler(Crawler):
+    """直接从SyntheticGraph读取论文的Crawler，不发出任何请求，calls记录每个paperId被get_paper的次数"""
+
+    def __init__(self, graph: SyntheticGraph, summarizer: Summarizer, paperId_list: List[str]) -> None:
+        super().__init__(summarizer, paperId_list)
+        self.graph = graph
+        self.calls: Dict[str, int] = {}
+
+    def paper(self, i: int) -> SSPaper:
+        return SSPaper(normalize_paper(copy.deepcopy(self.graph.papers[i])))
+
+    async def get_init_paperIds(self):
+        for _ in []:
+            yield None
+
+    async def get_paper(self, paperId):
+        self.calls[paperId] = self.calls.get(paperId, 0) + 1
+        data = self.graph.get(paperId)
+        if data is None:
+            return None
+        return self.paper(self.graph.index[data["paperId"]])
+
+    async def get_references(self, paper):
+        for j in self.graph.references[self.graph.index[paper.paperId()]]:
+            yield self.paper(j)
+
+    async def get_citations(self, paper):
+        for j in self.graph.citations[self.graph.index[paper.paperId()]]:
+            yield self.paper(j)
+
+    async def filter_papers(self, papers):
+        async for paper in papers:
+            yield paper
+
+    async def match_authors(self, paper, authors):
+        async for author in authors:
+            yield author, author, False
+
+
+class RecordingSummarizer(Summarizer):
+    """记录写入的论文和引用"""
+
+    def __init__(self) -> None:
+        self.papers: Dict[str, Paper] = {}
+        self.references: Set[Tuple[str, str]] = set()
+
+    async def filter_papers(self, papers):
+        async for paper in papers:
+            yield paper
+
+    async def write_paper(self, paper) -> None:
+        self.papers[paper.paperId()] = paper
+
+    async def write_reference(self, paper, reference) -> None:
+        self.references.add((paper.paperId(), reference.paperId()))
+
+    async def get_corrlated_authors(self, paper):
+        for _ in []:
+            yield None
+
+    async def write_author(self, paper, author_kv, write_fields, division_kv) -> None:
+        pass
+
+
+@pytest.fixture
+def graph() -> SyntheticGraph:
+    return SyntheticGraph(size=200, seed=3)
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch) -> str:
+    """缓存目录换成临时目录，清空各模块中与缓存有关的全局状态"""
+    from citation_crawler.crawlers import common, ss
+    root = os.path.join(tmp_path, "save")
+    monkeypatch.setattr(common, "cache_root", root)
+    monkeypatch.setattr(common.negative_cache, "entries", {})
+    monkeypatch.setattr(common, "cache_dirs", {})
+    monkeypatch.setattr(ss, "paper_batchers", {})
+    monkeypatch.setattr(ss.author_batcher, "cache", {})
+    return root
+
+
+class MockAPI:
+    """在后台线程里运行bench的mock server，Semantic Scholar API在root下，OpenAlex API在root/openalex下"""
+
+    def __init__(self, graph: SyntheticGraph, latency: float = 0.0) -> None:
+        from aiohttp import web
+        from citation_crawler.bench.server import MockSemanticScholar, MockOpenAlex
+        self.mock = MockSemanticScholar(graph, latency)
+        app = self.mock.app()
+        app.add_subapp("/openalex", MockOpenAlex(self.mock).app())
+        self.loop = asyncio.new_event_loop()
+        self.runner = web.AppRunner(app)
+        self.loop.run_until_complete(self.runner.setup())
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        self.loop.run_until_complete(site.start())
+        self.root = "http://127.0.0.1:%d" % site._server.sockets[0].getsockname()[1]
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return self.mock.stats
+
+    def close(self) -> None:
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+@pytest.fixture
+def api(graph, cache, monkeypatch):
+    """crawlers.ss和crawlers.openalex改为请求mock server"""
+    from citation_crawler.crawlers import ss, openalex
+    server = MockAPI(graph)
+    monkeypatch.setattr(ss, "api_root", server.root)
+    monkeypatch.setattr(openalex, "api_root", server.root + "/openalex")
+    yield server
+    server.close()
@@ -0,0 +1,76 @@
+import asyncio
+import json
+import os
+import shutil
+
+from citation_crawler.crawlers import common
+from citation_crawler.crawlers.common import flush_cache, find_superset_cache
+from citation_crawler.crawlers.ss import get_paper, get_references, root_paper, root_references
+
+
+def run(coro):
+    async def main():
+        result = await coro
+        await flush_cache()
+        return result
+    return asyncio.run(main())
+
+
+async def collect(papers):
+    return [paper async for paper in papers]
+
+
+def rename_cache_dir(root: str, name: str) -> None:
+    """把缓存目录换成字段不同的目录，模拟改了字段之后的运行"""
+    shutil.move(os.path.join(common.cache_root, root), os.path.join(common.cache_root, name))
+    common.cache_dirs.clear()
+
+
+def test_superset_cache(graph, api):
+    paperId = graph.papers[0]["paperId"]
+    assert run(get_paper(paperId)).title() == graph.papers[0]["title"]
+    assert api.stats["paper"] == 1
+    rename_cache_dir(root_paper, root_paper + "-venue")  # 缓存的字段比需要的多
+    path = os.path.join(root_paper, paperId + ".json")
+    assert find_superset_cache(path, -1) == os.path.join(root_paper + "-venue", paperId + ".json")
+    assert run(get_paper(paperId)).title() == graph.papers[0]["title"]
+    assert api.stats["requests"] == 1
+
+
+def test_upgrade_paper_cache(graph, api):
+    paperIds = [graph.papers[i]["paperId"] for i in range(3)]
+    for paperId in paperIds:
+        run(get_paper(paperId))
+    old_root = root_paper.replace("-abstract", "")
+    rename_cache_dir(root_paper, old_root)  # 缓存缺少abstract
+    for paperId in paperIds:
+        with open(os.path.join(common.cache_root, old_root, paperId + ".json")) as f:
+            data = json.load(f)
+        data.pop("abstract", None)
+        with open(os.path.join(common.cache_root, old_root, paperId + ".json"), "w") as f:
+            json.dump(data, f)
+
+    async def get_papers():
+        return await asyncio.gather(*[get_paper(paperId) for paperId in paperIds])
+    papers = run(get_papers())
+    assert [paper.abstract() for paper in papers] == [graph.papers[i].get("abstract") for i in range(3)]
+    assert api.stats["paper"] == 3 and api.stats["paper_batch"] == 1  # 只用一次/paper/batch补上abstract
+    for paperId in paperIds:
+        assert os.path.isfile(os.path.join(common.cache_root, root_paper, paperId + ".json"))
+        assert not os.path.exists(os.path.join(common.cache_root, old_root, paperId + ".json"))  # 旧缓存移到了新目录
+
+    common.cache_dirs.clear()
+    run(get_papers())
+    assert api.stats["requests"] == 4
+
+
+def test_upgrade_list_cache(graph, api):
+    i = max(range(len(graph.papers)), key=lambda i: len(graph.references[i]))
+    paperId = graph.papers[i]["paperId"]
+    assert len(run(collect(get_references(paperId)))) == len(graph.references[i])
+    old_root = root_references.replace("-journal", "")
+    rename_cache_dir(root_references, old_root)
+    references = run(collect(get_references(paperId)))
+    assert sorted(paper.paperId() for paper in references) == sorted(graph.papers[j]["paperId"] for j in graph.references[i])
+    assert api.stats["references"] == 1 and api.stats["paper_batch"] == 1
+    assert os.path.isfile(os.path.join(common.cache_root, root_references, paperId.lower() + ".json"))
@@ -0,0 +1,112 @@
+import asyncio
+import time
+
+from citation_crawler.crawlers import SemanticScholarCrawler, OpenAlexCrawler, CompositeCrawler, Backend
+from citation_crawler.crawlers.common import flush_cache
+from citation_crawler.crawlers.composite import MergedPaper, accept_semanticscholar, accept_openalex
+
+from conftest import RecordingSummarizer
+
+
+class SSCrawler(SemanticScholarCrawler):
+    async def filter_papers(self, papers):
+        async for paper in papers:
+            yield paper
+
+
+class StandInCrawler(SSCrawler):
+    """请求mock server之前先等delay秒，fail为True时直接抛出异常，calls记录get_paper的次数"""
+
+    def __init__(self, *args, delay: float = 0, fail: bool = False, **kwargs) -> None:
+        super().__init__([], *args, **kwargs)
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    async def get_paper(self, paperId):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("backend is down")
+        return await super().get_paper(paperId)
+
+
+def composite(backends, **kwargs) -> CompositeCrawler:
+    return CompositeCrawler(backends, RecordingSummarizer(), [], **kwargs)
+
+
+def run(coro):
+    async def main():
+        result = await coro
+        await flush_cache()
+        return result
+    return asyncio.run(main())
+
+
+def test_merge_records_of_backends(graph, api):
+    summarizer = RecordingSummarizer()
+    crawler = composite([
+        Backend("ss", SSCrawler([], summarizer, []), accept_semanticscholar),
+        Backend("openalex", OpenAlexCrawler(summarizer, []), accept_openalex),
+    ])
+    data = graph.papers[0]
+
+    async def get():
+        by_doi = await crawler.get_paper("DOI:" + data["externalIds"]["DOI"])  # 只有OpenAlex接受DOI
+        by_id = await crawler.get_paper(data["paperId"])
+        references = [paper async for paper in crawler.get_references(by_id)]
+        return by_doi, by_id, references
+    by_doi, by_id, references = run(get())
+    assert isinstance(by_doi, MergedPaper) and by_id is by_doi  # DOI相同的是同一篇
+    assert set(by_id.records) == {"ss", "openalex"}
+    assert by_id.paperId() != data["paperId"]  # paperId是最先得到的OpenAlex记录的
+    assert by_id.title() == data["title"]
+    assert sorted(paper.title() for paper in references) == sorted(graph.papers[j]["title"] for j in graph.references[0])
+
+
+def test_failover_and_cooldown(graph, api):
+    summarizer = RecordingSummarizer()
+    broken = StandInCrawler(summarizer, [], fail=True)
+    crawler = composite([
+        Backend("broken", broken, max_failures=2, cooldown=0.3),
+        Backend("ss", StandInCrawler(summarizer, []), accept_semanticscholar),
+    ])
+    crawler.backends[0].latency = 0  # 先试broken
+
+    async def get(paperIds):
+        return [await crawler.get_paper(paperId) for paperId in paperIds]
+    paperIds = [graph.papers[i]["paperId"] for i in range(4)]
+    papers = run(get(paperIds[:3]))
+    assert [paper.paperId() for paper in papers] == paperIds[:3]  # 失败时换下一个
+    assert broken.calls == 2  # 连续失败max_failures次后不再尝试
+    assert not crawler.backends[0].healthy()
+
+    time.sleep(0.3)
+    assert crawler.backends[0].healthy()  # cooldown之后再试
+    broken.fail = False
+    assert run(get(paperIds[3:]))[0].paperId() == paperIds[3]
+    assert broken.calls == 3 and crawler.backends[0].failures == 0
+
+
+def test_hedge_slow_backend(graph, api):
+    summarizer = RecordingSummarizer()
+    slow = StandInCrawler(summarizer, [], delay=2)
+    fast = StandInCrawler(summarizer, [])
+    crawler = composite([Backend("slow", slow), Backend("fast", fast)], min_hedge_delay=0.01)
+    crawler.backends[0].latency, crawler.backends[1].latency = 0.01, 0.02  # slow排在前面，超过0.03秒就同时启动fast
+    start = time.perf_counter()
+    paper = run(crawler.get_paper(graph.papers[0]["paperId"]))
+    assert time.perf_counter() - start < 1.5
+    assert paper.paperId() == graph.papers[0]["paperId"] and set(paper.records) == {"fast"}
+    assert crawler.hedges == 1 and slow.calls == 1 and fast.calls == 1
+
+
+def test_hedge_budget(graph, api):
+    summarizer = RecordingSummarizer()
+    slow = StandInCrawler(summarizer, [], delay=0.3)
+    fast = StandInCrawler(summarizer, [])
+    crawler = composite([Backend("slow", slow), Backend("fast", fast)], min_hedge_delay=0.01, max_hedge_ratio=0)
+    crawler.backends[0].latency, crawler.backends[1].latency = 0.01, 0.02
+    paper = run(crawler.get_paper(graph.papers[0]["paperId"]))
+    assert set(paper.records) == {"slow"}  # 没有预算时等slow的结果
+    assert crawler.hedges == 0 and fast.calls == 0
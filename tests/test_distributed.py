@@ -0,0 +1,96 @@
+import asyncio
+import os
+import time
+
+from citation_crawler.distributed import SQLiteWorkQueue, DistributedWorker
+from citation_crawler.distributed.queue import get_shard
+
+from conftest import GraphCrawler, RecordingSummarizer
+
+
+def ids_of_shard(shard: int, shards: int, n: int):
+    ids, i = [], 0
+    while len(ids) < n:
+        paperId = "%040x" % i
+        if get_shard(paperId, shards) == shard:
+            ids.append(paperId)
+        i += 1
+    return ids
+
+
+def test_put_is_visited_set(tmp_path):
+    queue = SQLiteWorkQueue(os.path.join(tmp_path, "queue.sqlite3"))
+    assert queue.put(["A", "b"], 0) == 2
+    assert queue.put(["a", "B", "c"], 1) == 1  # 大小写不同的是同一篇
+    assert queue.pending() == 3
+    queue.done([paperId for paperId, _ in queue.claim("w", 0, 10)])
+    assert queue.put(["a"], 2) == 0  # 已处理过的不再加入
+    assert queue.pending() == 0
+
+
+def test_claim_own_shard_and_steal(tmp_path):
+    queue = SQLiteWorkQueue(os.path.join(tmp_path, "queue.sqlite3"), shards=2)
+    queue.put(ids_of_shard(0, 2, 3) + ids_of_shard(1, 2, 2), 0)
+    claimed = queue.claim("w0", 0, 10)
+    assert len(claimed) == 3 and all(get_shard(paperId, 2) == 0 for paperId, _ in claimed)
+    assert queue.claim("w0", 0, 10) == []
+    stolen = queue.claim("w0", 0, 10, steal=True)
+    assert len(stolen) == 2 and all(get_shard(paperId, 2) == 1 for paperId, _ in stolen)
+
+
+def test_claim_lower_level_first(tmp_path):
+    queue = SQLiteWorkQueue(os.path.join(tmp_path, "queue.sqlite3"))
+    queue.put(["deep"], 3)
+    queue.put(["shallow"], 1)
+    assert queue.claim("w", 0, 1) == [("shallow", 1)]
+
+
+def test_requeue_stale(tmp_path):
+    queue = SQLiteWorkQueue(os.path.join(tmp_path, "queue.sqlite3"))
+    queue.put(["a", "b"], 0)
+    assert len(queue.claim("dead", 0, 10)) == 2
+    assert queue.requeue_stale(60) == 0  # 还没超时
+    time.sleep(0.01)
+    assert queue.requeue_stale(0) == 2
+    assert sorted(queue.claim("alive", 0, 10)) == [("a", 0), ("b", 0)]
+
+
+def test_claim_abandoned_shard(tmp_path):
+    path = os.path.join(tmp_path, "queue.sqlite3")
+    queue = SQLiteWorkQueue(path, shards=2)
+    foreign = ids_of_shard(1, 2, 2)
+    queue.put(foreign, 0)
+    SQLiteWorkQueue(path, shards=2).claim("peer", 1, 0)  # shard 1的worker还活着
+    assert queue.claim("w0", 0, 10, abandoned=60) == []
+    time.sleep(0.01)
+    assert sorted(paperId for paperId, _ in queue.claim("w0", 0, 10, abandoned=0.001)) == sorted(foreign)
+
+
+def test_worker_crawls_all_shards_and_takes_over_dead_peer(tmp_path, graph):
+    path = os.path.join(tmp_path, "queue.sqlite3")
+    seeds = graph.most_cited(2)
+    summarizers = [RecordingSummarizer(), RecordingSummarizer()]
+    workers = [DistributedWorker(GraphCrawler(graph, summarizers[shard], seeds), SQLiteWorkQueue(path, shards=2), shard, poll=0.01)
+               for shard in range(2)]
+
+    async def crawl():
+        return await asyncio.gather(*[worker.run(1) for worker in workers])
+    asyncio.run(crawl())
+    written = set(summarizers[0].papers) | set(summarizers[1].papers)
+    assert set(summarizers[0].papers).isdisjoint(summarizers[1].papers)
+    expected = set(seeds)
+    for paperId in seeds:
+        i = graph.index[paperId]
+        expected |= {graph.papers[j]["paperId"] for j in graph.references[i] + graph.citations[i]}
+    assert written == expected
+
+    # shard 1的worker挂了：它领取的论文超时后放回队列，shard 0的worker最终接手
+    path = os.path.join(tmp_path, "dead.sqlite3")
+    queue = SQLiteWorkQueue(path, shards=2)
+    queue.put(seeds, 0)
+    queue.claim("dead", 1, 10)
+    summarizer = RecordingSummarizer()
+    worker = DistributedWorker(GraphCrawler(graph, summarizer, []), SQLiteWorkQueue(path, shards=2), 0,
+                               poll=0.01, stale_timeout=0.05)
+    asyncio.run(asyncio.wait_for(worker.run(0), 10))
+    assert set(seeds) <= set(summarizer.papers)
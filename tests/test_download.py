@@ -0,0 +1,58 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from citation_crawler.crawlers import common
+from citation_crawler.crawlers.common import download_item, flush_cache, negative_cache
+
+
+def write(root: str, path: str, text: str) -> str:
+    save_path = os.path.join(root, path)
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+    with open(save_path, 'w') as f:
+        f.write(text)
+    return save_path
+
+
+def test_cache_hit(cache):
+    write(cache, "test/item--a/x.json", json.dumps({"x": 1}))
+    assert asyncio.run(download_item("http://127.0.0.1:1/x", "test/item--a/x.json", -1, None, json.loads)) == {"x": 1}
+
+
+def test_decode_bug_keeps_cache(cache):
+    save_path = write(cache, "test/item--a/x.json", json.dumps({"x": 1}))
+
+    def decode(text):
+        raise RuntimeError("bug in filtering code")
+    with pytest.raises(RuntimeError):
+        asyncio.run(download_item("http://127.0.0.1:1/x", "test/item--a/x.json", -1, None, decode))
+    assert os.path.isfile(save_path)  # 有效的缓存不会被删除
+    assert negative_cache.get("test/item--a/x.json") is None
+
+
+def test_invalid_cache_is_removed(cache):
+    save_path = write(cache, "test/item--a/x.json", "{not json")
+
+    async def download():
+        data = await download_item("http://127.0.0.1:1/x", "test/item--a/x.json", -1, None, json.loads)
+        await flush_cache()
+        return data
+    assert asyncio.run(download()) is None  # 无效缓存被删除后下载也失败
+    assert not os.path.isfile(save_path)
+    assert negative_cache.get("test/item--a/x.json") is None  # 连接失败不记录
+
+
+def test_invalid_response_is_negative_cached(api):
+    from citation_crawler.crawlers.ss import root_paper
+
+    def decode(text):
+        raise ValueError("invalid")
+
+    async def download():
+        data = await download_item(api.root + "/paper/xxx", os.path.join(root_paper, "xxx.json"), -1, None, decode)
+        await flush_cache()
+        return data
+    assert asyncio.run(download()) is None
+    assert negative_cache.get(os.path.join(root_paper, "xxx.json")) in ("invalid", "not_found")
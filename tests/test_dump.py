@@ -0,0 +1,72 @@
+import asyncio
+import os
+
+from citation_crawler.bench.graph import SyntheticGraph
+from citation_crawler.crawlers.dump import build_index, open_shared_dump, DumpPaper, SemanticScholarDump
+from citation_crawler.store import PaperStore
+
+
+def test_build_index_with_small_chunks(tmp_path):
+    graph = SyntheticGraph(size=300, seed=1)
+    dump_dir, index_dir = os.path.join(tmp_path, "dump"), os.path.join(tmp_path, "index")
+    graph.write_dump(dump_dir, files=3)
+    counts = build_index(dump_dir, index_dir, chunk=16)  # 每个表都要分很多块排序再归并
+
+    assert counts["papers"] == len(graph)
+    assert counts["paperIds"] == len(graph)
+    assert counts["dois"] == len(graph)
+    assert counts["references"] == sum(len(refs) for refs in graph.references)
+    assert counts["citations"] == counts["references"]
+    assert counts["authors"] == len(graph.authors)
+    assert counts["author_papers"] == sum(len(papers) for papers in graph.author_papers.values())
+    assert not any(name.startswith("tmp") for name in os.listdir(index_dir))
+
+    dump = SemanticScholarDump(index_dir)
+    try:
+        for i, paper in enumerate(graph.papers):
+            corpusId = dump.get_corpusId(paper["paperId"])
+            assert corpusId == i + 1
+            assert dump.get_corpusId(f"DOI:{paper['externalIds']['DOI']}") == corpusId
+            data = dump.get_paper_data(corpusId)
+            assert data["paperId"] == paper["paperId"]
+            assert data["title"] == paper["title"]
+            assert sorted(d["paperId"] for d in dump.get_references_data(corpusId)) == \
+                sorted(graph.papers[j]["paperId"] for j in graph.references[i])
+            assert sorted(d["paperId"] for d in dump.get_citations_data(corpusId)) == \
+                sorted(graph.papers[j]["paperId"] for j in graph.citations[i])
+        for author in graph.authors:
+            assert dump.get_author_data(author["authorId"])["name"] == author["name"]
+            assert sorted(d["paperId"] for d in dump.get_author_papers_data(author["authorId"])) == \
+                sorted(graph.papers[i]["paperId"] for i in graph.author_papers[author["authorId"]])
+        assert dump.get_corpusId("0" * 40) is None
+        assert dump.get_corpusId("DOI:10.0000/missing") is None
+        assert dump.get_corpusId("CorpusId:abc") is None
+    finally:
+        dump.close()
+
+
+def test_spill_dump_papers(tmp_path):
+    graph = SyntheticGraph(size=50, seed=2)
+    dump_dir, index_dir = os.path.join(tmp_path, "dump"), os.path.join(tmp_path, "index")
+    graph.write_dump(dump_dir)
+    build_index(dump_dir, index_dir)
+    dump = open_shared_dump(index_dir)
+    store = PaperStore(max_papers=10, path=os.path.join(tmp_path, "papers.sqlite"), batch=5)
+    try:
+        for paper in graph.papers:
+            store[paper["paperId"]] = DumpPaper(dump.get_paper_data(dump.get_corpusId(paper["paperId"])), dump)
+            store.mark_written(paper["paperId"])
+        assert store.spilled == len(graph) - 10  # 持有mmap的DumpPaper也能移到磁盘
+
+        paperId = graph.papers[0]["paperId"]
+        paper = store[paperId]
+        assert paper.dump is dump  # 读回时共用已打开的索引
+        assert paper.title() == graph.papers[0]["title"]
+        assert store[paperId] is paper  # 最近读回的是同一个对象
+        assert len(asyncio.run(collect(paper.get_citations()))) == len(graph.citations[0])
+    finally:
+        store.close()
+
+
+async def collect(papers):
+    return [paper async for paper in papers]
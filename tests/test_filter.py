@@ -0,0 +1,31 @@
+from dblp_crawler.keyword import Keywords
+
+from citation_crawler.filter import YearKeywordFilter
+
+
+def make_filter(max_cache: int = 1000000) -> YearKeywordFilter:
+    keywords = Keywords()
+    keywords.add_rule("video")
+    return YearKeywordFilter(2000, keywords, max_cache=max_cache)
+
+
+def test_match_records():
+    f = make_filter(max_cache=3)
+    records = [{'paperId': str(i), 'title': title, 'year': year} for i, (title, year) in enumerate([
+        ("Video coding", 2010), ("Image coding", 2010), ("Video coding", 1990), ("video", None)])]
+    assert f.match_records(records) == [True, False, False, True]
+    assert f.match_records(records[:2]) == [True, False]  # 超过max_cache清空后重新匹配
+
+
+def test_match_records_concurrent_clear():
+    f = make_filter()
+    match_batch = f.match_batch
+
+    def clearing_match_batch(titles, years):
+        verdicts = match_batch(titles, years)
+        f.verdicts.clear()  # 模拟另一个线程在此时清空缓存
+        return verdicts
+    f.match_records([{'paperId': "a", 'title': "Video", 'year': 2010}])
+    f.match_batch = clearing_match_batch
+    records = [{'paperId': "a", 'title': "Video", 'year': 2010}, {'paperId': "b", 'title': "Image", 'year': 2010}]
+    assert f.match_records(records) == [True, False]
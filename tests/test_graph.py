@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from citation_crawler.graph import PaperIndex
+from citation_crawler.crawlers.ss import SSPaper, normalize_paper
+
+from conftest import GraphCrawler, RecordingSummarizer
+
+
+def make_paper(paperId: str, title: str, doi=None) -> SSPaper:
+    data = {"paperId": paperId, "title": title, "externalIds": {}}
+    if doi:
+        data["externalIds"]["DOI"] = doi
+    return SSPaper(normalize_paper(data))
+
+
+def test_title_merge_requires_same_doi():
+    index = PaperIndex()
+    assert index.add(make_paper("a", "Video Coding")) == "a"
+    assert index.add(make_paper("b", "Video coding.")) == "a"  # 都没有DOI，按标题合并
+    assert index.add(make_paper("c", "Video Coding", "10.1/x")) == "c"  # 一边有DOI不合并
+    assert index.add(make_paper("d", "Video Coding", "10.1/X")) == "c"  # DOI相同
+    assert index.add(make_paper("e", "Video Coding", "10.1/y")) == "e"  # DOI不同
+    assert index.find_id("DOI:10.1/y") == "e"
+
+
+def test_dedup_counted_once(graph):
+    crawler = GraphCrawler(graph, RecordingSummarizer(), [])
+    assert crawler._merge_paper(make_paper("a", "Video Coding"), "reference") == "a"
+    assert crawler.dedup_saved == 0
+    for _ in range(3):  # 同一个别名重复出现只算一次
+        assert crawler._merge_paper(make_paper("b", "Video Coding"), "reference") == "a"
+    assert crawler.dedup_saved == 1
+
+
+def test_init_papers_cancels_on_error(graph):
+    class FailingCrawler(GraphCrawler):
+        async def get_paper(self, paperId):
+            if paperId == "fail":
+                raise RuntimeError("fail")
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(paperId)
+                raise
+
+    cancelled = []
+    seeds = [graph.papers[i]["paperId"] for i in range(3)]
+    crawler = FailingCrawler(graph, RecordingSummarizer(), seeds + ["fail"])
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            async for _ in crawler._init_papers():
+                pass
+        assert sorted(cancelled) == sorted(seeds)  # 抛出异常前其他任务已经取消并结束
+    asyncio.run(run())
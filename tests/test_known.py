@@ -0,0 +1,74 @@
+import asyncio
+import random
+
+from citation_crawler.bench.neo4j import FakeAsyncSession
+from citation_crawler.summarizers.known import KnownSet, pair_key
+from citation_crawler.summarizers.neo4j import Neo4jSummarizer
+
+
+def test_known_set_grows_past_capacity():
+    rand = random.Random(0)
+    known = KnownSet(max_exact=100, bloom_capacity=1000, error_rate=1e-3)
+    keys = [rand.getrandbits(128) for _ in range(10000)]
+    for key in keys:
+        known.add(key)
+    assert len(known.blooms) >= 3  # 装满后加了更大的Bloom filter
+    assert all(key in known for key in keys)
+    false_positives = sum(rand.getrandbits(128) in known for _ in range(20000))
+    assert false_positives <= 20000 * 1e-3 * 2
+
+
+class Record:
+    def __init__(self, *values) -> None:
+        self._values = values
+
+    def values(self):
+        return list(self._values)
+
+
+class PrewarmSession(FakeAsyncSession):
+    """session.run按查询返回数据库中已有的CITE和WRITE"""
+
+    def __init__(self, cites, writes) -> None:
+        super().__init__()
+        self.cites, self.writes = cites, writes
+
+    async def run(self, query: str, *args, **kwargs):
+        async def records():
+            for values in (self.writes if ":WRITE]" in query else self.cites):
+                yield Record(*values)
+        return records()
+
+
+class Summarizer(Neo4jSummarizer):
+    async def filter_papers(self, papers):
+        async for paper in papers:
+            yield paper
+
+
+class Paper:
+    def __init__(self, title_hash: str) -> None:
+        self._title_hash = title_hash
+
+    def title_hash(self) -> str:
+        return self._title_hash
+
+
+def test_prewarm_links():
+    session = PrewarmSession(
+        [("a", "b")],
+        [("a", {"authorId": "1", "name": "Alice", "homepage": "h"}), ("b", {"dblp_pid": "p", "authorId": "2"})])
+    summarizer = Summarizer(session)
+
+    async def run():
+        assert await summarizer.prewarm() == 3
+        assert pair_key("a", "b") in summarizer.known_edges
+        await summarizer.write_author(Paper("a"), {"authorId": "1"}, {"homepage": "h"}, None)  # 已写入
+        await summarizer.write_author(Paper("b"), {"dblp_pid": "p"}, {"authorId": "2"}, None)  # 已写入
+        assert session.stats["writes"] == 0
+        await summarizer.write_author(Paper("a"), {"authorId": "1"}, {"homepage": "h2"}, None)  # 属性不同
+        await summarizer.write_author(Paper("b"), {"authorId": "1"}, {}, None)  # 没有这个WRITE
+        assert session.stats["writes"] == 2
+        await summarizer.write_author(Paper("b"), {"authorId": "1"}, {}, None)
+        assert session.stats["writes"] == 2
+    asyncio.run(run())
@@ -0,0 +1,81 @@
+import asyncio
+import json
+import os
+import time
+
+import aiohttp
+
+from citation_crawler.crawlers import common
+from citation_crawler.crawlers.common import HTTPStatusError, NegativeCache, flush_cache, negative_cache
+from citation_crawler.crawlers.ss import get_paper, root_paper
+
+
+def test_kinds():
+    assert NegativeCache.kind_of(HTTPStatusError(404, "")) == "not_found"
+    assert NegativeCache.kind_of(HTTPStatusError(410, "")) == "not_found"
+    assert NegativeCache.kind_of(HTTPStatusError(503, "")) == "server_error"
+    assert NegativeCache.kind_of(HTTPStatusError(429, "")) is None  # 限流与条目本身无关
+    assert NegativeCache.kind_of(HTTPStatusError(403, "")) is None
+    assert NegativeCache.kind_of(asyncio.TimeoutError()) == "timeout"
+    assert NegativeCache.kind_of(aiohttp.ClientConnectionError()) is None
+    assert NegativeCache.kind_of(ValueError()) == "invalid"
+
+
+def test_ttl(cache, monkeypatch):
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+    negative = NegativeCache(permanent_days=1, transient_days=0.5)
+
+    async def add():
+        await negative.add("test/item--a/x.json", "not_found", 404)
+        await negative.add("test/item--a/y.json", "timeout")
+        await flush_cache()
+    asyncio.run(add())
+    assert negative.get("test/item--a/x.json") == "not_found"
+    assert negative.get("test/item--a/y.json") == "timeout"
+    assert negative.get("test/item--a/z.json") is None
+
+    now += 0.6 * 86400
+    assert negative.get("test/item--a/x.json") == "not_found"
+    assert not negative.skip("test/item--a/y.json")  # 暂时失败先过期
+    now += 0.5 * 86400
+    assert negative.get("test/item--a/x.json") is None
+
+    now -= 1.1 * 86400
+    reloaded = NegativeCache(permanent_days=1, transient_days=0.5)  # 从.fail文件读回
+    assert reloaded.get("test/item--a/x.json") == "not_found"
+    assert NegativeCache(permanent_days=-1).get("test/item--a/x.json") is None  # 小于0时不使用
+    negative.remove("test/item--a/x.json")
+    assert not os.path.exists(os.path.join(cache, "test/item--a/x.json.fail"))
+    assert negative.get("test/item--a/x.json") is None
+
+
+async def get_and_flush(paperId: str):
+    paper = await get_paper(paperId)
+    await flush_cache()
+    return paper
+
+
+def test_not_found_is_not_requested_again(api):
+    assert asyncio.run(get_and_flush("0" * 40)) is None
+    assert negative_cache.get(os.path.join(root_paper, "0" * 40 + ".json")) == "not_found"
+    assert asyncio.run(get_and_flush("0" * 40)) is None
+    assert api.stats["paper"] == 1
+
+
+def test_mismatch_evicts_cache(graph, api, monkeypatch):
+    paperId = graph.papers[0]["paperId"].lower()
+    path = os.path.join(root_paper, paperId + ".json")
+    save_path = os.path.join(common.cache_root, path)
+    os.makedirs(os.path.dirname(save_path))
+    with open(save_path, "w") as f:
+        json.dump(graph.papers[1], f)  # 缓存的是另一篇论文
+    assert asyncio.run(get_and_flush(paperId)) is None
+    assert negative_cache.get(path) == "mismatch"
+    assert not os.path.exists(save_path)
+    assert asyncio.run(get_and_flush(paperId)) is None  # 有效期内不再请求
+    assert api.stats["paper"] == 0
+
+    monkeypatch.setattr(negative_cache, "permanent_days", 0)  # 有效期过后重新请求，而不是又读到之前的缓存
+    assert asyncio.run(get_and_flush(paperId)).paperId() == graph.papers[0]["paperId"]
+    assert api.stats["paper"] == 1
@@ -0,0 +1,59 @@
+import asyncio
+
+import networkx as nx
+
+from citation_crawler.search import PathSearch
+
+from conftest import GraphCrawler, RecordingSummarizer
+
+
+def citation_graph(graph) -> nx.DiGraph:
+    """论文i到它引用的论文j的边"""
+    g = nx.DiGraph()
+    g.add_nodes_from(range(len(graph.papers)))
+    g.add_edges_from((i, j) for i, refs in enumerate(graph.references) for j in refs)
+    return g
+
+
+def shortest_path_edges(graph, source: int, target: int):
+    paths = list(nx.all_shortest_paths(citation_graph(graph), source, target))
+    ids = [p["paperId"] for p in graph.papers]
+    return set((ids[a], ids[b]) for path in paths for a, b in zip(path, path[1:])), len(paths[0]) - 1
+
+
+def find_pair(graph, min_length: int):
+    """找一对最短路径长度至少为min_length的论文"""
+    for source, lengths in nx.all_pairs_shortest_path_length(citation_graph(graph)):
+        for target, length in lengths.items():
+            if length >= min_length:
+                return source, target
+
+
+def test_shortest_paths(graph):
+    source, target = find_pair(graph, 3)
+    edges, length = shortest_path_edges(graph, source, target)
+    summarizer = RecordingSummarizer()
+    crawler = GraphCrawler(graph, summarizer, [])
+    search = PathSearch(crawler, graph.papers[source]["paperId"], graph.papers[target]["paperId"])
+    assert asyncio.run(search.run()) == edges
+    assert summarizer.references == edges
+    assert set(summarizer.papers) == set(p for edge in edges for p in edge)
+    assert sum(search.depths) == length  # 两侧相遇后就停止
+    assert search.expanded < len(graph.papers)  # 不需要完整的BFS
+
+
+def test_no_path(graph):
+    g = citation_graph(graph)
+    target = next(i for i in g if len(graph.references[i]) > 0)
+    source = next(i for i in g if not nx.has_path(g, i, target))  # 例如target引用的论文
+    summarizer = RecordingSummarizer()
+    crawler = GraphCrawler(graph, summarizer, [])
+    search = PathSearch(crawler, graph.papers[source]["paperId"], graph.papers[target]["paperId"], max_depth=4)
+    assert asyncio.run(search.run()) == set()
+    assert summarizer.references == set()
+    assert sum(search.depths) <= 4
+
+
+def test_unknown_paper(graph):
+    crawler = GraphCrawler(graph, RecordingSummarizer(), [])
+    assert asyncio.run(PathSearch(crawler, "0" * 40, graph.papers[0]["paperId"]).search()) == set()
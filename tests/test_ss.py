@@ -0,0 +1,42 @@
+import asyncio
+
+from citation_crawler.crawlers import SemanticScholarCrawler
+from citation_crawler.crawlers.common import flush_cache
+from citation_crawler.crawlers.ss import SSPaper, normalize_paper
+
+from conftest import RecordingSummarizer
+
+
+def test_authors_fallback_when_batch_misses(graph, api):
+    data = graph.papers[0]
+    authorId = data["authors"][0]["authorId"]
+    graph.authors = [a for a in graph.authors if a["authorId"] != authorId]  # /author/batch对这个作者返回null
+    paper = SSPaper(normalize_paper({**data, "authors": [{"authorId": a["authorId"], "name": a["name"]}
+                                                         for a in data["authors"]]}))
+
+    async def authors():
+        result = [author async for author in paper.authors()]
+        await flush_cache()
+        return result
+    authors = asyncio.run(authors())
+    assert [a.authorId() for a in authors] == [a["authorId"] for a in data["authors"]]
+    assert all(a.dblp_name() for a in authors)  # 从/paper/{paperId}/authors补全了详情
+    assert api.stats["author_batch"] == 1 and api.stats["authors"] == 1
+
+
+def test_seed_papers_released(graph, api):
+    class Crawler(SemanticScholarCrawler):
+        async def filter_papers(self, papers):
+            async for paper in papers:
+                yield paper
+
+    authorId = graph.authors[0]["authorId"]
+    paperIds = [graph.papers[i]["paperId"] for i in graph.author_papers[authorId]]
+    crawler = Crawler([authorId], RecordingSummarizer(), paperIds[:1])  # 同一篇论文既是初始论文又是作者的论文
+
+    async def init():
+        async for _ in crawler._init_papers():
+            pass
+        await flush_cache()
+    asyncio.run(init())
+    assert crawler.seed_papers == {}  # 已经作为初始论文fetch过的作者论文也要释放
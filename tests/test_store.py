@@ -0,0 +1,63 @@
+import asyncio
+import random
+
+from citation_crawler.store import IdMap, IdSet
+
+from conftest import GraphCrawler, RecordingSummarizer
+
+
+def test_id_map_like_dict():
+    rand = random.Random(1)
+    ids, expected = IdMap("test", max_items=8), {}
+    try:
+        for _ in range(2000):
+            key, op = "k%d" % rand.randrange(50), rand.random()
+            if op < 0.5:
+                value = rand.choice([None, "v%d" % rand.randrange(10)])
+                ids[key], expected[key] = value, value
+            elif op < 0.6:
+                assert ids.pop(key, "missing") == expected.pop(key, "missing")
+            else:
+                assert ids.setdefault(key, "d") == expected.setdefault(key, "d")
+            assert (key in ids) == (key in expected)
+        assert ids.spilled > 0 and len(ids.hot) <= 8
+        assert dict(ids.items()) == expected
+        assert len(ids) == len(expected)
+    finally:
+        ids.close()
+
+
+def test_id_set():
+    ids = IdSet("test", max_items=2)
+    for i in range(10):
+        ids.add(str(i))
+    ids.add("0")
+    ids.discard("1")
+    assert set(ids) == set(str(i) for i in range(10)) - {"1"} and len(ids) == 9
+    assert "0" in ids and "1" not in ids and ids.ids.spilled > 0
+
+
+def crawl(graph, seeds, levels: int):
+    summarizer = RecordingSummarizer()
+    crawler = GraphCrawler(graph, summarizer, seeds)
+
+    async def run():
+        for _ in range(levels):
+            await crawler.bfs_once()
+    asyncio.run(run())
+    return crawler, summarizer
+
+
+def test_crawler_spill_reload_rewrite(graph, monkeypatch):
+    seeds = graph.most_cited(2)
+    _, expected = crawl(graph, seeds, 4)
+    assert len(expected.papers) > 32
+    monkeypatch.setenv("CITATION_CRAWLER_MAX_PAPERS_IN_MEMORY", "16")
+    crawler, summarizer = crawl(graph, seeds, 4)
+    assert crawler.papers.spilled > 0 and len(crawler.papers.loaded) > 0  # 写入引用时读回了移到磁盘的论文
+    assert crawler.fetched.ids.spilled > 0 and crawler.index.index.spilled > 0
+    assert max(crawler.calls.values()) == 1  # 移到磁盘的论文不会被重新fetch
+    assert set(summarizer.papers) == set(expected.papers)
+    assert summarizer.references == expected.references
+    for paperId, refs in crawler.ref_idx.references.items():  # 只剩下一端还在frontier上的引用
+        assert all(paperId not in crawler.fetched or referenceId not in crawler.fetched for referenceId in refs)